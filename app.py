@@ -1,12 +1,32 @@
 # Import libraries
+import time
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import io
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-import openpyxl
+from pathlib import Path
+from sales_anomalies import SalesAnomalies, find_anomalies, series_label
+from sales_backends import DEFAULT_BACKEND, available_backends, get_backend
+from sales_baskets import BASKET_COLUMNS, DEFAULT_MIN_SUPPORT, BasketPairs
+from sales_charts import (
+    DEFAULT_POINT_BUDGET, category_pie_frame, density_grid, downsample_line, histogram_frame, is_continuous,
+    loyalty_region_frame, sample_points,
+)
+from sales_compare import (
+    PREVIOUS_PERIODS, SALES_OVER_TIME_TITLE, SUMMARY_TITLE, compare_periods, overlay_sales, previous_period, range_label,
+    side_labels,
+)
+from sales_cube import AGGREGATIONS, DEFAULT_TOP_VALUES, SalesCube, value_column
+from sales_customers import CustomerAnalytics
+from sales_engine import SalesDataError, build_full_date, build_summary_df, compute_metrics
+from sales_filters import FilterIndex
+from sales_jobs import JobCancelled, JobManager, aggregate_file, analyse_dataset, build_excel, build_pdf
+from sales_parallel import combine_partials
+from sales_profiling import DEFAULT_PROFILE_LOG, RunProfile, activate, append_to_log, profile_stage, profiled, run_profiled
+from sales_reports import build_breakdowns, generate_csv
+from sales_rollups import GRANULARITIES, ROLLUP_DIMENSIONS, RollupStore, period_start, rollup_totals, sales_over_time
+from sales_sketches import SketchSettings
+from sales_store import DatasetStore, content_hash
+from sales_validation import DEFAULT_SAMPLE_ROWS, drop_rows
 
 # Initialize session state for page navigation
 if 'page' not in st.session_state:
@@ -225,101 +245,444 @@ st.markdown("""
 # Define the correct password
 correct_password = "Letmein"
 
-# Function to generate PDF
-def generate_pdf(summary_df, filename="data_analysis_report.pdf"):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    c.setFont("Courier", 12)
-    y = 750
-    for index, row in summary_df.iterrows():
-        text = f"{row['METRIC']}: {row['VALUE']}"
-        c.drawString(50, y, text)
-        y -= 20
-        if y < 50:
-            c.showPage()
-            y = 750
-    c.save()
-    buffer.seek(0)
-    return buffer
-
-# Function to analyse the sales data
-def analyse_sales(data):
-    try:
-        data['Day_Month'] = data['Day_Month'].astype(str)
-        data['Year'] = data['Year'].astype(str)
-        data['Full_Date'] = pd.to_datetime(data['Day_Month'] + '/' + data['Year'], format='%d/%m/%Y', errors='coerce')
-        if data['Full_Date'].isnull().all():
-            st.error("DATE COLUMN ISSUE: All 'Day_Month/Year' values are invalid—check your CSV format.")
-            return None
-    except KeyError as e:
-        st.error(f"DATE COLUMN ISSUE: Missing 'Day_Month' or 'Year' column - {e}")
+# Maximum number of uploaded files kept parsed and analysed in memory (least recently used are dropped)
+ANALYSIS_CACHE_ENTRIES = 5
+
+# Store of ingested datasets, shared by every session
+@st.cache_resource
+def get_dataset_store():
+    return DatasetStore()
+
+# Rollups of the sales history, shared by every session
+@st.cache_resource
+def get_rollup_store():
+    return RollupStore()
+
+# Pool of background workers shared by every session
+# Parsing, aggregation and report building run there, at most SALES_MAX_JOBS jobs at once.
+@st.cache_resource
+def get_job_manager():
+    return JobManager()
+
+# Seconds between progress updates while waiting for background jobs
+JOB_POLL_SECONDS = 0.25
+
+# Function to describe a job's progress as the value and text of its progress bar
+def job_status(label, job, jobs):
+    if job.done():
+        return 1.0, f"{label}: DONE"
+    progress = job.progress()
+    if progress is None:
+        return 0.0, f"{label}: WAITING FOR A FREE WORKER ({jobs.active_jobs()} JOBS QUEUED OR RUNNING, {jobs.max_jobs} AT A TIME)"
+    rows = f" - {progress.done:,} OF {progress.total:,} ROWS" if progress.total else ""
+    return progress.fraction, f"{label}: {progress.stage}{rows}"
+
+# Function to run background jobs and wait for them, with a live progress bar per job and a button to cancel them
+# requests are (label, job key, function, args). Sessions asking for the same key share one job.
+# Returns the jobs' results in order, or None once this session cancelled them.
+def run_jobs(requests):
+    jobs = get_job_manager()
+    keys = [key for _, key, _, _ in requests]
+    cancelled = st.session_state.setdefault('cancelled_jobs', set())
+    if any(key in cancelled for key in keys):
+        st.warning("ANALYSIS CANCELLED.")
+        if st.button("RESTART ANALYSIS"):
+            cancelled.difference_update(keys)
+            st.rerun()
         return None
-    except Exception as e:
-        st.error(f"DATE COLUMN ISSUE: {e}")
+    submitted = [jobs.submit(key, function, *args) for _, key, function, args in requests]
+    if not all(job.done() for job in submitted):
+        st.session_state.analysis_cache_hit = False
+        # The page keeps responding while the jobs run: any click reruns the script, which picks the jobs up again
+        placeholder = st.empty()
+        with placeholder.container():
+            bars = [st.progress(0.0) for _ in requests]
+            if st.button("CANCEL ANALYSIS"):
+                for key in keys:
+                    jobs.cancel(key)
+                cancelled.update(keys)
+                st.rerun()
+            while True:
+                for index, (label, key, function, args) in enumerate(requests):
+                    # A job cancelled by another session sharing it is started again
+                    if submitted[index].state == 'CANCELLED':
+                        submitted[index] = jobs.submit(key, function, *args)
+                    value, text = job_status(label, submitted[index], jobs)
+                    bars[index].progress(value, text=text)
+                if all(job.done() for job in submitted):
+                    break
+                time.sleep(JOB_POLL_SECONDS)
+        placeholder.empty()
+    return [job.result() for job in submitted]
+
+# Function to load a stored dataset's rows for the charts and filters, once per dataset
+# The cached rows are shared between reruns and sessions, so they must not be modified.
+@st.cache_resource(max_entries=ANALYSIS_CACHE_ENTRIES, show_spinner="LOADING ROWS...")
+def load_rows(dataset_key):
+    with profile_stage('LOAD DATASET') as stage:
+        data = get_dataset_store().load(dataset_key)
+        stage.rows = len(data)
+    with profile_stage('FULL DATE', len(data)):
+        build_full_date(data)
+    return data
+
+# Function to leave a dataset's invalid rows out of its loaded rows, once per dataset
+@st.cache_resource(max_entries=ANALYSIS_CACHE_ENTRIES, show_spinner="DROPPING INVALID ROWS...")
+def valid_rows(dataset_key, _data, _invalid_rows):
+    return drop_rows(_data, _invalid_rows)
+
+# Function to analyse one file in a background job (source is a path or upload bytes, None for a stored dataset)
+# dataset_id identifies the content (the dataset key of a stored dataset). Returns the dataset key, the rows,
+# the metrics and the data-quality report, or None once cancelled. In streaming mode no row-level data is kept
+# (data is None). estimate_error switches on approximate mode with that error bound (e.g. 0.01 for ±1%);
+# drop_invalid leaves the rows failing a data-quality check out of the analysis and the rows.
+def analyse_one(name, source, dataset_id, streaming=False, estimate_error=None, backend=DEFAULT_BACKEND, drop_invalid=False):
+    sketch_settings = SketchSettings.for_error(estimate_error) if estimate_error else None
+    store = get_dataset_store()
+    args = (store, name, source, dataset_id if source is None else None, streaming, sketch_settings, backend, drop_invalid)
+    job_key = ('ANALYSE', content_id(dataset_id), streaming, estimate_error, backend, drop_invalid)
+    with profile_stage('ANALYSIS JOB'):
+        results = run_jobs([(name or "DATASET", job_key, analyse_dataset, args)])
+    if results is None:
+        return None
+    dataset_key, metrics, report = results[0]
+    data = None if streaming else load_rows(dataset_key)
+    if data is not None and report is not None and report.dropped and report.invalid:
+        data = valid_rows(dataset_key, data, report.invalid_rows)
+    return dataset_key, data, metrics, report
+
+# Function to merge the files' partial aggregates once per set of files
+@st.cache_resource(max_entries=ANALYSIS_CACHE_ENTRIES, show_spinner="COMBINING FILES...")
+def combine_files(source_ids, estimate_error, backend, _partials):
+    sketch_settings = SketchSettings.for_error(estimate_error) if estimate_error else None
+    return combine_partials(_partials, sketch_settings)
+
+# Function to analyse several files as one dataset, each file aggregated by its own background job
+# source_ids identifies the files' content. Returns the combined metrics and the per-file breakdown
+# (no row-level data is kept), or None once cancelled.
+def analyse_many(source_ids, sources, estimate_error=None, backend=DEFAULT_BACKEND):
+    # Backends without an approximate mode give exact partials
+    if not get_backend(backend).supports_estimates:
+        estimate_error = None
+    sketch_settings = SketchSettings.for_error(estimate_error) if estimate_error else None
+    store = get_dataset_store()
+    requests = [
+        (name, ('AGGREGATE FILE', content_id(source_id), estimate_error, backend), aggregate_file, (store, name, source, sketch_settings, backend))
+        for (name, source), source_id in zip(sources, source_ids)
+    ]
+    with profile_stage('ANALYSIS JOBS', len(sources)):
+        results = run_jobs(requests)
+    if results is None:
         return None
+    partials = [(name, key, accumulator) for (name, _), (key, accumulator) in zip(sources, results)]
+    return combine_files(source_ids, estimate_error, backend, partials)
+
+# Filtered subsets kept analysed in memory (least recently used are dropped)
+FILTER_CACHE_ENTRIES = 10
+
+# Function to index the rows of an analysed file for the sidebar filters, once per analysis
+@st.cache_resource(max_entries=ANALYSIS_CACHE_ENTRIES, show_spinner="INDEXING ROWS FOR FILTERING...")
+def filter_index(analysis_key, _data):
+    return FilterIndex(_data)
+
+# Function to analyse the rows matching the filters, once per analysis and filter combination
+# The rows are picked with the filter index, so only the matching rows are read and analysed.
+@st.cache_resource(max_entries=FILTER_CACHE_ENTRIES, show_spinner="ANALYSING FILTERED ROWS...")
+def analyse_filtered(analysis_key, filters, _data, _index, estimate_error=None):
+    with profile_stage('SELECT ROWS') as stage:
+        rows = _index.select(*filters)
+        stage.rows = len(rows)
+    if len(rows) == 0:
+        raise SalesDataError("NO ROWS MATCH THE SELECTED FILTERS.")
+    subset = _data.take(rows).reset_index(drop=True)
+    sketch_settings = SketchSettings.for_error(estimate_error) if estimate_error else None
+    return subset, compute_metrics(subset, sketch_settings)
+
+# Function to draw the sidebar filters and return the chosen ones ((start, end) or None, ((column, labels), ...)),
+# or None when every row is kept
+def filter_controls(index):
+    st.sidebar.write("### FILTERS")
+    first, last = index.date_bounds()
+    date_range = None
+    if first is not None:
+        chosen_dates = st.sidebar.date_input("DATE RANGE", value=(first, last), min_value=first, max_value=last, format="DD/MM/YYYY")
+        # While a range is being picked only its start is set
+        if len(chosen_dates) == 2 and tuple(chosen_dates) != (first, last):
+            date_range = tuple(chosen_dates)
+    selections = []
+    for column in index.columns:
+        chosen = st.sidebar.multiselect(column.replace('_', ' ').upper(), index.labels[column], placeholder="ALL")
+        if chosen:
+            selections.append((column, tuple(chosen)))
+    if date_range is None and not selections:
+        return None
+    return date_range, tuple(selections)
+
+# Function to list the (name, source) pairs of the uploads or of every CSV in a directory
+def collect_sources(uploaded_files, directory):
+    if uploaded_files:
+        return [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    if directory:
+        return [(path.name, str(path)) for path in sorted(Path(directory).glob('*.csv'))]
+    return []
+
+# Function to identify sources cheaply: content hash for uploads, path, size and modification time for files
+def source_ids(sources):
+    ids = []
+    for name, source in sources:
+        if isinstance(source, bytes):
+            ids.append((name, content_hash(source)))
+        else:
+            stat = Path(source).stat()
+            ids.append((source, stat.st_size, stat.st_mtime_ns))
+    return tuple(ids)
+
+# Function to key a background job on a source's content alone: an upload's hash, whatever its file name
+# (the name is only a label, so the same bytes uploaded under two names share one job)
+def content_id(source_id):
+    if isinstance(source_id, tuple) and len(source_id) == 2:
+        return source_id[1]
+    return source_id
+
+# Charts drawn from row-level data, unavailable in streaming mode
+ROW_LEVEL_CHARTS = [
+    "SALES BY CATEGORY (PIE)",
+    "PURCHASE AMOUNT VS CUSTOMER AGE (SCATTER)",
+    "CUSTOMER AGE DISTRIBUTION (HISTOGRAM)",
+    "SALES BY LOYALTY STATUS (SUNBURST)",
+    "FREQUENTLY BOUGHT TOGETHER (BAR)",
+    "BUILD YOUR OWN CHART"
+]
+
+# Chart datasets are computed the first time a chart is shown and memoized per analysis,
+# so switching charts only prepares the data of the chart being switched to.
+# analysis_key identifies the analysed data; row-level data is passed as _data and not hashed.
+CHART_CACHE_ENTRIES = 50
+
+# Function to build the summary table once per analysis
+@profiled('SUMMARY TABLE')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner=False)
+def summary_table(analysis_key, _metrics):
+    return build_summary_df(_metrics)
+
+# Function to find the sales anomalies once per analysis (shown in the insights and added to the exports)
+@profiled('ANOMALIES')
+@st.cache_resource(max_entries=CHART_CACHE_ENTRIES, show_spinner="LOOKING FOR ANOMALIES...")
+def sales_anomalies(analysis_key, _metrics, _data):
+    return find_anomalies(_metrics, _data)
+
+# Function to build the report's breakdown tables once per analysis
+@profiled('BREAKDOWNS')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner=False)
+def report_breakdowns(analysis_key, _metrics, _data):
+    baskets = basket_pairs(analysis_key, _data) if _data is not None else None
+    return build_breakdowns(_metrics, _data, sales_anomalies(analysis_key, _metrics, _data), baskets)
+
+# Function to build the PDF report in a background job, called only when DOWNLOAD PDF is clicked
+# comparison is (comparison key, tables) from show_comparison; its tables come before the breakdowns.
+def pdf_report(analysis_key, summary_df, metrics, data, comparison=None):
+    comparison_key, comparison_tables = comparison or (None, {})
+    breakdowns = {**comparison_tables, **report_breakdowns(analysis_key, metrics, data)}
+    return get_job_manager().submit(('PDF', analysis_key, comparison_key), build_pdf, summary_df, breakdowns, metrics).result()
+
+# Function to build the Excel workbook in a background job, called only when DOWNLOAD EXCEL is clicked
+def excel_report(analysis_key, summary_df, metrics, data, include_rows, comparison=None):
+    comparison_key, comparison_tables = comparison or (None, {})
+    breakdowns = {**comparison_tables, **report_breakdowns(analysis_key, metrics, data)}
+    rows = data if include_rows else None
+    job_key = ('EXCEL', analysis_key, include_rows, comparison_key)
+    return get_job_manager().submit(job_key, build_excel, summary_df, breakdowns, rows).result()
+
+@profiled('CHART DATA')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner="PREPARING CHART...")
+def sales_over_time_data(analysis_key, _metrics, point_budget, granularity='DAY'):
+    sales = _metrics.sales_by_date
+    if granularity != 'DAY':
+        sales = sales.groupby(period_start(sales.index, granularity)).sum().rename_axis('Full_Date')
+    return downsample_line(sales.reset_index(), 'Full_Date', 'Purchase_Amount', point_budget)
+
+@profiled('CHART DATA')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner="PREPARING CHART...")
+def category_pie_data(analysis_key, _data):
+    return category_pie_frame(_data)
+
+@profiled('CHART DATA')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner="PREPARING CHART...")
+def loyalty_sunburst_data(analysis_key, _data):
+    return loyalty_region_frame(_data)
+
+@profiled('CHART DATA')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner="PREPARING CHART...")
+def histogram_data(analysis_key, _data, column, nbins, color=None):
+    return histogram_frame(_data, column, nbins, color)
+
+@profiled('CHART DATA')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner="PREPARING CHART...")
+def scatter_data(analysis_key, _data, columns, point_budget, color=None):
+    return sample_points(_data[list(columns)], point_budget, color)
+
+@profiled('CHART DATA')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner="PREPARING CHART...")
+def density_data(analysis_key, _data, x, y):
+    return density_grid(_data[x], _data[y])
 
-    total_sales = data['Purchase_Amount'].sum()
-    avg_spend = data['Purchase_Amount'].mean()
-    num_customers = data['Customer_ID'].nunique()
-    sales_per_customer = total_sales / num_customers
-    top_spender = data.loc[data['Purchase_Amount'].idxmax()]
-    total_quantity = data['Quantity'].sum()
-    popular_category = data['Product_Category'].mode()[0]
-    payment_breakdown = data['Payment_Method'].value_counts()
-    region_sales = data.groupby('Region')['Purchase_Amount'].sum().idxmax()
-    discount_usage = data['Discount_Applied'].value_counts(normalize=True) * 100
-    avg_age = data['Customer_Age'].mean()
-    gender_breakdown = data['Customer_Gender'].value_counts()
-    num_orders = data['Order_ID'].nunique()
-    time_breakdown = data['Transaction_Time'].value_counts()
-    avg_shipping = data['Shipping_Cost'].mean()
-    total_tax = data['Tax_Amount'].sum()
-    num_products = data['Product_ID'].nunique()
-    avg_unit_price = data['Unit_Price'].mean()
-    return_rate = (data['Return_Status'] == 'Yes').mean() * 100
-    loyalty_percentage = (data['Customer_Loyalty'] == 'Yes').mean() * 100
-    channel_breakdown = data['Order_Channel'].value_counts()
-    delivery_breakdown = data['Delivery_Method'].value_counts()
-    avg_rating = data['Customer_Rating'].mean()
-    source_breakdown = data['Purchase_Source'].value_counts()
+@profiled('CHART DATA')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner="PREPARING CHART...")
+def line_data(analysis_key, _data, columns, x, y, point_budget, color=None):
+    return downsample_line(_data[list(columns)], x, y, point_budget, color)
+
+# Function to build the aggregate cube of an analysed file, once per analysis (it keeps its recent results)
+@st.cache_resource(max_entries=ANALYSIS_CACHE_ENTRIES + FILTER_CACHE_ENTRIES, show_spinner=False)
+def sales_cube(analysis_key, _data):
+    return SalesCube(_data)
+
+@profiled('CHART DATA')
+def cube_data(analysis_key, _data, dimensions, measure, aggregation, top):
+    return sales_cube(analysis_key, _data).query(dimensions, measure, aggregation, top)
+
+@profiled('CHART DATA')
+def pivot_data(analysis_key, _data, rows, columns, measure, aggregation, top):
+    return sales_cube(analysis_key, _data).pivot(rows, columns, measure, aggregation, top)
+
+# Function to count the products bought together in each basket, once per analysis, basket and support
+# basket None picks orders when orders have several rows, customers otherwise.
+@profiled('BASKET PAIRS')
+@st.cache_resource(max_entries=CHART_CACHE_ENTRIES, show_spinner="COUNTING PRODUCTS BOUGHT TOGETHER...")
+def basket_pairs(analysis_key, _data, basket=None, min_support=DEFAULT_MIN_SUPPORT):
+    return BasketPairs(_data, basket, min_support)
+
+# Function to line up two analyses' metrics and breakdowns, once per pair of analyses
+# comparison_key identifies both sides; their metrics and rows are passed as _current/_previous and not hashed.
+@profiled('COMPARISON')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner="COMPARING PERIODS...")
+def period_comparison(comparison_key, labels, _current, _previous, _current_data, _previous_data):
+    return compare_periods(_current, _previous, labels, _current_data, _previous_data)
+
+@profiled('CHART DATA')
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner="PREPARING CHART...")
+def overlay_data(comparison_key, labels, _current, _previous, granularity):
+    return overlay_sales(_current.sales_by_date, _previous.sales_by_date, labels, granularity)
+
+# Function to set up the customer analytics of an analysed file, once per analysis (it keeps every table it builds)
+@st.cache_resource(max_entries=ANALYSIS_CACHE_ENTRIES + FILTER_CACHE_ENTRIES, show_spinner=False)
+def customer_analytics(analysis_key, _data):
+    return CustomerAnalytics(_data)
+
+# Custom Plotly layout with color
+PLOT_LAYOUT = dict(
+    plot_bgcolor='#000000',
+    paper_bgcolor='#000000',
+    font=dict(family="Courier New, monospace", color="#FFFFFF"),
+    title_font=dict(size=20, color="#FFFFFF"),
+    xaxis=dict(gridcolor="#FFFFFF", zerolinecolor="#FFFFFF"),
+    yaxis=dict(gridcolor="#FFFFFF", zerolinecolor="#FFFFFF"),
+    hoverlabel=dict(bgcolor="#FF0000", font=dict(color="#000000")),  # Red hover to match theme
+)
+
+# Function to draw a Plotly figure with a note of how many points it holds
+def show_chart(fig, points, rows):
+    st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
+    with profile_stage('DRAW CHART', points):
+        st.plotly_chart(fig, use_container_width=True)
+    st.markdown('</div>', unsafe_allow_html=True)
+    st.caption(f"{points:,} POINTS DRAWN FROM {rows:,} ROWS")
+
+# Function to draw a density heatmap (cell centres and counts from density_data), the binned alternative to a scatter
+# Returns the figure and the number of filled cells.
+def density_figure(grid, title, x_label, y_label):
+    x_centres, y_centres, counts = grid
+    fig = go.Figure(go.Heatmap(x=x_centres, y=y_centres, z=counts, colorscale='Reds', colorbar=dict(title='ROWS')))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label)
+    fig.update_traces(hovertemplate='X: %{x}<br>Y: %{y}<br>Rows: %{z}<extra></extra>')
+    return fig, int((counts > 0).sum())
+
+# Function to ask whether a scatter with more rows than the point budget is sampled or binned
+def use_density(rows, point_budget, key):
+    if rows <= point_budget:
+        return False
+    choice = st.radio("TOO MANY ROWS TO DRAW EVERY POINT - SHOW:", ["SAMPLE", "DENSITY"], horizontal=True, key=key)
+    return choice == "DENSITY"
+
+# Number of anomalies listed in the insights before the rest go into an expander
+ANOMALIES_LISTED = 5
+
+# Function to list the strongest sales anomalies, with every anomaly in an expander
+def show_anomalies(anomalies, key='anomalies'):
+    days = anomalies.days
+    if not days.empty:
+        st.write(f"**SALES ANOMALIES:** {len(anomalies.spikes)} SPIKES AND {len(anomalies.drops)} DROPS AGAINST THE {anomalies.window}-DAY ROLLING MEDIAN")
+        for row in days.head(ANOMALIES_LISTED).to_dict('records'):
+            st.write(f"- {row['KIND']} ON {row['DATE']:%d/%m/%Y} IN {series_label(row['REGION'], row['CATEGORY'])}: "
+                     f"${row['SALES ($)']:.2f} VS A MEDIAN OF ${row['ROLLING MEDIAN ($)']:.2f} (Z = {row['Z-SCORE']:.1f})")
+    orders = anomalies.orders
+    if orders is not None and not orders.empty:
+        top = orders.iloc[0]
+        st.write(f"**ORDER OUTLIERS:** {len(orders)} ORDERS FAR ABOVE THE TYPICAL ORDER - LARGEST {top['ORDER']} "
+                 f"BY CUSTOMER {top['CUSTOMER']} FOR ${top['AMOUNT ($)']:.2f} (Z = {top['Z-SCORE']:.1f})")
+    if len(days) > ANOMALIES_LISTED or (orders is not None and not orders.empty):
+        with st.expander("ALL ANOMALIES"):
+            st.dataframe(days, hide_index=True, key=f"{key}_days")
+            if orders is not None and not orders.empty:
+                st.dataframe(orders, hide_index=True, key=f"{key}_orders")
+
+# Function to report the data-quality checks: issues per rule and a sample of the offending rows
+def show_data_quality(report):
+    if report is None:
+        st.caption("DATA-QUALITY CHECKS RUN WITH THE PANDAS ENGINE.")
+        return
+    if report.clean:
+        st.caption(f"DATA QUALITY: ALL {report.rows:,} ROWS PASSED EVERY CHECK")
+        return
+    action = "LEFT OUT OF THE ANALYSIS" if report.dropped else "KEPT IN THE ANALYSIS"
+    st.warning(f"DATA QUALITY: {report.invalid:,} OF {report.rows:,} ROWS FAILED AT LEAST ONE CHECK ({action})")
+    with st.expander("DATA-QUALITY ISSUES"):
+        st.dataframe(report.table(), hide_index=True)
+        st.write(f"**SAMPLE OF OFFENDING ROWS** (UP TO {DEFAULT_SAMPLE_ROWS} PER CHECK):")
+        st.dataframe(report.sample, hide_index=True)
+        st.download_button(
+            label="DOWNLOAD ISSUE SAMPLE",
+            data=report.sample.to_csv(index=False),
+            file_name="data_quality_sample.csv",
+            mime="text/csv"
+        )
+
+# Function to display the sales analysis (data is None when the file was streamed or several files were combined)
+# analysis_key identifies the analysis for the memoized chart data.
+def analyse_sales(data, metrics, analysis_key):
+    summary_df = summary_table(analysis_key, metrics)
 
     st.write("### KEY INSIGHTS")
-    sales_by_date = data.groupby('Full_Date')['Purchase_Amount'].sum()
-    max_spike_date = sales_by_date.idxmax()
-    max_spike_value = sales_by_date.max()
-    avg_sales = sales_by_date.mean()
-    if pd.notnull(max_spike_date) and max_spike_value > avg_sales * 1.2:
-        spike_percent = ((max_spike_value - avg_sales) / avg_sales) * 100
-        st.write(f"**BIGGEST SALES SPIKE:** {max_spike_date.strftime('%d/%m')} - ${max_spike_value:.2f} (UP {spike_percent:.1f}% FROM AVERAGE!)")
-    outlier_spend = data['Purchase_Amount'].quantile(0.95)
-    if top_spender['Purchase_Amount'] > outlier_spend:
-        st.write(f"**OUTLIER ALERT:** Customer {top_spender['Customer_ID']} spent ${top_spender['Purchase_Amount']:.2f} - TOP 5%!")
+    if metrics.has_spike:
+        st.write(f"**BIGGEST SALES SPIKE:** {metrics.busiest_day.strftime('%d/%m')} - ${metrics.busiest_day_sales:.2f} (UP {metrics.spike_percent:.1f}% FROM AVERAGE!)")
+    if metrics.top_spender_is_outlier:
+        st.write(f"**OUTLIER ALERT:** Customer {metrics.top_spender_id} spent ${metrics.top_spender_amount:.2f} - TOP 5%!{metrics.quantile_label}")
+    show_anomalies(sales_anomalies(analysis_key, metrics, data))
 
     st.write("### SALES ANALYSIS RESULTS")
-    st.write(f"**TOTAL SALES:** ${total_sales:.2f}")
-    st.write(f"**AVERAGE SPEND PER PURCHASE:** ${avg_spend:.2f}")
-    st.write(f"**NUMBER OF UNIQUE CUSTOMERS:** {num_customers}")
-    st.write(f"**AVERAGE SALES PER CUSTOMER:** ${sales_per_customer:.2f}")
-    st.write(f"**TOP SPENDER:** Customer {top_spender['Customer_ID']} spent ${top_spender['Purchase_Amount']:.2f} on {top_spender['Day_Month']}")
-    st.write(f"**TOTAL ITEMS SOLD:** {total_quantity}")
-    st.write(f"**MOST POPULAR CATEGORY:** {popular_category}")
-    st.write(f"**PAYMENT METHOD BREAKDOWN:**\n{payment_breakdown.to_string()}")
-    st.write(f"**REGION WITH HIGHEST SALES:** {region_sales}")
-    st.write(f"**DISCOUNT USAGE:** {discount_usage.get('Yes', 0):.1f}% of purchases had a discount")
-    st.write(f"**AVERAGE CUSTOMER AGE:** {avg_age:.1f} years")
-    st.write(f"**GENDER BREAKDOWN:**\n{gender_breakdown.to_string()}")
-    st.write(f"**NUMBER OF ORDERS:** {num_orders}")
-    st.write(f"**TRANSACTION TIME BREAKDOWN:**\n{time_breakdown.to_string()}")
-    st.write(f"**AVERAGE SHIPPING COST:** ${avg_shipping:.2f}")
-    st.write(f"**TOTAL TAX PAID:** ${total_tax:.2f}")
-    st.write(f"**NUMBER OF UNIQUE PRODUCTS:** {num_products}")
-    st.write(f"**AVERAGE UNIT PRICE:** ${avg_unit_price:.2f}")
-    st.write(f"**RETURN RATE:** {return_rate:.1f}% of purchases returned")
-    st.write(f"**LOYALTY MEMBERS:** {loyalty_percentage:.1f}% of customers")
-    st.write(f"**ORDER CHANNEL BREAKDOWN:**\n{channel_breakdown.to_string()}")
-    st.write(f"**DELIVERY METHOD BREAKDOWN:**\n{delivery_breakdown.to_string()}")
-    st.write(f"**AVERAGE CUSTOMER RATING:** {avg_rating:.1f}/5")
-    st.write(f"**PURCHASE SOURCE BREAKDOWN:**\n{source_breakdown.to_string()}")
+    st.write(f"**TOTAL SALES:** ${metrics.total_sales:.2f}")
+    st.write(f"**AVERAGE SPEND PER PURCHASE:** ${metrics.avg_spend:.2f}")
+    st.write(f"**NUMBER OF UNIQUE CUSTOMERS:** {metrics.num_customers}{metrics.distinct_label}")
+    st.write(f"**AVERAGE SALES PER CUSTOMER:** ${metrics.sales_per_customer:.2f}{metrics.distinct_label}")
+    st.write(f"**TOP SPENDER:** Customer {metrics.top_spender_id} spent ${metrics.top_spender_amount:.2f} on {metrics.top_spender_day}")
+    st.write(f"**TOTAL ITEMS SOLD:** {metrics.total_quantity}")
+    st.write(f"**MOST POPULAR CATEGORY:** {metrics.popular_category}")
+    st.write(f"**PAYMENT METHOD BREAKDOWN:**\n{metrics.payment_breakdown.to_string()}")
+    st.write(f"**REGION WITH HIGHEST SALES:** {metrics.top_region}")
+    st.write(f"**DISCOUNT USAGE:** {metrics.discount_percentage:.1f}% of purchases had a discount")
+    st.write(f"**AVERAGE CUSTOMER AGE:** {metrics.avg_age:.1f} years")
+    st.write(f"**GENDER BREAKDOWN:**\n{metrics.gender_breakdown.to_string()}")
+    st.write(f"**NUMBER OF ORDERS:** {metrics.num_orders}{metrics.distinct_label}")
+    st.write(f"**TRANSACTION TIME BREAKDOWN:**\n{metrics.time_breakdown.to_string()}")
+    st.write(f"**AVERAGE SHIPPING COST:** ${metrics.avg_shipping:.2f}")
+    st.write(f"**TOTAL TAX PAID:** ${metrics.total_tax:.2f}")
+    st.write(f"**NUMBER OF UNIQUE PRODUCTS:** {metrics.num_products}{metrics.distinct_label}")
+    st.write(f"**AVERAGE UNIT PRICE:** ${metrics.avg_unit_price:.2f}")
+    st.write(f"**RETURN RATE:** {metrics.return_rate:.1f}% of purchases returned")
+    st.write(f"**LOYALTY MEMBERS:** {metrics.loyalty_percentage:.1f}% of customers")
+    st.write(f"**ORDER CHANNEL BREAKDOWN:**\n{metrics.channel_breakdown.to_string()}")
+    st.write(f"**DELIVERY METHOD BREAKDOWN:**\n{metrics.delivery_breakdown.to_string()}")
+    st.write(f"**AVERAGE CUSTOMER RATING:** {metrics.avg_rating:.1f}/5")
+    st.write(f"**PURCHASE SOURCE BREAKDOWN:**\n{metrics.source_breakdown.to_string()}")
 
     st.write("### VISUALISE YOUR DATA")
     chart_options = [
@@ -331,248 +694,516 @@ def analyse_sales(data):
         "PURCHASE AMOUNT VS CUSTOMER AGE (SCATTER)", 
         "CUSTOMER AGE DISTRIBUTION (HISTOGRAM)",
         "SALES BY LOYALTY STATUS (SUNBURST)",
+        "FREQUENTLY BOUGHT TOGETHER (BAR)",
         "BUILD YOUR OWN CHART"
     ]
     chart_type = st.selectbox("CHOOSE A CHART TO VIEW:", chart_options)
+    point_budget = st.number_input("MAX POINTS PER CHART:", min_value=100, value=DEFAULT_POINT_BUDGET, step=500)
+    rows = metrics.row_count
+    if data is None and chart_type in ROW_LEVEL_CHARTS:
+        st.info("THIS CHART NEEDS THE FULL FILE IN MEMORY - TURN OFF STREAMING MODE AND OPEN A SINGLE FILE TO VIEW IT.")
+        chart_type = None
 
-    # Custom Plotly layout with color
-    plot_layout = dict(
-        plot_bgcolor='#000000',
-        paper_bgcolor='#000000',
-        font=dict(family="Courier New, monospace", color="#FFFFFF"),
-        title_font=dict(size=20, color="#FFFFFF"),
-        xaxis=dict(gridcolor="#FFFFFF", zerolinecolor="#FFFFFF"),
-        yaxis=dict(gridcolor="#FFFFFF", zerolinecolor="#FFFFFF"),
-        hoverlabel=dict(bgcolor="#FF0000", font=dict(color="#000000")),  # Red hover to match theme
-    )
-
-    if chart_type == "SALES OVER TIME (LINE)":
-        sales_by_date = data.groupby('Full_Date')['Purchase_Amount'].sum().reset_index()
-        fig = px.line(
-            sales_by_date, 
-            x='Full_Date', 
-            y='Purchase_Amount',
-            title='SALES OVER TIME',
-            labels={'Full_Date': 'DATE (DD/MM)', 'Purchase_Amount': 'TOTAL SALES ($)'},
-            line_shape='spline',
-            color_discrete_sequence=['#FF0000']  # Red to match theme
-        )
-        fig.update_layout(**plot_layout)
-        fig.update_traces(line=dict(width=3), hovertemplate='Date: %{x|%d/%m}<br>Sales: $%{y:.2f}')
-        st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    elif chart_type == "PURCHASES BY PAYMENT METHOD (BAR)":
-        fig = px.bar(
-            payment_breakdown.reset_index(),
-            x='Payment_Method',
-            y='count',
-            title='PURCHASES BY PAYMENT METHOD',
-            labels={'Payment_Method': 'PAYMENT METHOD', 'count': 'NUMBER OF PURCHASES'},
-            color='Payment_Method',
-            color_discrete_sequence=px.colors.sequential.Plasma
-        )
-        fig.update_layout(**plot_layout, showlegend=False)
-        fig.update_traces(hovertemplate='Method: %{x}<br>Count: %{y}')
-        st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    elif chart_type == "SALES BY REGION (BAR)":
-        sales_by_region = data.groupby('Region')['Purchase_Amount'].sum().reset_index()
-        fig = px.bar(
-            sales_by_region,
-            x='Region',
-            y='Purchase_Amount',
-            title='SALES BY REGION',
-            labels={'Region': 'REGION', 'Purchase_Amount': 'TOTAL SALES ($)'},
-            color='Region',
-            color_discrete_sequence=px.colors.sequential.Viridis
-        )
-        fig.update_layout(**plot_layout, showlegend=False)
-        fig.update_traces(hovertemplate='Region: %{x}<br>Sales: $%{y:.2f}')
-        st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    elif chart_type == "SALES BY CATEGORY (PIE)":
-        sales_by_category = data.groupby('Product_Category')['Purchase_Amount'].sum().reset_index()
-        top_5 = sales_by_category.nlargest(5, 'Purchase_Amount')
-        other_sales = sales_by_category['Purchase_Amount'].sum() - top_5['Purchase_Amount'].sum()
-        if other_sales > 0:
-            top_5 = pd.concat([top_5, pd.DataFrame({'Product_Category': ['Other'], 'Purchase_Amount': [other_sales]})], ignore_index=True)
-        fig = px.pie(
-            top_5,
-            names='Product_Category',
-            values='Purchase_Amount',
-            title='TOP 5 CATEGORIES BY SALES (PIE)',
-            color_discrete_sequence=px.colors.sequential.Plasma
-        )
-        fig.update_layout(**plot_layout)
-        fig.update_traces(textinfo='percent+label', hovertemplate='Category: %{label}<br>Sales: $%{value:.2f}')
-        st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    elif chart_type == "DISCOUNT USAGE (PIE)":
-        discount_counts = data['Discount_Applied'].value_counts().reset_index()
-        fig = px.pie(
-            discount_counts,
-            names='Discount_Applied',
-            values='count',
-            title='DISCOUNT USAGE',
-            color_discrete_sequence=['#FF0000', '#FFFFFF']  # Red and white to match theme
-        )
-        fig.update_layout(**plot_layout)
-        fig.update_traces(textinfo='percent+label', hovertemplate='Discount: %{label}<br>Count: %{value}')
-        st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    elif chart_type == "PURCHASE AMOUNT VS CUSTOMER AGE (SCATTER)":
-        fig = px.scatter(
-            data,
-            x='Customer_Age',
-            y='Purchase_Amount',
-            title='PURCHASE AMOUNT VS CUSTOMER AGE',
-            labels={'Customer_Age': 'CUSTOMER AGE', 'Purchase_Amount': 'PURCHASE AMOUNT ($)'},
-            color='Customer_Gender',
-            size='Quantity',
-            color_discrete_sequence=['#FF0000', '#FFFFFF'],  # Red and white to match theme
-            opacity=0.7
-        )
-        fig.update_layout(**plot_layout)
-        fig.update_traces(hovertemplate='Age: %{x}<br>Amount: $%{y:.2f}<br>Gender: %{marker.color}')
-        st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    elif chart_type == "CUSTOMER AGE DISTRIBUTION (HISTOGRAM)":
-        fig = px.histogram(
-            data,
-            x='Customer_Age',
-            title='CUSTOMER AGE DISTRIBUTION',
-            labels={'Customer_Age': 'AGE', 'count': 'NUMBER OF CUSTOMERS'},
-            color_discrete_sequence=['#FF0000'],  # Red to match theme
-            nbins=10
-        )
-        fig.update_layout(**plot_layout)
-        fig.update_traces(hovertemplate='Age Range: %{x}<br>Count: %{y}')
-        st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    elif chart_type == "SALES BY LOYALTY STATUS (SUNBURST)":
-        sunburst_data = data.groupby(['Customer_Loyalty', 'Region'])['Purchase_Amount'].sum().reset_index()
-        fig = px.sunburst(
-            sunburst_data,
-            path=['Customer_Loyalty', 'Region'],
-            values='Purchase_Amount',
-            title='SALES BY LOYALTY STATUS AND REGION (SUNBURST)',
-            color='Purchase_Amount',
-            color_continuous_scale='Reds'  # Red gradient to match theme
-        )
-        fig.update_layout(**plot_layout)
-        fig.update_traces(hovertemplate='Loyalty: %{parent}<br>Region: %{label}<br>Sales: $%{value:.2f}')
-        st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    elif chart_type == "BUILD YOUR OWN CHART":
-        numeric_cols = data.select_dtypes(include=['int64', 'float64']).columns.tolist()
-        x_axis = st.selectbox("CHOOSE X-AXIS:", data.columns.tolist())
-        y_axis = st.selectbox("CHOOSE Y-AXIS (FOR SCATTER/BAR/LINE):", ["None"] + numeric_cols)
-        custom_chart_type = st.selectbox("CHOOSE CHART TYPE:", ["BAR", "LINE", "PIE", "SCATTER", "HISTOGRAM"])
-        color_by = st.selectbox("COLOR BY (OPTIONAL):", ["None"] + data.columns.tolist())
+    # A chart's stage covers its data prep, the Plotly figure build and drawing it
+    with profile_stage(f"CHART: {chart_type}", rows):
+        if chart_type == "SALES OVER TIME (LINE)":
+            granularity = st.radio("GRANULARITY:", list(GRANULARITIES), horizontal=True, key='sales_over_time_granularity')
+            sales_line = sales_over_time_data(analysis_key, metrics, point_budget, granularity)
+            fig = px.line(
+                sales_line,
+                x='Full_Date', 
+                y='Purchase_Amount',
+                title='SALES OVER TIME',
+                labels={'Full_Date': 'DATE (DD/MM)', 'Purchase_Amount': 'TOTAL SALES ($)'},
+                line_shape='spline',
+                color_discrete_sequence=['#FF0000']  # Red to match theme
+            )
+            fig.update_layout(**PLOT_LAYOUT)
+            fig.update_traces(line=dict(width=3), hovertemplate='Date: %{x|%d/%m}<br>Sales: $%{y:.2f}')
+            show_chart(fig, len(sales_line), rows)
 
-        if custom_chart_type == "BAR" and y_axis != "None":
+        elif chart_type == "PURCHASES BY PAYMENT METHOD (BAR)":
             fig = px.bar(
-                data,
-                x=x_axis,
-                y=y_axis,
-                color=color_by if color_by != "None" else None,
-                title=f"{y_axis} BY {x_axis} (BAR)",
+                metrics.payment_breakdown.reset_index(),
+                x='Payment_Method',
+                y='count',
+                title='PURCHASES BY PAYMENT METHOD',
+                labels={'Payment_Method': 'PAYMENT METHOD', 'count': 'NUMBER OF PURCHASES'},
+                color='Payment_Method',
                 color_discrete_sequence=px.colors.sequential.Plasma
             )
-        elif custom_chart_type == "LINE" and y_axis != "None":
-            fig = px.line(
-                data,
-                x=x_axis,
-                y=y_axis,
-                color=color_by if color_by != "None" else None,
-                title=f"{y_axis} BY {x_axis} (LINE)",
-                line_shape='spline',
-                color_discrete_sequence=px.colors.sequential.Plasma
+            fig.update_layout(**PLOT_LAYOUT, showlegend=False)
+            fig.update_traces(hovertemplate='Method: %{x}<br>Count: %{y}')
+            show_chart(fig, len(metrics.payment_breakdown), rows)
+
+        elif chart_type == "SALES BY REGION (BAR)":
+            fig = px.bar(
+                metrics.sales_by_region.reset_index(),
+                x='Region',
+                y='Purchase_Amount',
+                title='SALES BY REGION',
+                labels={'Region': 'REGION', 'Purchase_Amount': 'TOTAL SALES ($)'},
+                color='Region',
+                color_discrete_sequence=px.colors.sequential.Viridis
             )
-        elif custom_chart_type == "PIE":
-            pie_data = data.groupby(x_axis)[y_axis].sum().reset_index() if y_axis != "None" else data[x_axis].value_counts().reset_index()
+            fig.update_layout(**PLOT_LAYOUT, showlegend=False)
+            fig.update_traces(hovertemplate='Region: %{x}<br>Sales: $%{y:.2f}')
+            show_chart(fig, len(metrics.sales_by_region), rows)
+
+        elif chart_type == "SALES BY CATEGORY (PIE)":
+            top_5 = category_pie_data(analysis_key, data)
             fig = px.pie(
-                pie_data,
-                names=x_axis,
-                values=y_axis if y_axis != "None" else 'count',
-                title=f"{x_axis} BREAKDOWN (PIE)",
+                top_5,
+                names='Product_Category',
+                values='Purchase_Amount',
+                title='TOP 5 CATEGORIES BY SALES (PIE)',
                 color_discrete_sequence=px.colors.sequential.Plasma
             )
-        elif custom_chart_type == "SCATTER" and y_axis != "None":
-            fig = px.scatter(
-                data,
-                x=x_axis,
-                y=y_axis,
-                color=color_by if color_by != "None" else None,
-                title=f"{y_axis} VS {x_axis} (SCATTER)",
-                color_discrete_sequence=px.colors.sequential.Plasma
+            fig.update_layout(**PLOT_LAYOUT)
+            fig.update_traces(textinfo='percent+label', hovertemplate='Category: %{label}<br>Sales: $%{value:.2f}')
+            show_chart(fig, len(top_5), rows)
+
+        elif chart_type == "DISCOUNT USAGE (PIE)":
+            fig = px.pie(
+                metrics.discount_breakdown.reset_index(),
+                names='Discount_Applied',
+                values='count',
+                title='DISCOUNT USAGE',
+                color_discrete_sequence=['#FF0000', '#FFFFFF']  # Red and white to match theme
             )
-        elif custom_chart_type == "HISTOGRAM":
-            fig = px.histogram(
-                data,
-                x=x_axis,
-                color=color_by if color_by != "None" else None,
-                title=f"{x_axis} DISTRIBUTION (HISTOGRAM)",
-                color_discrete_sequence=px.colors.sequential.Plasma
+            fig.update_layout(**PLOT_LAYOUT)
+            fig.update_traces(textinfo='percent+label', hovertemplate='Discount: %{label}<br>Count: %{value}')
+            show_chart(fig, len(metrics.discount_breakdown), rows)
+
+        elif chart_type == "PURCHASE AMOUNT VS CUSTOMER AGE (SCATTER)":
+            scatter_labels = {'Customer_Age': 'CUSTOMER AGE', 'Purchase_Amount': 'PURCHASE AMOUNT ($)'}
+            if use_density(rows, point_budget, 'age_scatter_mode'):
+                grid = density_data(analysis_key, data, 'Customer_Age', 'Purchase_Amount')
+                fig, points = density_figure(grid, 'PURCHASE AMOUNT VS CUSTOMER AGE (DENSITY)', scatter_labels['Customer_Age'], scatter_labels['Purchase_Amount'])
+                fig.update_layout(**PLOT_LAYOUT)
+            else:
+                age_scatter = scatter_data(analysis_key, data, ('Customer_Age', 'Purchase_Amount', 'Customer_Gender', 'Quantity'), point_budget, 'Customer_Gender')
+                points = len(age_scatter)
+                fig = px.scatter(
+                    age_scatter,
+                    x='Customer_Age',
+                    y='Purchase_Amount',
+                    title='PURCHASE AMOUNT VS CUSTOMER AGE',
+                    labels=scatter_labels,
+                    color='Customer_Gender',
+                    size='Quantity',
+                    color_discrete_sequence=['#FF0000', '#FFFFFF'],  # Red and white to match theme
+                    opacity=0.7
+                )
+                fig.update_layout(**PLOT_LAYOUT)
+                fig.update_traces(hovertemplate='Age: %{x}<br>Amount: $%{y:.2f}<br>Gender: %{marker.color}')
+            show_chart(fig, points, rows)
+
+        elif chart_type == "CUSTOMER AGE DISTRIBUTION (HISTOGRAM)":
+            age_bins = histogram_data(analysis_key, data, 'Customer_Age', 10)
+            fig = px.bar(
+                age_bins,
+                x='Customer_Age',
+                y='count',
+                title='CUSTOMER AGE DISTRIBUTION',
+                labels={'Customer_Age': 'AGE', 'count': 'NUMBER OF CUSTOMERS'},
+                color_discrete_sequence=['#FF0000']  # Red to match theme
             )
-        else:
-            st.write("Please select valid options to build your chart.")
-            return pd.DataFrame(summary_data)
+            fig.update_layout(**PLOT_LAYOUT, bargap=0.02)
+            fig.update_traces(hovertemplate='Age Range: %{x}<br>Count: %{y}')
+            show_chart(fig, len(age_bins), rows)
 
-        fig.update_layout(**plot_layout)
-        st.markdown('<div class="plotly-chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        elif chart_type == "SALES BY LOYALTY STATUS (SUNBURST)":
+            sunburst_data = loyalty_sunburst_data(analysis_key, data)
+            fig = px.sunburst(
+                sunburst_data,
+                path=['Customer_Loyalty', 'Region'],
+                values='Purchase_Amount',
+                title='SALES BY LOYALTY STATUS AND REGION (SUNBURST)',
+                color='Purchase_Amount',
+                color_continuous_scale='Reds'  # Red gradient to match theme
+            )
+            fig.update_layout(**PLOT_LAYOUT)
+            fig.update_traces(hovertemplate='Loyalty: %{parent}<br>Region: %{label}<br>Sales: $%{value:.2f}')
+            show_chart(fig, len(sunburst_data), rows)
+
+        elif chart_type == "FREQUENTLY BOUGHT TOGETHER (BAR)":
+            # The default basket's counts are also the ones in the exports
+            default_pairs = basket_pairs(analysis_key, data)
+            baskets = list(BASKET_COLUMNS)
+            basket = st.radio("A BASKET IS ONE:", baskets, index=baskets.index(default_pairs.basket), horizontal=True)
+            min_support = st.number_input("MINIMUM SUPPORT (% OF BASKETS):", min_value=0.0, max_value=100.0,
+                                          value=DEFAULT_MIN_SUPPORT * 100, step=0.01, format="%.4f")
+            pairs = basket_pairs(analysis_key, data, basket, min_support / 100)
+            table = pairs.pairs()
+            st.caption(f"{pairs.basket_count:,} BASKETS - PAIRS BOUGHT TOGETHER IN AT LEAST {pairs.min_baskets:,} OF THEM: {len(table):,}")
+            if table.empty:
+                st.info("NO TWO PRODUCTS WERE BOUGHT TOGETHER OFTEN ENOUGH - TRY A LOWER MINIMUM SUPPORT OR THE OTHER BASKET.")
+            else:
+                top_pairs = table.head(20).assign(PAIR=lambda frame: frame['PRODUCT A'].astype(str) + ' + ' + frame['PRODUCT B'].astype(str))
+                fig = px.bar(
+                    top_pairs,
+                    x='PAIR',
+                    y='BASKETS',
+                    color='LIFT',
+                    title='PRODUCTS MOST OFTEN BOUGHT TOGETHER',
+                    color_continuous_scale='Reds'  # Red gradient to match theme
+                )
+                fig.update_layout(**PLOT_LAYOUT)
+                fig.update_traces(hovertemplate='Pair: %{x}<br>Baskets: %{y}<br>Lift: %{marker.color:.2f}')
+                show_chart(fig, len(top_pairs), rows)
+                st.dataframe(table.head(100), hide_index=True)
+                product = st.text_input("SHOW THE TOP PARTNERS OF PRODUCT:")
+                if product:
+                    st.dataframe(pairs.top_partners(product=product), hide_index=True)
+                col1, col2 = st.columns(2)
+                # The full tables are written out only when their button is clicked
+                with col1:
+                    st.download_button(
+                        label="DOWNLOAD ALL PAIRS",
+                        data=lambda: table.to_csv(index=False),
+                        file_name="bought_together.csv",
+                        mime="text/csv"
+                    )
+                with col2:
+                    st.download_button(
+                        label="DOWNLOAD TOP PARTNERS PER PRODUCT",
+                        data=lambda: pairs.top_partners().to_csv(index=False),
+                        file_name="top_partners.csv",
+                        mime="text/csv"
+                    )
+
+        elif chart_type == "BUILD YOUR OWN CHART":
+            numeric_cols = data.select_dtypes(include='number').columns.drop('Year', errors='ignore').tolist()
+            x_axis = st.selectbox("CHOOSE X-AXIS:", data.columns.tolist())
+            y_axis = st.selectbox("CHOOSE Y-AXIS (FOR SCATTER/BAR/LINE):", ["None"] + numeric_cols)
+            custom_chart_type = st.selectbox("CHOOSE CHART TYPE:", ["BAR", "LINE", "PIE", "SCATTER", "HISTOGRAM", "PIVOT TABLE"])
+            color_by = st.selectbox("COLOR BY (OPTIONAL):", ["None"] + data.columns.tolist())
+            color = color_by if color_by != "None" else None
+            # Only the chosen columns are reduced and sent to the chart
+            chart_columns = tuple(dict.fromkeys(column for column in (x_axis, y_axis, color) if column not in (None, "None")))
+            # BAR, PIE and PIVOT TABLE are read from the aggregate cube, each axis cut to its top values
+            if custom_chart_type in ("BAR", "PIE", "PIVOT TABLE"):
+                aggregation = st.selectbox("AGGREGATION:", AGGREGATIONS)
+                top_values = int(st.number_input("SHOW TOP (THE REST ARE GROUPED AS OTHER):", min_value=1, value=DEFAULT_TOP_VALUES))
+                if aggregation == "DISTINCT COUNT":
+                    measure = st.selectbox("COUNT DISTINCT VALUES OF:", data.columns.tolist())
+                elif aggregation == "COUNT" or y_axis == "None":
+                    # Without a Y-axis, rows are counted
+                    aggregation, measure = "COUNT", None
+                else:
+                    measure = y_axis
+                values = value_column(measure, aggregation)
+
+            if custom_chart_type == "BAR":
+                chart_data = cube_data(analysis_key, data, (x_axis,) if color is None else (x_axis, color), measure, aggregation, top_values)
+                fig = px.bar(
+                    chart_data,
+                    x=x_axis,
+                    y=values,
+                    color=color if color in chart_data.columns and color != x_axis else None,
+                    title=f"{values.upper()} BY {x_axis} (BAR)",
+                    color_discrete_sequence=px.colors.sequential.Plasma
+                )
+            elif custom_chart_type == "LINE" and y_axis != "None":
+                chart_data = line_data(analysis_key, data, chart_columns, x_axis, y_axis, point_budget, color)
+                fig = px.line(
+                    chart_data,
+                    x=x_axis,
+                    y=y_axis,
+                    color=color,
+                    title=f"{y_axis} BY {x_axis} (LINE)",
+                    line_shape='spline',
+                    color_discrete_sequence=px.colors.sequential.Plasma
+                )
+            elif custom_chart_type == "PIE":
+                chart_data = cube_data(analysis_key, data, (x_axis,), measure, aggregation, top_values)
+                fig = px.pie(
+                    chart_data,
+                    names=x_axis,
+                    values=values,
+                    title=f"{x_axis} BREAKDOWN (PIE)",
+                    color_discrete_sequence=px.colors.sequential.Plasma
+                )
+            elif custom_chart_type == "SCATTER" and y_axis != "None" and is_continuous(data[x_axis]) and use_density(rows, point_budget, 'custom_scatter_mode'):
+                grid = density_data(analysis_key, data, x_axis, y_axis)
+                fig, points = density_figure(grid, f"{y_axis} VS {x_axis} (DENSITY)", x_axis, y_axis)
+                chart_data = None
+            elif custom_chart_type == "SCATTER" and y_axis != "None":
+                chart_data = scatter_data(analysis_key, data, chart_columns, point_budget, color)
+                fig = px.scatter(
+                    chart_data,
+                    x=x_axis,
+                    y=y_axis,
+                    color=color,
+                    title=f"{y_axis} VS {x_axis} (SCATTER)",
+                    color_discrete_sequence=px.colors.sequential.Plasma
+                )
+            elif custom_chart_type == "HISTOGRAM":
+                if is_continuous(data[x_axis]):
+                    chart_data = histogram_data(analysis_key, data, x_axis, 30, color)
+                else:
+                    # A category per bar: counted by the cube, cut to the top values with the rest as Other
+                    dimensions = (x_axis,) if color is None else (x_axis, color)
+                    chart_data = cube_data(analysis_key, data, dimensions, None, 'COUNT', DEFAULT_TOP_VALUES)
+                fig = px.bar(
+                    chart_data,
+                    x=x_axis,
+                    y='count',
+                    color=color if color in chart_data.columns else None,
+                    title=f"{x_axis} DISTRIBUTION (HISTOGRAM)",
+                    color_discrete_sequence=px.colors.sequential.Plasma
+                )
+                fig.update_layout(bargap=0.02)
+            elif custom_chart_type == "PIVOT TABLE":
+                pivot = pivot_data(analysis_key, data, x_axis, color, measure, aggregation, top_values)
+                st.dataframe(pivot)
+                st.caption(f"{pivot.shape[0]:,} ROWS x {pivot.shape[1]:,} COLUMNS FROM {rows:,} ROWS")
+                st.download_button(
+                    label="DOWNLOAD PIVOT TABLE",
+                    data=pivot.to_csv(),
+                    file_name="sales_pivot.csv",
+                    mime="text/csv"
+                )
+                fig = None
+            else:
+                st.write("Please select valid options to build your chart.")
+                return summary_df
+
+            if fig is not None:
+                fig.update_layout(**PLOT_LAYOUT)
+                show_chart(fig, len(chart_data) if chart_data is not None else points, rows)
+
+    show_customer_analytics(data, analysis_key)
 
     st.write("### ADDITIONAL INSIGHTS")
-    busiest_day = data.groupby('Full_Date')['Purchase_Amount'].sum().idxmax()
-    customer_frequency = data['Customer_ID'].value_counts()
-    most_frequent_customer = customer_frequency.idxmax()
-    avg_items_per_purchase = data['Quantity'].mean()
-    top_payment_method = payment_breakdown.idxmax()
-
-    st.write(f"**BUSIEST DAY:** {busiest_day.strftime('%d/%m')} with ${data.groupby('Full_Date')['Purchase_Amount'].sum().max():.2f} in sales")
-    st.write(f"**MOST FREQUENT CUSTOMER:** {most_frequent_customer} made {customer_frequency.max()} purchases")
-    st.write(f"**AVERAGE ITEMS PER PURCHASE:** {avg_items_per_purchase:.2f}")
-    st.write(f"**MOST USED PAYMENT METHOD:** {top_payment_method}")
-
-    summary_data = {
-        'METRIC': [
-            'TOTAL SALES', 'AVERAGE SPEND PER PURCHASE', 'NUMBER OF UNIQUE CUSTOMERS',
-            'AVERAGE SALES PER CUSTOMER', 'TOTAL ITEMS SOLD', 'MOST POPULAR CATEGORY',
-            'REGION WITH HIGHEST SALES', 'DISCOUNT USAGE (%)', 'AVERAGE CUSTOMER AGE',
-            'NUMBER OF ORDERS', 'AVERAGE SHIPPING COST', 'TOTAL TAX PAID', 'NUMBER OF UNIQUE PRODUCTS',
-            'AVERAGE UNIT PRICE', 'RETURN RATE (%)', 'LOYALTY MEMBERS (%)', 'AVERAGE CUSTOMER RATING',
-            'BUSIEST DAY', 'MOST FREQUENT CUSTOMER', 'AVERAGE ITEMS PER PURCHASE', 'MOST USED PAYMENT METHOD'
-        ],
-        'VALUE': [
-            f"${total_sales:.2f}", f"${avg_spend:.2f}", num_customers,
-            f"${sales_per_customer:.2f}", total_quantity, str(popular_category),
-            region_sales, f"{discount_usage.get('Yes', 0):.1f}", f"{avg_age:.1f}",
-            num_orders, f"${avg_shipping:.2f}", f"${total_tax:.2f}", num_products,
-            f"${avg_unit_price:.2f}", f"{return_rate:.1f}", f"{loyalty_percentage:.1f}",
-            f"{avg_rating:.1f}", busiest_day.strftime('%d/%m') + f" (${data.groupby('Full_Date')['Purchase_Amount'].sum().max():.2f})",
-            f"{most_frequent_customer} ({customer_frequency.max()} purchases)",
-            f"{avg_items_per_purchase:.2f}", top_payment_method
-        ]
-    }
-    return pd.DataFrame(summary_data)
+    st.write(f"**BUSIEST DAY:** {metrics.busiest_day.strftime('%d/%m')} with ${metrics.busiest_day_sales:.2f} in sales")
+    st.write(f"**MOST FREQUENT CUSTOMER:** {metrics.most_frequent_customer} made {metrics.most_frequent_customer_purchases} purchases{metrics.frequency_label}")
+    st.write(f"**AVERAGE ITEMS PER PURCHASE:** {metrics.avg_items_per_purchase:.2f}")
+    st.write(f"**MOST USED PAYMENT METHOD:** {metrics.top_payment_method}")
+
+    return summary_df
+
+# Function to show the RFM segments, cohort retention or lifetime value of the analysed customers
+# The tables are built the first time a view is shown and kept per analysis, so switching views recomputes nothing.
+def show_customer_analytics(data, analysis_key):
+    st.write("### CUSTOMER ANALYTICS")
+    if data is None:
+        st.info("CUSTOMER ANALYTICS NEED THE FULL FILE IN MEMORY - TURN OFF STREAMING MODE AND OPEN A SINGLE FILE TO VIEW THEM.")
+        return
+    view = st.selectbox("CHOOSE A CUSTOMER VIEW:", ["RFM SEGMENTS (BAR)", "COHORT RETENTION (HEATMAP)", "CUSTOMER LIFETIME VALUE"])
+    customers = customer_analytics(analysis_key, data)
+    with profile_stage(f"CUSTOMERS: {view}"):
+        if view == "RFM SEGMENTS (BAR)":
+            segments = customers.segment_summary()
+            fig = px.bar(
+                segments,
+                x='SEGMENT',
+                y='CUSTOMERS',
+                title='CUSTOMERS BY RFM SEGMENT',
+                color='NET SALES',
+                color_continuous_scale='Reds'  # Red gradient to match theme
+            )
+            fig.update_layout(**PLOT_LAYOUT)
+            fig.update_traces(hovertemplate='Segment: %{x}<br>Customers: %{y}<br>Net Sales: $%{marker.color:.2f}')
+            show_chart(fig, len(segments), len(customers.rfm()))
+            st.dataframe(segments, hide_index=True)
+            st.caption("RECENCY, FREQUENCY AND MONETARY (NET OF RETURNS) ARE EACH SCORED 1-5 BY THE CUSTOMER'S RANK.")
+            # The per-customer tables are written out only when their button is clicked
+            st.download_button(
+                label="DOWNLOAD RFM SCORES",
+                data=lambda: customers.rfm().to_csv(index=False),
+                file_name="customer_rfm.csv",
+                mime="text/csv"
+            )
+        elif view == "COHORT RETENTION (HEATMAP)":
+            retention = customers.retention()
+            fig = go.Figure(go.Heatmap(
+                x=retention.columns, y=retention.index.astype(str), z=retention.to_numpy() * 100,
+                colorscale='Reds', colorbar=dict(title='% ACTIVE')
+            ))
+            fig.update_layout(**PLOT_LAYOUT, title='MONTHLY COHORT RETENTION', xaxis_title='MONTHS SINCE FIRST PURCHASE', yaxis_title='FIRST PURCHASE MONTH')
+            fig.update_yaxes(autorange='reversed')
+            fig.update_traces(hovertemplate='Cohort: %{y}<br>Month: %{x}<br>Active: %{z:.1f}%<extra></extra>')
+            show_chart(fig, int(retention.notna().to_numpy().sum()), len(customers.customers()))
+            st.download_button(
+                label="DOWNLOAD COHORT TABLE",
+                data=lambda: customers.cohort_counts().to_csv(),
+                file_name="customer_cohorts.csv",
+                mime="text/csv"
+            )
+        else:
+            st.dataframe(customers.clv_summary(), hide_index=True)
+            st.caption("CLV IS NET SALES SO FAR (RETURNS EXCLUDED) PLUS THE EXPECTED VALUE OF FUTURE MONTHS, "
+                       "USING THE MONTHLY RETENTION OF THE CUSTOMER'S LOYALTY GROUP.")
+            st.write("**TOP CUSTOMERS BY LIFETIME VALUE:**")
+            st.dataframe(customers.clv().nlargest(20, 'CLV'), hide_index=True)
+            st.download_button(
+                label="DOWNLOAD CUSTOMER LIFETIME VALUES",
+                data=lambda: customers.clv().to_csv(index=False),
+                file_name="customer_lifetime_value.csv",
+                mime="text/csv"
+            )
+
+# Function to pick the two periods to compare and analyse each one: two date ranges of the analysed rows
+# (base_data and base_key are the rows and key before the sidebar filters; the column filters still apply),
+# or this analysis against another dataset, analysed in a background job of its own.
+# Returns (comparison key, labels, current metrics and rows, previous metrics and rows), or None.
+def comparison_sides(data, metrics, analysis_key, label, base_data, base_key, selections, streaming, estimate_error, backend,
+                     drop_invalid=False):
+    mode = st.radio("COMPARE:", ["TWO DATE RANGES", "ANOTHER DATASET"], horizontal=True)
+    if mode == "TWO DATE RANGES":
+        if base_data is None:
+            st.info("COMPARING DATE RANGES NEEDS THE FULL FILE IN MEMORY - TURN OFF STREAMING MODE AND OPEN A SINGLE FILE, OR COMPARE WITH ANOTHER DATASET.")
+            return None
+        index = filter_index(base_key, base_data)
+        first, last = index.date_bounds()
+        if first is None:
+            st.info("THERE ARE NO VALID DATES TO COMPARE.")
+            return None
+        col1, col2 = st.columns(2)
+        # The default is the last month in the file against the month before it
+        with col1:
+            current_range = st.date_input("PERIOD:", value=(max(first, last.replace(day=1)), last),
+                                          min_value=first, max_value=last, format="DD/MM/YYYY", key='comparison_period')
+        with col2:
+            kind = st.selectbox("COMPARED WITH:", PREVIOUS_PERIODS + ["CUSTOM"])
+            if kind == "CUSTOM":
+                previous_range = st.date_input("OTHER PERIOD:", value=(first, first), min_value=first, max_value=last,
+                                               format="DD/MM/YYYY", key='comparison_other_period')
+        # While a range is being picked only its start is set
+        if len(current_range) != 2:
+            return None
+        if kind != "CUSTOM":
+            previous_range = previous_period(*current_range, kind)
+            col2.caption(f"OTHER PERIOD: {range_label(*previous_range)}")
+        if len(previous_range) != 2:
+            return None
+        current_range, previous_range = tuple(current_range), tuple(previous_range)
+        labels = side_labels(range_label(*current_range), range_label(*previous_range))
+        sides = []
+        for side_label, date_range in zip(labels, (current_range, previous_range)):
+            try:
+                sides.append(analyse_filtered(base_key, (date_range, selections), base_data, index, estimate_error))
+            except SalesDataError as e:
+                st.error(f"{side_label}: {e}")
+                return None
+        (current_data, current), (previous_data, previous) = sides
+        return (base_key, selections, current_range, previous_range), labels, current, current_data, previous, previous_data
+
+    other_file = st.file_uploader("COMPARE WITH A CSV FILE", type=["csv"], key='comparison_upload')
+    stored = {dataset.label: dataset for dataset in sorted(get_dataset_store().list(), key=lambda dataset: dataset.ingested_at, reverse=True)}
+    picked_dataset = st.selectbox("OR WITH A PREVIOUSLY INGESTED DATASET:", ["NONE"] + list(stored), key='comparison_dataset')
+    if other_file is not None:
+        other = collect_sources([other_file], None)
+        (name, source), dataset_id = other[0], source_ids(other)[0]
+    elif picked_dataset != "NONE":
+        name, source, dataset_id = stored[picked_dataset].name, None, stored[picked_dataset].key
+    else:
+        st.info("UPLOAD A CSV FILE OR OPEN AN INGESTED DATASET TO COMPARE WITH.")
+        return None
+    try:
+        analysed = analyse_one(name, source, dataset_id, streaming, estimate_error, backend, drop_invalid)
+    except SalesDataError as e:
+        st.error(f"{name}: {e}")
+        return None
+    if analysed is None:
+        return None
+    other_key, other_data, other_metrics, _ = analysed
+    labels = side_labels(label, name)
+    other_analysis = (other_key, streaming, estimate_error, backend, drop_invalid)
+    return (analysis_key, other_analysis), labels, metrics, data, other_metrics, other_data
+
+# Function to compare two periods: every summary metric with its change, the region, category and channel
+# breakdowns lined up side by side, and both periods' sales over time on one chart
+# Returns (comparison key, comparison tables) for the exports, or None when comparison mode is off.
+def show_comparison(data, metrics, analysis_key, label, base_data, base_key, selections, streaming, estimate_error, backend,
+                    drop_invalid=False):
+    st.write("### COMPARE PERIODS")
+    if not st.checkbox("COMPARISON MODE (E.G. THIS MONTH VS LAST MONTH, THIS YEAR VS LAST YEAR, OR ANOTHER DATASET)"):
+        return None
+    sides = comparison_sides(
+        data, metrics, analysis_key, label, base_data, base_key, selections, streaming, estimate_error, backend, drop_invalid
+    )
+    if sides is None:
+        return None
+    comparison_key, labels, current, current_data, previous, previous_data = sides
+    tables = period_comparison(comparison_key, labels, current, previous, current_data, previous_data)
+
+    st.write(f"**{labels[0]}** VS **{labels[1]}** - CHANGE IS FROM THE SECOND TO THE FIRST")
+    st.dataframe(tables[SUMMARY_TITLE], hide_index=True)
+    breakdown_titles = [title for title in tables if title not in (SUMMARY_TITLE, SALES_OVER_TIME_TITLE)]
+    for tab, title in zip(st.tabs(breakdown_titles), breakdown_titles):
+        with tab:
+            st.dataframe(tables[title], hide_index=True)
+    if current_data is None or previous_data is None:
+        st.caption("THE CATEGORY COMPARISON NEEDS BOTH FILES IN MEMORY - TURN OFF STREAMING MODE AND OPEN A SINGLE FILE.")
+
+    granularity = st.radio("GRANULARITY:", list(GRANULARITIES), horizontal=True, key='comparison_granularity')
+    with profile_stage('CHART: SALES OVER TIME COMPARISON', current.row_count + previous.row_count):
+        overlay = overlay_data(comparison_key, labels, current, previous, granularity)
+        fig = px.line(
+            overlay,
+            x=granularity,
+            y=list(labels),
+            title='SALES OVER TIME',
+            labels={granularity: f"{granularity} OF THE PERIOD", 'value': 'TOTAL SALES ($)', 'variable': 'PERIOD'},
+            line_shape='spline',
+            color_discrete_sequence=['#FF0000', '#FFFFFF']  # Red and white to match theme
+        )
+        fig.update_layout(**PLOT_LAYOUT)
+        fig.update_traces(line=dict(width=3), hovertemplate='%{x}: $%{y:.2f}')
+        show_chart(fig, 2 * len(overlay), current.row_count + previous.row_count)
+    return comparison_key, tables
+
+# Function to show the sales history kept in the rollups, optionally adding the current files to it
+# Only the added files' rows are aggregated; the totals and the chart are read from the rollups.
+def show_sales_history(rollups, sources):
+    st.write("### SALES HISTORY")
+    if sources and st.button("ADD THE CURRENT FILES TO THE SALES HISTORY"):
+        for name, source in sources:
+            try:
+                with profile_stage('APPEND TO ROLLUPS'):
+                    entry = rollups.append(source, name)
+            except SalesDataError as e:
+                st.error(f"{name}: {e}")
+                continue
+            if entry is None:
+                st.info(f"{name} IS ALREADY IN THE SALES HISTORY")
+            else:
+                st.success(f"ADDED {entry['rows']:,} ROWS FROM {name} TO THE SALES HISTORY")
+    # Totals are the same at every granularity, so they come from the smallest table
+    monthly = rollups.load('MONTH')
+    if monthly is None:
+        st.info("NO SALES HISTORY YET - ADD FILES TO START ONE.")
+        return
+    totals = rollup_totals(monthly)
+    st.caption(f"{len(rollups.sources())} FILES FROM {totals['FIRST PERIOD']:%m/%Y} TO {totals['LAST PERIOD']:%m/%Y}")
+    st.write(f"**TOTAL SALES:** ${totals['TOTAL SALES']:.2f}")
+    st.write(f"**NUMBER OF PURCHASES:** {totals['NUMBER OF PURCHASES']}")
+    st.write(f"**AVERAGE SPEND PER PURCHASE:** ${totals['AVERAGE SPEND PER PURCHASE']:.2f}")
+    st.write(f"**TOTAL ITEMS SOLD:** {totals['TOTAL ITEMS SOLD']}")
+    st.write(f"**TOTAL TAX PAID:** ${totals['TOTAL TAX PAID']:.2f}")
+    st.write(f"**AVERAGE SHIPPING COST:** ${totals['AVERAGE SHIPPING COST']:.2f}")
+
+    granularity = st.radio("GRANULARITY:", list(GRANULARITIES), index=2, horizontal=True, key='history_granularity')
+    split_by = st.selectbox("SPLIT BY:", ["None"] + ROLLUP_DIMENSIONS, key='history_split')
+    split_by = split_by if split_by != "None" else None
+    history_line = downsample_line(sales_over_time(rollups.load(granularity), split_by), 'Period', 'SALES', DEFAULT_POINT_BUDGET, split_by)
+    fig = px.line(
+        history_line,
+        x='Period',
+        y='SALES',
+        color=split_by,
+        title=f"SALES HISTORY BY {granularity}",
+        labels={'Period': granularity, 'SALES': 'TOTAL SALES ($)'},
+        color_discrete_sequence=['#FF0000'] if split_by is None else px.colors.sequential.Plasma
+    )
+    fig.update_layout(**PLOT_LAYOUT)
+    show_chart(fig, len(history_line), totals['NUMBER OF PURCHASES'])
+    history_anomalies = rollups.anomalies()
+    if history_anomalies is not None:
+        show_anomalies(SalesAnomalies(history_anomalies, None), key='history_anomalies')
 
 # Streamlit app setup
 # Sidebar for navigation (available on both pages)
@@ -580,6 +1211,13 @@ page = st.sidebar.radio("NAVIGATE", ["HOME", "ANALYSE SALES"], index=0 if st.ses
 if page != st.session_state.page:
     st.session_state.page = page
 
+# Opt-in profiling: every stage of this rerun is timed and its peak memory traced (which slows it down a little)
+profiling = st.sidebar.checkbox("PROFILING MODE")
+log_profiles = st.sidebar.checkbox(f"APPEND PROFILES TO {DEFAULT_PROFILE_LOG}", disabled=not profiling)
+profile = activate(RunProfile(st.session_state.page) if profiling else None)
+# PDF and Excel are built when their button is clicked, outside this rerun, and profiled as runs of their own
+export_profiles = st.session_state.setdefault('export_profiles', [])
+
 # Main content container
 with st.container():
     st.markdown('<div class="main-container">', unsafe_allow_html=True)
@@ -605,43 +1243,141 @@ with st.container():
         st.markdown('<p class="big-title">Data Analyser</p>', unsafe_allow_html=True)
         st.write("UPLOAD YOUR CSV FILE TO ANALYSE BUSINESS SALES DATA")
 
-        # File uploader for CSV
-        uploaded_file = st.file_uploader("CHOOSE A CSV FILE", type=["csv"])
-        if uploaded_file is not None:
+        # File uploader for one or more CSVs, a directory of CSVs, or a dataset ingested earlier (newest first)
+        uploaded_files = st.file_uploader("CHOOSE CSV FILES", type=["csv"], accept_multiple_files=True)
+        sales_directory = st.text_input("OR ANALYSE EVERY CSV FILE IN A DIRECTORY:")
+        store = get_dataset_store()
+        stored_datasets = sorted(store.list(), key=lambda dataset: dataset.ingested_at, reverse=True)
+        stored_keys = {dataset.label: dataset.key for dataset in stored_datasets}
+        picked_dataset = st.selectbox("OR OPEN A PREVIOUSLY INGESTED DATASET:", ["NONE"] + list(stored_keys))
+        streaming = st.checkbox("STREAMING MODE (LOW MEMORY, FOR VERY LARGE FILES)")
+        # DuckDB and Polars are offered when installed; they use every core and give the same metrics
+        backend = st.selectbox("ANALYSIS ENGINE:", available_backends())
+        supports_estimates = get_backend(backend).supports_estimates
+        approximate = st.checkbox(
+            "APPROXIMATE MODE (ESTIMATED DISTINCT COUNTS AND PERCENTILES IN CONSTANT MEMORY)", disabled=not supports_estimates
+        )
+        if not supports_estimates:
+            st.caption(f"THE {backend} ENGINE COMPUTES EXACT METRICS - APPROXIMATE MODE IS FOR THE PANDAS ENGINE.")
+        estimate_error = None
+        if approximate and supports_estimates:
+            estimate_error = st.select_slider(
+                "ESTIMATE ERROR BOUND (99% CONFIDENCE)",
+                options=[0.005, 0.01, 0.02, 0.05],
+                value=0.01,
+                format_func=lambda error: f"±{error * 100:.1f}%"
+            )
+        # Rows failing a data-quality check (bad dates, amounts or flags, repeated order lines) can be left out
+        drop_invalid = st.checkbox("DROP INVALID ROWS BEFORE ANALYSIS", disabled=backend != DEFAULT_BACKEND)
+        drop_invalid = drop_invalid and backend == DEFAULT_BACKEND
+        sources = collect_sources(uploaded_files, sales_directory)
+        if sales_directory and not uploaded_files and not sources:
+            st.warning(f"NO CSV FILES FOUND IN {sales_directory}")
+        if sources or picked_dataset != "NONE":
             try:
-                # Read the uploaded CSV file
-                data = pd.read_csv(uploaded_file)
-                st.write("FILE LOADED SUCCESSFULLY!")
+                # Convert each upload into a stored dataset (skipped when the same content is already stored)
+                # and analyse it in a background job, shared by every session analysing the same content.
+                # Several files are aggregated by a job each, in parallel, and merged.
+                st.session_state.analysis_cache_hit = True
+                file_breakdown = None
+                filtered_from = None
+                # Date ranges are compared within the rows before the sidebar filters, keeping the column filters
+                base_data = base_key = None
+                selections = ()
+                quality_report = None
+                try:
+                    if len(sources) > 1:
+                        analysis_key = (source_ids(sources), estimate_error, backend)
+                        label = f"{len(sources)} FILES"
+                        combined = analyse_many(analysis_key[0], sources, estimate_error, backend)
+                        data, (metrics, file_breakdown) = None, combined or (None, None)
+                    else:
+                        if sources:
+                            name, source = sources[0]
+                            dataset_id = source_ids(sources)[0]
+                        else:
+                            name, source, dataset_id = picked_dataset, None, stored_keys[picked_dataset]
+                        label = name
+                        analysed = analyse_one(name, source, dataset_id, streaming, estimate_error, backend, drop_invalid)
+                        dataset_key, data, metrics, quality_report = analysed or (None, None, None, None)
+                        analysis_key = (dataset_key, streaming, estimate_error, backend, drop_invalid)
+                    # Filtering needs the rows in memory; the index is built once per analysis
+                    if data is not None:
+                        base_data, base_key = data, analysis_key
+                        filters = filter_controls(filter_index(analysis_key, data))
+                        if filters is not None:
+                            selections = filters[1]
+                            filtered_from = len(data)
+                            with profile_stage('FILTER'):
+                                data, metrics = analyse_filtered(analysis_key, filters, data, filter_index(analysis_key, data), estimate_error)
+                            analysis_key = (analysis_key, filters)
+                    elif metrics is not None:
+                        st.sidebar.caption("FILTERS NEED THE FULL FILE IN MEMORY - TURN OFF STREAMING MODE AND OPEN A SINGLE FILE.")
+                except SalesDataError as e:
+                    st.error(str(e))
+                    data, metrics = None, None
+                except JobCancelled:
+                    st.warning("ANALYSIS CANCELLED - RERUN THE PAGE TO START IT AGAIN.")
+                    data, metrics = None, None
+                if metrics is not None:
+                    st.write("FILE LOADED SUCCESSFULLY!")
+                    if st.session_state.analysis_cache_hit:
+                        st.caption("CACHE: HIT - REUSING PARSED FILE AND METRICS")
+                    else:
+                        st.caption("CACHE: MISS - FILE PARSED AND ANALYSED")
+                    if filtered_from is not None:
+                        st.caption(f"FILTERED: {metrics.row_count:,} OF {filtered_from:,} ROWS")
+                    if file_breakdown is None:
+                        show_data_quality(quality_report)
+                    else:
+                        st.caption("DATA-QUALITY CHECKS RUN WHEN A SINGLE FILE IS OPENED.")
+                    if file_breakdown is not None:
+                        st.write(f"{len(file_breakdown)} FILES COMBINED")
+                        with st.expander("PER-FILE BREAKDOWN"):
+                            st.dataframe(file_breakdown, hide_index=True)
+                            st.download_button(
+                                label="DOWNLOAD PER-FILE BREAKDOWN",
+                                data=file_breakdown.to_csv(index=False),
+                                file_name="per_file_breakdown.csv",
+                                mime="text/csv"
+                            )
                 with st.container():
                     st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-                    summary_df = analyse_sales(data)
+                    summary_df = analyse_sales(data, metrics, analysis_key) if metrics is not None else None
                     if summary_df is not None:
+                        comparison = show_comparison(
+                            data, metrics, analysis_key, label, base_data, base_key, selections, streaming, estimate_error,
+                            backend, drop_invalid
+                        )
                         st.write("### DOWNLOAD YOUR RESULTS")
+                        include_rows = st.checkbox("INCLUDE THE CLEANED ROWS IN THE EXCEL FILE", disabled=data is None)
+                        with profile_stage('CSV EXPORT'):
+                            csv_report = generate_csv(summary_df, comparison[1] if comparison is not None else None)
+                        pdf_data = lambda: pdf_report(analysis_key, summary_df, metrics, data, comparison)
+                        excel_data = lambda: excel_report(analysis_key, summary_df, metrics, data, include_rows, comparison)
+                        if profiling:
+                            log_path = DEFAULT_PROFILE_LOG if log_profiles else None
+                            pdf_data = lambda build=pdf_data: run_profiled('PDF EXPORT', build, export_profiles, log_path)
+                            excel_data = lambda build=excel_data: run_profiled('EXCEL EXPORT', build, export_profiles, log_path)
                         col1, col2, col3 = st.columns(3)
                         with col1:
-                            csv_buffer = io.StringIO()
-                            summary_df.to_csv(csv_buffer, index=False)
                             st.download_button(
                                 label="DOWNLOAD CSV",
-                                data=csv_buffer.getvalue(),
+                                data=csv_report,
                                 file_name="data_analysis_report.csv",
                                 mime="text/csv"
                             )
                         with col2:
-                            pdf_buffer = generate_pdf(summary_df)
                             st.download_button(
                                 label="DOWNLOAD PDF",
-                                data=pdf_buffer,
+                                data=pdf_data,
                                 file_name="data_analysis_report.pdf",
                                 mime="application/pdf"
                             )
                         with col3:
-                            excel_buffer = io.BytesIO()
-                            summary_df.to_excel(excel_buffer, index=False, engine='openpyxl')
-                            excel_buffer.seek(0)
                             st.download_button(
                                 label="DOWNLOAD EXCEL",
-                                data=excel_buffer,
+                                data=excel_data,
                                 file_name="data_analysis_report.xlsx",
                                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                             )
@@ -649,9 +1385,25 @@ with st.container():
             except Exception as e:
                 st.error(f"ERROR: SOMETHING WENT WRONG WITH THE FILE - {e}")
         else:
-            st.info("PLEASE UPLOAD A CSV FILE TO PROCEED.")
+            st.info("PLEASE UPLOAD CSV FILES, CHOOSE A DIRECTORY OR OPEN AN INGESTED DATASET TO PROCEED.")
+        with profile_stage('SALES HISTORY'):
+            show_sales_history(get_rollup_store(), sources)
     else:
         st.markdown('<p class="big-title">Code Name - Data Analyser</p>', unsafe_allow_html=True)
         st.warning("PLEASE ENTER THE CORRECT PASSWORD ON THE HOME PAGE TO ACCESS THIS SECTION.")
 
-    st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# Profiling panel: where this rerun's time and memory went, then the latest PDF/Excel builds
+if profile is not None:
+    activate(None)
+    profile.finish()
+    if log_profiles:
+        append_to_log(profile)
+    with st.expander(f"PROFILE OF THIS RUN - {profile.total_seconds:.3f} S"):
+        st.dataframe(profile.table(), hide_index=True)
+        st.caption("PEAK MEMORY IS WHAT EACH STAGE ALLOCATED ON TOP OF WHAT WAS ALREADY IN USE. A CHART'S FIGURE BUILD IS ITS TIME LESS ITS DATA AND DRAW STAGES.")
+        del export_profiles[:-5]
+        for export_profile in reversed(export_profiles):
+            st.write(f"**{export_profile.label}** ({export_profile.started_at}) - {export_profile.total_seconds:.3f} S")
+            st.dataframe(export_profile.table(), hide_index=True)
\ No newline at end of file
@@ -0,0 +1,256 @@
+# Rolling-window anomaly detection over daily sales
+# Daily sales are laid out as one matrix of days by series: every Region x Product_Category
+# pair, each region, each category and the overall total. Each day is compared with the
+# window of days before it, for all series at once, using a robust z-score (distance from
+# the rolling median in units of the scaled median absolute deviation). Days far above
+# their baseline are spikes, days far below are drops. Single orders far above the typical
+# order are flagged as order outliers.
+# A series is only scored where its window averages enough purchases a day: a series of a few
+# orders a day swings by whole orders, which no robust scale captures.
+# Only the days asked for are scored, so after appending new days to a history the
+# anomalies are updated from the new days and the window before them.
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from sales_engine import _money
+
+# Days before a day that form its baseline
+DEFAULT_WINDOW_DAYS = 28
+# A series is scored once it had sales on this many days of the window (sparse series are too noisy)
+MIN_ACTIVE_DAYS = 7
+# ... and once its window averages this many purchases a day
+MIN_DAILY_PURCHASES = 10
+# Smallest scale of a series, as a share of its rolling median (keeps near-constant series from scoring every cent)
+MIN_SCALE_SHARE = 0.05
+# Robust z-score beyond which a day or an order is reported (Iglewicz and Hoaglin's 3.5)
+DEFAULT_Z_THRESHOLD = 3.5
+# Order outliers listed in the insights and the exports
+DEFAULT_ORDER_OUTLIERS = 50
+# Label of a series taken over every region or every category
+ALL_LABEL = 'ALL'
+# Scale that makes the median absolute deviation (and the mean absolute deviation) estimate a standard deviation
+_MAD_SCALE = 1.4826
+_MEAN_DEVIATION_SCALE = 1.2533
+# Days scored at a time (bounds the memory of the sliding windows)
+_BLOCK_DAYS = 64
+
+
+# Anomalies found in one dataset
+@dataclass
+class SalesAnomalies:
+    # One row per flagged day and series: DATE, REGION, CATEGORY, KIND, SALES ($), ROLLING MEDIAN ($),
+    # ROLLING MEAN ($), Z-SCORE; strongest first
+    days: pd.DataFrame
+    # One row per flagged order: ORDER, CUSTOMER, DATE, AMOUNT ($), Z-SCORE; largest first
+    orders: pd.DataFrame
+    window: int = DEFAULT_WINDOW_DAYS
+    threshold: float = DEFAULT_Z_THRESHOLD
+
+    @property
+    def spikes(self):
+        return self.days[self.days['KIND'] == 'SPIKE']
+
+    @property
+    def drops(self):
+        return self.days[self.days['KIND'] == 'DROP']
+
+
+# Function to name a series for the insights, e.g. "Cork - CATEGORY 15" or "ALL SALES"
+def series_label(region, category):
+    if region == ALL_LABEL and category == ALL_LABEL:
+        return "ALL SALES"
+    if category == ALL_LABEL:
+        return str(region)
+    if region == ALL_LABEL:
+        return f"CATEGORY {category}"
+    return f"{region} - CATEGORY {category}"
+
+
+# Function to total sales and count purchases per day, region and category from rows with a Full_Date column
+def daily_sales(data):
+    valid = data['Full_Date'].notna()
+    grouped = _money(data['Purchase_Amount'])[valid].groupby(
+        [data['Full_Date'][valid], data['Region'][valid], data['Product_Category'][valid]], observed=True
+    ).agg(['sum', 'size'])
+    grouped.columns = ['SALES', 'PURCHASES']
+    return grouped.rename_axis(['Period', 'Region', 'Product_Category']).reset_index()
+
+
+# Function to lay out a daily measure (Period, the measure column and optionally Region and Product_Category
+# columns) as a matrix
+# Returns the calendar of days, the series labels ((region, category) pairs) and the days x series matrix.
+# Days without any sale in the data are NaN, so a gap in the data is neither a drop nor part of a baseline.
+def sales_matrix(daily, measure='SALES'):
+    days = daily['Period'].to_numpy('datetime64[D]')
+    calendar = np.arange(days.min(), days.max() + 1)
+    day_codes = (days - days.min()).astype(np.int64)
+    region_codes, regions = _dimension_codes(daily, 'Region')
+    category_codes, categories = _dimension_codes(daily, 'Product_Category')
+    cells = (day_codes * len(regions) + region_codes) * len(categories) + category_codes
+    sales = np.nan_to_num(daily[measure].to_numpy(dtype=np.float64, na_value=np.nan))
+    cube = np.bincount(cells, weights=sales, minlength=len(calendar) * len(regions) * len(categories))
+    cube = cube.reshape(len(calendar), len(regions), len(categories))
+    # Pairs first, then each region, each category and the total, all from the same day x region x category cube
+    labels = [(region, category) for region in regions for category in categories]
+    blocks = [cube.reshape(len(calendar), -1)]
+    if len(regions) > 1 or regions[0] != ALL_LABEL:
+        labels += [(region, ALL_LABEL) for region in regions] + [(ALL_LABEL, category) for category in categories] + [(ALL_LABEL, ALL_LABEL)]
+        blocks += [cube.sum(axis=2), cube.sum(axis=1), cube.sum(axis=(1, 2))[:, None]]
+    matrix = np.hstack(blocks)
+    has_sales = np.bincount(day_codes, minlength=len(calendar)) > 0
+    matrix[~has_sales] = np.nan
+    return calendar, labels, matrix
+
+
+# Codes and labels of one dimension of the daily table (a single ALL series when the column is absent)
+def _dimension_codes(daily, column):
+    if column not in daily.columns:
+        return np.zeros(len(daily), dtype=np.int64), [ALL_LABEL]
+    codes, labels = pd.factorize(daily[column].astype(str), sort=True)
+    return codes.astype(np.int64), list(labels)
+
+
+# Median over the last axis, ignoring NaN (all-NaN slices give NaN)
+# Sorting puts NaN last, so the median sits at the middle of each slice's valid values;
+# unlike np.nanmedian this stays vectorized when some slices contain NaN.
+def _nan_median(values):
+    ordered = np.sort(values, axis=-1)
+    count = (~np.isnan(values)).sum(axis=-1, keepdims=True)
+    low = np.take_along_axis(ordered, np.maximum(count - 1, 0) // 2, axis=-1)
+    high = np.take_along_axis(ordered, np.minimum(count // 2, values.shape[-1] - 1), axis=-1)
+    return np.where(count > 0, (low + high) / 2, np.nan)[..., 0]
+
+
+# Function to compute, for each day from start and each series, the rolling median, mean and robust z-score
+# of that day against the window days before it. purchases is the matching matrix of purchase counts.
+# Returns three (days scored) x series arrays; NaN where a series has too few active days or purchases in
+# its window, or the day has no data.
+def rolling_scores(matrix, window=DEFAULT_WINDOW_DAYS, start=0, purchases=None):
+    padded = np.vstack([np.full((window, matrix.shape[1]), np.nan), matrix])
+    # windows[t] holds the window days before day t
+    windows = sliding_window_view(padded, window, axis=0)
+    purchase_windows = None
+    if purchases is not None:
+        purchase_windows = sliding_window_view(np.vstack([np.full((window, matrix.shape[1]), np.nan), purchases]), window, axis=0)
+    medians, means, scores = [], [], []
+    with warnings.catch_warnings():
+        # Windows of missing days give all-NaN slices
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for block_start in range(start, matrix.shape[0], _BLOCK_DAYS):
+            block = windows[block_start:min(block_start + _BLOCK_DAYS, matrix.shape[0])]
+            values = matrix[block_start:block_start + len(block)]
+            median = _nan_median(block)
+            mean = np.nanmean(block, axis=-1)
+            scale = _MAD_SCALE * _nan_median(np.abs(block - median[..., None]))
+            # Series that are flat most days have no median deviation; their mean deviation is used instead
+            fallback = _MEAN_DEVIATION_SCALE * np.nanmean(np.abs(block - mean[..., None]), axis=-1)
+            scale = np.maximum(np.where(scale > 0, scale, fallback), MIN_SCALE_SHARE * np.abs(median))
+            active = (block > 0).sum(axis=-1) >= min(MIN_ACTIVE_DAYS, window)
+            if purchase_windows is not None:
+                daily_purchases = np.nanmean(purchase_windows[block_start:block_start + len(block)], axis=-1)
+                active &= daily_purchases >= MIN_DAILY_PURCHASES
+                # A day's purchase count alone varies by about its square root (Poisson)
+                scale = np.maximum(scale, np.abs(median) / np.sqrt(np.maximum(daily_purchases, 1)))
+            score = np.divide(values - median, scale, out=np.full(values.shape, np.nan), where=active & (scale > 0))
+            medians.append(median)
+            means.append(mean)
+            scores.append(score)
+    if not scores:
+        empty = np.empty((0, matrix.shape[1]))
+        return empty, empty, empty
+    return np.vstack(medians), np.vstack(means), np.vstack(scores)
+
+
+# Function to find the days of each series whose sales are far from their rolling baseline
+# Only days on or after start (a date; all days by default) are scored; the days before it serve as baseline.
+# With a PURCHASES column, series averaging too few purchases a day are left unscored.
+def detect_day_anomalies(daily, window=DEFAULT_WINDOW_DAYS, threshold=DEFAULT_Z_THRESHOLD, start=None):
+    if daily.empty:
+        return _empty_day_anomalies()
+    calendar, labels, matrix = sales_matrix(daily)
+    purchases = sales_matrix(daily, 'PURCHASES')[2] if 'PURCHASES' in daily.columns else None
+    first_scored = 0 if start is None else int(np.searchsorted(calendar, np.datetime64(start, 'D')))
+    medians, means, scores = rolling_scores(matrix, window, first_scored, purchases)
+    day_index, series_index = np.nonzero(np.abs(np.nan_to_num(scores)) >= threshold)
+    flagged = scores[day_index, series_index]
+    labels = np.array(labels, dtype=object).reshape(-1, 2)
+    table = pd.DataFrame({
+        'DATE': calendar[first_scored + day_index].astype('datetime64[ns]'),
+        'REGION': labels[series_index, 0],
+        'CATEGORY': labels[series_index, 1],
+        'KIND': np.where(flagged > 0, 'SPIKE', 'DROP'),
+        'SALES ($)': matrix[first_scored + day_index, series_index].round(2),
+        'ROLLING MEDIAN ($)': medians[day_index, series_index].round(2),
+        'ROLLING MEAN ($)': means[day_index, series_index].round(2),
+        'Z-SCORE': flagged.round(2),
+    })
+    return table.iloc[np.argsort(-np.abs(flagged), kind='stable')].reset_index(drop=True)
+
+
+def _empty_day_anomalies():
+    return pd.DataFrame({
+        'DATE': pd.Series(dtype='datetime64[ns]'), 'REGION': pd.Series(dtype=object), 'CATEGORY': pd.Series(dtype=object),
+        'KIND': pd.Series(dtype=object), 'SALES ($)': pd.Series(dtype=float), 'ROLLING MEDIAN ($)': pd.Series(dtype=float),
+        'ROLLING MEAN ($)': pd.Series(dtype=float), 'Z-SCORE': pd.Series(dtype=float),
+    })
+
+
+# Function to find the orders whose total is far above the typical order (robust z-score over every order)
+def detect_order_outliers(data, threshold=DEFAULT_Z_THRESHOLD, limit=DEFAULT_ORDER_OUTLIERS):
+    amounts = _money(data['Purchase_Amount'])
+    orders = pd.DataFrame({'Order_ID': data['Order_ID'], 'AMOUNT ($)': amounts}).groupby('Order_ID', sort=False)['AMOUNT ($)'].sum()
+    totals = orders.to_numpy(dtype=np.float64)
+    median = np.median(totals) if len(totals) else 0.0
+    scale = _MAD_SCALE * np.median(np.abs(totals - median)) if len(totals) else 0.0
+    if scale == 0:
+        scale = _MEAN_DEVIATION_SCALE * np.mean(np.abs(totals - totals.mean())) if len(totals) else 0.0
+    if scale == 0:
+        return pd.DataFrame(columns=['ORDER', 'CUSTOMER', 'DATE', 'AMOUNT ($)', 'Z-SCORE'])
+    scores = (totals - median) / scale
+    flagged = np.flatnonzero(scores >= threshold)
+    flagged = flagged[np.argsort(-scores[flagged], kind='stable')][:limit]
+    # Customer and date of each flagged order, from its first row
+    order_ids = orders.index[flagged]
+    first_rows = data.loc[data['Order_ID'].isin(order_ids), ['Order_ID', 'Customer_ID', 'Full_Date']]
+    first_rows = first_rows.drop_duplicates('Order_ID').set_index('Order_ID')
+    return pd.DataFrame({
+        'ORDER': order_ids.astype(str),
+        'CUSTOMER': first_rows['Customer_ID'].reindex(order_ids).astype(str).to_numpy(),
+        'DATE': first_rows['Full_Date'].reindex(order_ids).to_numpy(),
+        'AMOUNT ($)': totals[flagged].round(2),
+        'Z-SCORE': scores[flagged].round(2),
+    })
+
+
+# Function to find the day and order anomalies of a dataset
+# With the rows (data), every Region x Product_Category series is scored and orders are checked;
+# without them only the overall daily series (metrics.sales_by_date) is, its purchases a day estimated
+# from the average purchase.
+def find_anomalies(metrics, data=None, window=DEFAULT_WINDOW_DAYS, threshold=DEFAULT_Z_THRESHOLD):
+    if data is None:
+        daily = metrics.sales_by_date.rename('SALES').rename_axis('Period').reset_index()
+        if metrics.avg_spend:
+            daily['PURCHASES'] = daily['SALES'] / metrics.avg_spend
+        return SalesAnomalies(detect_day_anomalies(daily, window, threshold), None, window, threshold)
+    days = detect_day_anomalies(daily_sales(data), window, threshold)
+    return SalesAnomalies(days, detect_order_outliers(data, threshold), window, threshold)
+
+
+# Function to bring stored day anomalies up to date after new days were added to a daily history
+# Only the new days and the window days after them (whose baseline changed) are rescored, from a slice
+# of the history reaching window days further back; the other days keep their stored anomalies.
+def update_day_anomalies(stored, history, new_days, window=DEFAULT_WINDOW_DAYS, threshold=DEFAULT_Z_THRESHOLD):
+    new_days = pd.to_datetime(pd.Series(new_days))
+    first, last = new_days.min(), new_days.max() + pd.Timedelta(days=window)
+    periods = history['Period']
+    affected = history[(periods >= first - pd.Timedelta(days=window)) & (periods <= last)]
+    rescored = detect_day_anomalies(affected, window, threshold, start=first)
+    if stored is None:
+        return rescored
+    kept = stored[(stored['DATE'] < first) | (stored['DATE'] > last)]
+    combined = pd.concat([kept, rescored], ignore_index=True)
+    return combined.iloc[np.argsort(-combined['Z-SCORE'].abs().to_numpy(), kind='stable')].reset_index(drop=True)
@@ -0,0 +1,390 @@
+# Execution backends for the sales metrics
+# A backend reads a sales CSV, or a Parquet dataset from the store, and computes the partial
+# aggregates of SalesAccumulator.from_frame. SalesAccumulator.finalize then turns them into
+# the metrics, so every backend gives the pandas path's results.
+# PANDAS loads the file into a DataFrame. DUCKDB and POLARS query the file in their own
+# multi-threaded columnar engines, and only the aggregates (tallies, per-day and per-region
+# sums, distinct values) are handed to pandas. Both are optional: a backend is only offered
+# when its package is installed.
+#
+#   python sales_backends.py exports/sales_2025.csv --backend DUCKDB --check
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from sales_engine import (
+    DISTINCT_COLUMNS, NUMERIC_COLUMNS, TALLY_COLUMNS, YES_COUNT_COLUMNS, SalesAccumulator, build_summary_df,
+)
+from sales_schema import (
+    FLAG_COLUMNS, MONEY_COLUMNS, NULL_VALUES, SALES_COLUMNS, SALES_DTYPES, SalesDataError, arrow_to_frame,
+    read_sales_csv, validate_columns,
+)
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+DEFAULT_BACKEND = 'PANDAS'
+
+_NUMBER_COLUMNS = [column for column, dtype in SALES_DTYPES.items() if dtype in ('Int16', 'Int32', 'float32')]
+# Day_Month values pandas can parse with '%d/%m' (Python's strptime also takes a space-padded day);
+# the year must have four digits
+_DAY_MONTH_PATTERN = r'^(3[01]|[12][0-9]|0[1-9]|[1-9]| [1-9])/(1[0-2]|0[1-9]|[1-9])$'
+
+
+# Function to tell a Parquet dataset from a CSV by its file name
+def _is_parquet(source):
+    return Path(source).suffix.lower() == '.parquet'
+
+
+# Function to check that a file has every sales column before it is queried
+def _validate_source(source):
+    if _is_parquet(source):
+        validate_columns(pq.read_schema(source).names)
+    else:
+        validate_columns(pd.read_csv(source, nrows=0).columns)
+
+
+# Function to turn (value, count) rows into a tally like _value_counts returns
+def _tally(table, column):
+    return pd.Series(table['n'].to_numpy(dtype=np.int64), index=pd.Index(table['value'], name=column), name='count')
+
+
+# Function to fill a SalesAccumulator from the results of a columnar backend
+# results holds the row counts and per-column sums/counts (scalars), the tallies, the distinct
+# values, the per-amount tally, the per-region and per-day sales and the top purchase.
+def _accumulator_from_results(results):
+    scalars = results['scalars']
+    acc = SalesAccumulator()
+    acc.row_count = int(scalars['rows'])
+    acc.valid_dates = int(scalars['valid_dates'])
+    for column in NUMERIC_COLUMNS:
+        total = scalars[f"sum {column}"] or 0
+        acc.sums[column] = np.float64(total) if column in MONEY_COLUMNS else np.int64(total)
+        acc.counts[column] = int(scalars[f"count {column}"])
+    for column in TALLY_COLUMNS:
+        acc.tallies[column] = _tally(results['tallies'][column], column)
+    for column in YES_COUNT_COLUMNS:
+        acc.yes_counts[column] = int(scalars[f"yes {column}"])
+    for column in DISTINCT_COLUMNS:
+        acc.distinct[column] = pd.Index(results['distinct'][column])
+    acc.customer_counts = _tally(results['tallies']['Customer_ID'], 'Customer_ID')
+    acc.amounts = _tally(results['amounts'], 'Purchase_Amount')
+    regions = results['regions']
+    acc.sales_by_region = pd.Series(
+        regions['sales'].to_numpy(dtype=np.float64), index=pd.Index(regions['value'], name='Region'), name='Purchase_Amount'
+    )
+    dates = results['dates']
+    acc.sales_by_date = pd.Series(
+        dates['sales'].to_numpy(dtype=np.float64), index=pd.DatetimeIndex(dates['value'], name='Full_Date'), name='Purchase_Amount'
+    )
+    if results['top'] is not None:
+        amount, customer, day_month = results['top']
+        acc.top_spender = (np.float64(amount), customer, day_month)
+    return acc
+
+
+# Reads the file into a DataFrame and aggregates it with pandas (single-threaded)
+class PandasBackend:
+    name = 'PANDAS'
+    # Only the pandas engine has the approximate (sketch-based) mode
+    supports_estimates = True
+
+    def __init__(self, threads=None):
+        self.threads = threads
+
+    @staticmethod
+    def available():
+        return True
+
+    # Function to compute the partial aggregates of a sales CSV or Parquet dataset
+    def aggregate(self, source, sketch_settings=None):
+        if _is_parquet(source):
+            _validate_source(source)
+            data = arrow_to_frame(pq.read_table(source, memory_map=True))
+        else:
+            data = read_sales_csv(source)
+        return SalesAccumulator.from_frame(data, sketch_settings)
+
+    # Function to compute every metric of a sales CSV or Parquet dataset
+    def compute_metrics(self, source, sketch_settings=None):
+        return self.aggregate(source, sketch_settings).finalize()
+
+
+# Shared flow of the DuckDB and Polars backends; subclasses run the queries in _query
+# The columnar engines compute exact metrics, so sketch settings are ignored.
+class _ColumnarBackend(PandasBackend):
+    supports_estimates = False
+    package = None
+    errors = ()
+
+    @classmethod
+    def available(cls):
+        return cls.package is not None
+
+    def aggregate(self, source, sketch_settings=None):
+        if not self.available():
+            raise SalesDataError(f"THE {self.name} ENGINE IS NOT INSTALLED - pip install {self.name.lower()}")
+        source = str(source)
+        _validate_source(source)
+        try:
+            results = self._query(source)
+        except self.errors as e:
+            raise SalesDataError(f"SCHEMA ISSUE: A column does not match its expected type - {e}")
+        return _accumulator_from_results(results)
+
+    def compute_metrics(self, source, sketch_settings=None):
+        return self.aggregate(source).finalize()
+
+
+# Queries the file with DuckDB, in-process and on every core
+# A CSV is loaded once into a DuckDB table (its rowid keeps the file's row order); a Parquet
+# dataset is scanned in place, reading only the columns each query needs.
+class DuckDBBackend(_ColumnarBackend):
+    name = 'DUCKDB'
+    package = duckdb
+    errors = (duckdb.ConversionException, duckdb.InvalidInputException) if duckdb is not None else ()
+
+    # Function to load the file as the facts view: the typed columns, the row number (_row),
+    # the amount in cents (amount) and the parsed Full_Date
+    def _facts(self, connection, source):
+        path = source.replace("'", "''")
+        if _is_parquet(source):
+            connection.execute(f"CREATE VIEW sales AS SELECT *, file_row_number AS _row FROM read_parquet('{path}', file_row_number=true)")
+        else:
+            # Every column is read as text, with the schema's NA strings as missing, and numbers are cast
+            # here: integers through DOUBLE, so "4.0" is read as 4 while 4.5 fails, as in the pandas reader
+            typed = []
+            for column in SALES_COLUMNS:
+                if SALES_DTYPES[column] == 'float32':
+                    typed.append(f'CAST("{column}" AS FLOAT) AS "{column}"')
+                elif column in _NUMBER_COLUMNS:
+                    sql_type = {'Int16': 'SMALLINT', 'Int32': 'INTEGER'}[SALES_DTYPES[column]]
+                    number = f'CAST("{column}" AS DOUBLE)'
+                    typed.append(
+                        f"CASE WHEN {number} <> trunc({number}) THEN error('{column} is not a whole number: ' || \"{column}\") "
+                        f'ELSE CAST({number} AS {sql_type}) END AS "{column}"'
+                    )
+                else:
+                    typed.append(f'"{column}"')
+            nulls = ', '.join(f"'{token}'" for token in NULL_VALUES)
+            connection.execute(
+                f"CREATE TABLE csv_rows AS SELECT {', '.join(typed)} FROM read_csv('{path}', header=true, delim=',', quote='\"', "
+                f"all_varchar=true, nullstr=[{nulls}])"
+            )
+            connection.execute("CREATE VIEW sales AS SELECT *, rowid AS _row FROM csv_rows")
+        flags = ', '.join(
+            f"CASE WHEN \"{column}\" IN ('Yes', 'No') THEN \"{column}\" END AS \"{column}\"" for column in FLAG_COLUMNS
+        )
+        connection.execute(f"""
+            CREATE VIEW facts AS SELECT * REPLACE ({flags}),
+                round_even(CAST(Purchase_Amount AS DOUBLE), 2) AS amount,
+                CASE WHEN regexp_matches(Day_Month, '{_DAY_MONTH_PATTERN}') AND Year BETWEEN 1000 AND 9999
+                     THEN try_strptime(ltrim(Day_Month) || '/' || CAST(Year AS VARCHAR), '%d/%m/%Y') END AS Full_Date
+            FROM sales
+        """)
+
+    def _query(self, source):
+        connection = duckdb.connect()
+        try:
+            if self.threads:
+                connection.execute(f"SET threads = {int(self.threads)}")
+            self._facts(connection, source)
+            frame = lambda sql: connection.execute(sql).df()
+
+            # Money is summed with compensated (Kahan) summation; a plain sum of doubles drifts further from pandas'
+            values = {column: f'round_even(CAST("{column}" AS DOUBLE), 2)' if column in MONEY_COLUMNS else f'"{column}"'
+                      for column in NUMERIC_COLUMNS}
+            selected = ['count(*) AS "rows"', 'count(Full_Date) AS "valid_dates"']
+            for column, value in values.items():
+                total = 'fsum' if column in MONEY_COLUMNS else 'sum'
+                selected += [f'{total}({value}) AS "sum {column}"', f'count({value}) AS "count {column}"']
+            selected += [f"count(*) FILTER (WHERE \"{column}\" = 'Yes') AS \"yes {column}\"" for column in YES_COUNT_COLUMNS]
+            scalars = frame(f"SELECT {', '.join(selected)} FROM facts").iloc[0].to_dict()
+
+            # Tallies list values in order of first appearance, as the pandas tallies do
+            tally = lambda column: frame(
+                f'SELECT "{column}" AS value, count(*) AS n FROM facts WHERE "{column}" IS NOT NULL '
+                f'GROUP BY "{column}" ORDER BY min(_row)'
+            )
+            top = connection.execute(
+                "SELECT amount, Customer_ID, Day_Month FROM facts WHERE amount IS NOT NULL ORDER BY amount DESC, _row LIMIT 1"
+            ).fetchone()
+            return {
+                'scalars': scalars,
+                'tallies': {column: tally(column) for column in TALLY_COLUMNS + ['Customer_ID']},
+                'distinct': {
+                    column: frame(f'SELECT DISTINCT "{column}" AS value FROM facts WHERE "{column}" IS NOT NULL')['value']
+                    for column in DISTINCT_COLUMNS
+                },
+                'amounts': frame("SELECT amount AS value, count(*) AS n FROM facts WHERE amount IS NOT NULL GROUP BY amount"),
+                'regions': frame(
+                    "SELECT Region AS value, coalesce(fsum(amount), 0) AS sales FROM facts WHERE Region IS NOT NULL "
+                    "GROUP BY Region ORDER BY min(_row)"
+                ),
+                'dates': frame(
+                    "SELECT Full_Date AS value, coalesce(fsum(amount), 0) AS sales FROM facts WHERE Full_Date IS NOT NULL "
+                    "GROUP BY Full_Date ORDER BY Full_Date"
+                ),
+                'top': top,
+            }
+        finally:
+            connection.close()
+
+
+# Function to cast a text column to a Polars number type, failing on fractions in integer columns
+# (a fraction becomes NaN, which a strict cast to an integer type rejects)
+def _polars_number(column, number_type):
+    number = pl.col(column).cast(pl.Float64, strict=True)
+    if number_type == pl.Float32:
+        return number.cast(pl.Float32).alias(column)
+    whole = pl.when(number.is_null() | (number == number.floor())).then(number).otherwise(float('nan'))
+    return whole.cast(number_type, strict=True).alias(column)
+
+
+# Queries the file with Polars' lazy engine, on every core
+# All the aggregates are collected in one call, so Polars can share the scan between them. It sizes its
+# thread pool once per process (POLARS_MAX_THREADS), so threads does not apply here.
+class PolarsBackend(_ColumnarBackend):
+    name = 'POLARS'
+    package = pl
+    errors = (pl.exceptions.InvalidOperationError, pl.exceptions.ComputeError) if pl is not None else ()
+
+    # Function to build the facts frame: the typed columns, the row number (_row),
+    # the amount in cents (amount) and the parsed Full_Date
+    def _facts(self, source):
+        if _is_parquet(source):
+            frame = pl.scan_parquet(source).with_columns(
+                pl.col(column).cast(pl.String) for column in SALES_COLUMNS if column not in _NUMBER_COLUMNS
+            )
+        else:
+            # Every column is read as text and the schema's NA strings are masked as missing (several times
+            # faster than the scanner's null_values); numbers are cast here, integers through Float64, so
+            # "4.0" is read as 4 while 4.5 fails, as in the pandas reader
+            types = {'Int16': pl.Int16, 'Int32': pl.Int32, 'float32': pl.Float32}
+            frame = pl.scan_csv(source, infer_schema=False).with_columns(
+                pl.when(pl.all().is_in(NULL_VALUES)).then(None).otherwise(pl.all()).name.keep()
+            ).with_columns(
+                _polars_number(column, types[SALES_DTYPES[column]]) for column in _NUMBER_COLUMNS
+            )
+        day_month = pl.col('Day_Month')
+        valid_date = day_month.str.contains(_DAY_MONTH_PATTERN) & pl.col('Year').is_between(1000, 9999)
+        return frame.with_row_index('_row').with_columns(
+            *(pl.when(pl.col(column).is_in(['Yes', 'No'])).then(pl.col(column)).alias(column) for column in FLAG_COLUMNS),
+            amount=pl.col('Purchase_Amount').cast(pl.Float64).round(2, mode='half_to_even'),
+            Full_Date=pl.when(valid_date).then(
+                (day_month.str.strip_chars_start() + '/' + pl.col('Year').cast(pl.String)).str.to_date('%d/%m/%Y', strict=False)
+            ),
+        )
+
+    def _query(self, source):
+        facts = self._facts(source)
+        values = {column: pl.col(column).cast(pl.Float64).round(2, mode='half_to_even') if column in MONEY_COLUMNS else pl.col(column)
+                  for column in NUMERIC_COLUMNS}
+        scalars = facts.select(
+            pl.len().alias('rows'),
+            pl.col('Full_Date').count().alias('valid_dates'),
+            *(value.sum().alias(f"sum {column}") for column, value in values.items()),
+            *(value.count().alias(f"count {column}") for column, value in values.items()),
+            *((pl.col(column) == 'Yes').sum().alias(f"yes {column}") for column in YES_COUNT_COLUMNS),
+        )
+
+        # Tallies list values in order of first appearance, as the pandas tallies do
+        def grouped(column, *aggregates, order='_row'):
+            return (facts.filter(pl.col(column).is_not_null()).group_by(column)
+                    .agg(*aggregates, pl.col('_row').min()).sort(order).rename({column: 'value'}).select(pl.exclude('_row')))
+
+        tally_columns = TALLY_COLUMNS + ['Customer_ID']
+        queries = [scalars]
+        queries += [grouped(column, pl.len().alias('n')) for column in tally_columns]
+        queries += [facts.select(pl.col(column).drop_nulls().unique()) for column in DISTINCT_COLUMNS]
+        queries += [
+            facts.filter(pl.col('amount').is_not_null()).group_by('amount').agg(pl.len().alias('n')).rename({'amount': 'value'}),
+            grouped('Region', pl.col('amount').sum().alias('sales')),
+            grouped('Full_Date', pl.col('amount').sum().alias('sales'), order='Full_Date'),
+            facts.filter(pl.col('amount').is_not_null()).sort(['amount', '_row'], descending=[True, False])
+            .head(1).select('amount', 'Customer_ID', 'Day_Month'),
+        ]
+        results = pl.collect_all(queries)
+
+        tallies = dict(zip(tally_columns, results[1:1 + len(tally_columns)]))
+        position = 1 + len(tally_columns)
+        distinct = results[position:position + len(DISTINCT_COLUMNS)]
+        amounts, regions, dates, top = results[position + len(DISTINCT_COLUMNS):]
+        return {
+            'scalars': results[0].row(0, named=True),
+            'tallies': {column: table.to_pandas() for column, table in tallies.items()},
+            'distinct': {column: table.to_series().to_numpy() for column, table in zip(DISTINCT_COLUMNS, distinct)},
+            'amounts': amounts.to_pandas(),
+            'regions': regions.to_pandas(),
+            'dates': dates.to_pandas(),
+            'top': top.row(0) if len(top) else None,
+        }
+
+
+BACKENDS = {backend.name: backend for backend in [PandasBackend, DuckDBBackend, PolarsBackend]}
+
+
+# Names of the backends whose packages are installed
+def available_backends():
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+# Function to create a backend by name (threads caps the cores a columnar engine uses)
+def get_backend(name=DEFAULT_BACKEND, threads=None):
+    if name not in BACKENDS:
+        raise SalesDataError(f"UNKNOWN ENGINE {name} - choose one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](threads)
+
+
+# Function to compare two summary tables row by row
+# Returns (metric, expected, actual) for every row that differs.
+def summary_differences(expected, actual):
+    return [
+        (metric, want, got)
+        for metric, want, got in zip(expected['METRIC'], expected['VALUE'], actual['VALUE'])
+        if str(want) != str(got)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute the sales metrics of CSV or Parquet files with a chosen engine.")
+    parser.add_argument('files', nargs='+', help="sales CSV files or stored Parquet datasets")
+    parser.add_argument('--backend', choices=list(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument('--threads', type=int, default=None, help="cores the DuckDB engine may use (default: all)")
+    parser.add_argument('--check', action='store_true', help="also run the pandas engine and report any differing metric")
+    args = parser.parse_args(argv)
+
+    backend = get_backend(args.backend, args.threads)
+    failed = 0
+    for path in args.files:
+        try:
+            start = time.perf_counter()
+            summary_df = build_summary_df(backend.compute_metrics(path))
+            elapsed = time.perf_counter() - start
+            print(f"{path} ({backend.name}, {elapsed:.2f} S)")
+            print(summary_df.to_string(index=False))
+            if args.check and backend.name != 'PANDAS':
+                differences = summary_differences(build_summary_df(PandasBackend().compute_metrics(path)), summary_df)
+                for metric, want, got in differences:
+                    print(f"MISMATCH {metric}: PANDAS {want} - {backend.name} {got}")
+                failed += bool(differences)
+        except SalesDataError as e:
+            failed += 1
+            print(f"SKIPPED {path}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
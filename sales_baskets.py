@@ -0,0 +1,127 @@
+# Market-basket analysis: products frequently bought together
+# Each basket (an order, or all of a customer's purchases) is reduced to its distinct
+# products, as integer codes. Products in fewer baskets than the minimum support are
+# dropped first, since no pair containing them can reach it. The pairs inside every basket
+# are then generated as int64 keys, one vectorized step per distance between two items
+# of a sorted basket, and counted. Only pairs that occur are ever held, so catalogues of
+# hundreds of thousands of products never need a products x products table.
+import math
+
+import numpy as np
+import pandas as pd
+
+# What a basket is: the products of one order, or every product a customer bought
+BASKET_COLUMNS = {'ORDER': 'Order_ID', 'CUSTOMER': 'Customer_ID'}
+# Smallest share of baskets a product and a pair must be in (never fewer than MIN_BASKETS baskets)
+DEFAULT_MIN_SUPPORT = 0.0001
+MIN_BASKETS = 2
+# Baskets with more distinct products than this are left out (their pairs grow with the square of their size)
+MAX_BASKET_PRODUCTS = 100
+# Partners listed per product, and pairs written to the export
+DEFAULT_TOP_PARTNERS = 5
+DEFAULT_EXPORT_PAIRS = 1000
+
+
+# Function to pick the basket of a dataset: orders when some order has several rows, customers otherwise
+def default_basket(data):
+    orders = data['Order_ID'].dropna()
+    return 'ORDER' if orders.nunique() < len(orders) else 'CUSTOMER'
+
+
+# Pair counts of one dataset's baskets, above a minimum support
+class BasketPairs:
+    def __init__(self, data, basket=None, min_support=DEFAULT_MIN_SUPPORT):
+        self.basket = basket or default_basket(data)
+        self.min_support = min_support
+        basket_codes, _ = pd.factorize(data[BASKET_COLUMNS[self.basket]])
+        product_codes, products = pd.factorize(data['Product_ID'])
+        self.products = pd.Index(products).astype(str)
+        valid = (basket_codes >= 0) & (product_codes >= 0)
+        # Distinct (basket, product) pairs
+        items = pd.unique(basket_codes[valid].astype(np.int64) * len(products) + product_codes[valid])
+        baskets, item_products = items // len(products), items % len(products)
+        self.basket_count = int(len(pd.unique(baskets)))
+        self.product_counts = np.bincount(item_products, minlength=len(products))
+        self.min_baskets = max(MIN_BASKETS, math.ceil(min_support * self.basket_count))
+
+        # Products below the minimum support cannot be part of a frequent pair
+        frequent = self.product_counts[item_products] >= self.min_baskets
+        baskets, item_products = baskets[frequent], item_products[frequent]
+        order = np.lexsort((item_products, baskets))
+        baskets, item_products = baskets[order], item_products[order]
+        sizes = np.bincount(pd.factorize(baskets)[0]) if len(baskets) else np.zeros(0, dtype=np.int64)
+        kept = np.repeat(sizes <= MAX_BASKET_PRODUCTS, sizes)
+        baskets, item_products = baskets[kept], item_products[kept]
+
+        # The frequent products are renumbered densely, so a pair key fits in 32 bits for up to 46,000 of them
+        frequent_products, item_codes = np.unique(item_products, return_inverse=True)
+        width = max(len(frequent_products), 1)
+        key_type = np.int32 if width * width < 2 ** 31 else np.int64
+        item_codes = item_codes.astype(key_type)
+        # Items d apart in the same sorted basket form its pairs at distance d (first product < second)
+        keys = []
+        for distance in range(1, int(sizes[sizes <= MAX_BASKET_PRODUCTS].max(initial=1))):
+            same = baskets[:-distance] == baskets[distance:]
+            keys.append(item_codes[:-distance][same] * key_type(width) + item_codes[distance:][same])
+        # Sorted keys are counted by the length of each run of equal keys
+        keys = np.sort(np.concatenate(keys)) if keys else np.zeros(0, dtype=key_type)
+        starts = np.flatnonzero(np.diff(keys, prepend=keys[:1] - 1)) if len(keys) else np.zeros(0, dtype=np.int64)
+        counts = np.diff(np.append(starts, len(keys)))
+        frequent_pairs = counts >= self.min_baskets
+        pair_keys = keys[starts[frequent_pairs]].astype(np.int64)
+        self.first = frequent_products[pair_keys // width]
+        self.second = frequent_products[pair_keys % width]
+        self.pair_counts = counts[frequent_pairs]
+        self._pairs = None
+
+    # Function to return every frequent pair with its support, confidence both ways and lift, strongest first
+    def pairs(self):
+        if self._pairs is None:
+            first_counts = self.product_counts[self.first]
+            second_counts = self.product_counts[self.second]
+            table = pd.DataFrame({
+                'PRODUCT A': self._labels(self.first),
+                'PRODUCT B': self._labels(self.second),
+                'BASKETS': self.pair_counts,
+                'SUPPORT (%)': self.pair_counts / self.basket_count * 100,
+                'CONFIDENCE A->B (%)': self.pair_counts / first_counts * 100,
+                'CONFIDENCE B->A (%)': self.pair_counts / second_counts * 100,
+                'LIFT': self.pair_counts * self.basket_count / (first_counts.astype(np.float64) * second_counts),
+            })
+            order = np.lexsort((-table['LIFT'].to_numpy(), -self.pair_counts))
+            self._pairs = table.iloc[order].reset_index(drop=True)
+        return self._pairs
+
+    # Product codes as a categorical of the product labels (no per-row strings)
+    def _labels(self, codes):
+        return pd.Categorical.from_codes(codes, categories=self.products)
+
+    # Function to list each product's top partners by lift (then by baskets together), or one product's
+    # Returns PRODUCT, PARTNER, BASKETS, CONFIDENCE (%) (of the partner given the product) and LIFT.
+    def top_partners(self, top=DEFAULT_TOP_PARTNERS, product=None):
+        # Every pair read both ways
+        product_codes = np.concatenate([self.first, self.second])
+        partner_codes = np.concatenate([self.second, self.first])
+        baskets = np.concatenate([self.pair_counts, self.pair_counts])
+        product_counts = self.product_counts[product_codes]
+        lift = baskets * self.basket_count / (product_counts.astype(np.float64) * self.product_counts[partner_codes])
+        chosen = np.arange(len(product_codes))
+        if product is not None:
+            chosen = np.flatnonzero(product_codes == self.products.get_indexer([product])[0])
+        order = chosen[np.lexsort((-baskets[chosen], -lift[chosen], product_codes[chosen]))]
+        # Rank of each row within its product, from where the product's run starts
+        sorted_products = product_codes[order]
+        run_starts = np.flatnonzero(np.diff(sorted_products, prepend=-1))
+        ranks = np.arange(len(order)) - np.repeat(run_starts, np.diff(np.append(run_starts, len(order))))
+        order = order[ranks < top]
+        return pd.DataFrame({
+            'PRODUCT': self._labels(product_codes[order]),
+            'PARTNER': self._labels(partner_codes[order]),
+            'BASKETS': baskets[order],
+            'CONFIDENCE (%)': baskets[order] / product_counts[order] * 100,
+            'LIFT': lift[order],
+        })
+
+    # Function to return the pairs for a report, cut to the strongest limit pairs
+    def export_table(self, limit=DEFAULT_EXPORT_PAIRS):
+        return self.pairs().head(limit)
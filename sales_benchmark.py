@@ -0,0 +1,278 @@
+# Benchmarks of the sales pipeline on synthetic files
+# For each file size, every stage the app runs is timed: CSV loading, date construction, the data-quality checks,
+# each metric's aggregation, each chart's data prep and the CSV/PDF/Excel exports.
+# With --memory, a second pass records each stage's peak allocation with tracemalloc.
+# Results are written as JSON so runs from different versions can be compared.
+#
+#   python sales_benchmark.py --rows 10000 100000 1000000 --output before.json
+#   python sales_benchmark.py --rows 10000 100000 1000000 --output after.json --baseline before.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from sales_anomalies import find_anomalies
+from sales_backends import DEFAULT_BACKEND, available_backends, get_backend
+from sales_baskets import BasketPairs
+from sales_charts import (
+    DEFAULT_POINT_BUDGET, category_pie_frame, density_grid, downsample_line, histogram_frame, loyalty_region_frame,
+    sample_points,
+)
+from sales_compare import compare_periods
+from sales_cube import SalesCube
+from sales_customers import CustomerAnalytics
+from sales_engine import (
+    DEFAULT_CHUNK_ROWS, DISTINCT_COLUMNS, NUMERIC_COLUMNS, TALLY_COLUMNS, YES_COUNT_COLUMNS, SalesAccumulator,
+    _money, _value_counts, _yes_mask, build_full_date, build_summary_df, compute_metrics, compute_metrics_from_csv,
+)
+from sales_reports import build_breakdowns, generate_csv, generate_excel, generate_pdf, render_chart_images
+from sales_schema import read_sales_csv
+from sales_sketches import HeavyHitters, HyperLogLog, KLLSketch, SketchSettings
+from sales_synthetic import SyntheticSpec, write_synthetic_csv
+from sales_validation import validate_rows
+
+DEFAULT_ROW_COUNTS = [10_000, 100_000, 1_000_000]
+DEFAULT_DATA_DIR = 'benchmark_data'
+# Each stage is run this many times and the fastest run is kept
+DEFAULT_REPEATS = 3
+# A stage counts as a regression when it is this much slower than the baseline
+DEFAULT_TOLERANCE = 0.2
+# Baseline stages faster than this are too noisy to compare
+_MIN_COMPARABLE_SECONDS = 0.01
+
+
+# Function to return the synthetic file for a spec, writing it the first time
+def synthetic_file(spec, data_dir=DEFAULT_DATA_DIR):
+    path = Path(data_dir) / (
+        f"sales_{spec.rows}_c{spec.customers}_p{spec.products}_k{spec.categories}"
+        f"_r{spec.regions}_d{spec.days}_s{spec.seed}{f'_o{spec.lines_per_order:g}' if spec.lines_per_order != 1 else ''}.csv"
+    )
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_synthetic_csv(spec, path.with_suffix('.tmp'))
+        path.with_suffix('.tmp').replace(path)
+    return path
+
+
+# The aggregation behind each metric, one stage per column as SalesAccumulator.from_frame computes them
+# (from_frame runs them all in a single call, so the engine is timed as a whole separately).
+def metric_stages(data, sketch_settings):
+    amounts = _money(data['Purchase_Amount'])
+    stages = {}
+    for column in NUMERIC_COLUMNS:
+        stages[f"sum {column}"] = lambda column=column: _money(data[column]).sum()
+    for column in TALLY_COLUMNS:
+        stages[f"tally {column}"] = lambda column=column: _value_counts(data[column])
+    for column in YES_COUNT_COLUMNS:
+        stages[f"yes count {column}"] = lambda column=column: int(_yes_mask(data[column]).sum())
+    if sketch_settings is None:
+        for column in DISTINCT_COLUMNS:
+            stages[f"distinct {column}"] = lambda column=column: pd.Index(data[column].dropna().unique())
+        stages['customer frequency'] = lambda: _value_counts(data['Customer_ID'])
+        stages['spend percentile'] = lambda: _value_counts(amounts)
+    else:
+        for column in DISTINCT_COLUMNS + ['Customer_ID']:
+            stages[f"distinct {column}"] = lambda column=column: HyperLogLog(sketch_settings.precision).update(data[column])
+        stages['customer frequency'] = lambda: HeavyHitters(sketch_settings.heavy_hitters).merge_counts(_value_counts(data['Customer_ID']))
+        stages['spend percentile'] = lambda: KLLSketch(sketch_settings.quantile_k).update(amounts)
+    stages['sales by region'] = lambda: amounts.groupby(data['Region'], observed=True).sum()
+    stages['sales by date'] = lambda: amounts.groupby(data['Full_Date']).sum()
+    stages['top spender'] = lambda: amounts.idxmax()
+    return stages
+
+
+# The data prep of each chart on the ANALYSE SALES and BUILD YOUR OWN CHART pages
+def chart_stages(data, metrics, point_budget=DEFAULT_POINT_BUDGET):
+    return {
+        'sales over time': lambda: downsample_line(metrics.sales_by_date.reset_index(), 'Full_Date', 'Purchase_Amount', point_budget),
+        'category pie': lambda: category_pie_frame(data),
+        'loyalty sunburst': lambda: loyalty_region_frame(data),
+        'histogram': lambda: histogram_frame(data, 'Purchase_Amount', 30, 'Region'),
+        'scatter sample': lambda: sample_points(data[['Customer_Age', 'Purchase_Amount', 'Region']], point_budget, 'Region'),
+        'scatter density': lambda: density_grid(data['Customer_Age'], data['Purchase_Amount']),
+        'line': lambda: downsample_line(data[['Full_Date', 'Purchase_Amount', 'Region']], 'Full_Date', 'Purchase_Amount', point_budget, 'Region'),
+        # The custom bar, pie and category histogram, as the app queries them: a fresh cube each time,
+        # so its factorization is timed along with the query
+        'cube bar': lambda: SalesCube(data).query(['Region', 'Payment_Method'], 'Purchase_Amount'),
+        'cube pie': lambda: SalesCube(data).query(['Payment_Method'], 'Purchase_Amount'),
+        'cube category histogram': lambda: SalesCube(data).query(['Customer_ID', 'Region'], None, 'COUNT'),
+        'cube top customers': lambda: SalesCube(data).query(['Customer_ID'], 'Purchase_Amount'),
+        'cube distinct pivot': lambda: SalesCube(data).pivot('Region', 'Product_Category', 'Customer_ID', 'DISTINCT COUNT'),
+        # Fresh analytics each time, so the per-customer reduction is timed with each view
+        'customer rfm': lambda: CustomerAnalytics(data).segment_summary(),
+        'customer cohorts': lambda: CustomerAnalytics(data).retention(),
+        'customer clv': lambda: CustomerAnalytics(data).clv_summary(),
+        'anomalies': lambda: find_anomalies(metrics, data),
+        'basket pairs': lambda: BasketPairs(data).top_partners(),
+        'period comparison': lambda: compare_periods(metrics, metrics, ('A', 'B'), data, data),
+    }
+
+
+# The report stages, each building on the tables of the ones before
+def report_stages(data, metrics, include_rows=False):
+    built = {}
+    stages = {
+        'summary table': lambda: built.setdefault('summary', build_summary_df(metrics)),
+        'breakdowns': lambda: built.setdefault('breakdowns', build_breakdowns(metrics, data)),
+        'chart images': lambda: built.setdefault('images', render_chart_images(metrics)),
+        'csv': lambda: generate_csv(built['summary']),
+        'pdf': lambda: generate_pdf(built['summary'], built['breakdowns'], built['images']),
+        'excel': lambda: generate_excel(built['summary'], built['breakdowns']),
+    }
+    if include_rows:
+        stages['excel with rows'] = lambda: generate_excel(built['summary'], built['breakdowns'], data)
+    return stages
+
+
+# Function to time one stage: the fastest of repeats runs, in seconds
+def time_stage(function, repeats=DEFAULT_REPEATS):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Function to measure the peak memory one stage allocates, in bytes
+# tracemalloc sees Python and numpy/pandas allocations; Arrow's own buffers
+# (read_sales_csv's parser, Arrow-backed strings) are not included.
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - start
+
+
+# Function to run every stage of the pipeline on one file
+# Returns one result per stage: its group, name, row count and seconds (and peak bytes with memory).
+def benchmark_file(path, rows, repeats=DEFAULT_REPEATS, memory=False, include_rows=False, log=print):
+    results = []
+
+    def run(group, stages):
+        for name, function in stages.items():
+            result = {'rows': rows, 'group': group, 'stage': name, 'seconds': time_stage(function, repeats)}
+            if memory:
+                result['peak_bytes'] = peak_memory(function)
+            results.append(result)
+            log(f"{rows:>12,}  {group:<8} {name:<32} {result['seconds']:9.4f} s")
+
+    run('load', {
+        'read csv': lambda: read_sales_csv(path),
+        'read csv in chunks': lambda: sum(len(chunk) for chunk in read_sales_csv(path, chunksize=DEFAULT_CHUNK_ROWS)),
+    })
+    data = read_sales_csv(path)
+    run('dates', {'build full date': lambda: build_full_date(data)})
+    run('validate', {'validate rows': lambda: validate_rows(data)})
+    settings = SketchSettings()
+    run('metrics', metric_stages(data, None))
+    run('sketches', metric_stages(data, settings))
+    metrics = compute_metrics(data)
+    run('engine', {
+        'aggregate': lambda: SalesAccumulator.from_frame(data),
+        'finalize': SalesAccumulator.from_frame(data).finalize,
+        'all metrics': lambda: compute_metrics(data),
+        'all metrics approximate': lambda: compute_metrics(data, settings),
+        'all metrics streamed': lambda: compute_metrics_from_csv(path),
+        # The other installed engines, querying the CSV directly
+        **{
+            f"all metrics {backend.lower()}": lambda backend=backend: get_backend(backend).compute_metrics(path)
+            for backend in available_backends() if backend != DEFAULT_BACKEND
+        },
+    })
+    run('charts', chart_stages(data, metrics))
+    run('reports', report_stages(data, metrics, include_rows))
+    return results
+
+
+# Versions and machine details stored with the results
+def run_metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'pyarrow': pa.__version__,
+    }
+
+
+# Function to compare results with a baseline run
+# Returns (rows, group, stage, baseline seconds, seconds, ratio) for every stage both runs have.
+def compare_results(results, baseline):
+    earlier = {(result['rows'], result['group'], result['stage']): result['seconds'] for result in baseline['results']}
+    comparison = []
+    for result in results:
+        key = (result['rows'], result['group'], result['stage'])
+        if key in earlier and earlier[key] >= _MIN_COMPARABLE_SECONDS:
+            comparison.append(key + (earlier[key], result['seconds'], result['seconds'] / earlier[key]))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each stage of the sales pipeline on synthetic files.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS, help="file sizes to benchmark")
+    defaults = SyntheticSpec(rows=0)
+    for field in ['customers', 'products', 'categories', 'regions', 'days', 'seed']:
+        parser.add_argument(f"--{field}", type=int, default=getattr(defaults, field))
+    parser.add_argument('--lines-per-order', type=float, default=defaults.lines_per_order, help="average rows per order")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="where synthetic files are kept between runs")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help="runs per stage (the fastest is kept)")
+    parser.add_argument('--memory', action='store_true', help="also record each stage's peak allocation")
+    parser.add_argument('--include-rows', action='store_true', help="also time the Excel export of every row")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file the results are written to")
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="slowdown reported as a regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for rows in args.rows:
+        spec = SyntheticSpec(rows, args.customers, args.products, args.categories, args.regions, args.days, seed=args.seed,
+                             lines_per_order=args.lines_per_order)
+        path = synthetic_file(spec, args.data_dir)
+        results += benchmark_file(path, rows, args.repeats, args.memory, args.include_rows)
+    metadata = run_metadata()
+    metadata['spec'] = {field: getattr(args, field) for field in ['customers', 'products', 'categories', 'regions', 'days', 'seed', 'lines_per_order']}
+    metadata['repeats'] = args.repeats
+    Path(args.output).write_text(json.dumps({'metadata': metadata, 'results': results}, indent=2))
+    print(f"WROTE {len(results)} RESULTS TO {args.output}")
+
+    if args.baseline:
+        regressions = 0
+        for rows, group, stage, before, after, ratio in compare_results(results, json.loads(Path(args.baseline).read_text())):
+            flag = ''
+            if ratio > 1 + args.tolerance:
+                regressions += 1
+                flag = 'REGRESSION'
+            print(f"{rows:>12,}  {group:<8} {stage:<32} {before:9.4f} s -> {after:9.4f} s  x{ratio:5.2f}  {flag}")
+        print(f"{regressions} REGRESSIONS AGAINST {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# Chart data prepared on the server
+# Plotly serialises every row it is given into the page, so large files are reduced here
+# first: histograms are binned, scatters are sampled (or binned into a density grid) and
+# lines are downsampled with LTTB, each to a point budget. The custom bars and pies are
+# aggregated by the SalesCube.
+import numpy as np
+import pandas as pd
+
+from sales_cube import DEFAULT_TOP_VALUES, top_codes
+from sales_schema import flag_labels
+
+# Most points (markers, line vertices or bars) a chart draws by default
+DEFAULT_POINT_BUDGET = 5000
+# Cells per axis of a scatter density grid
+DENSITY_BINS = 60
+
+
+# True for columns that can be placed on a continuous axis (flags are treated as categories)
+def is_continuous(values):
+    if pd.api.types.is_bool_dtype(values):
+        return False
+    return pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values)
+
+
+# Positions of values on a numeric axis (datetimes as integers, categories by order of appearance)
+def _axis_positions(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy().astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    if is_continuous(values):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.arange(len(values), dtype=np.float64)
+
+
+# Function to choose which of the points of a line to keep (Largest-Triangle-Three-Buckets)
+# Returns the positions of threshold points that best preserve the shape of the line.
+def lttb(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # The first and last points are always kept; the rest are split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        # Keep the point forming the largest triangle with the last kept point and the next bucket's average
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+# Function to reduce a line (optionally one line per group) to about budget points in total
+def downsample_line(frame, x, y, budget, group=None):
+    frame = frame.dropna(subset=[x, y]).sort_values(x, kind='stable')
+    if len(frame) <= budget:
+        return frame
+    if group is None:
+        return frame.iloc[lttb(_axis_positions(frame[x]), frame[y], budget)]
+    lines = [part for _, part in frame.groupby(group, observed=True, dropna=False, sort=False)]
+    per_line = max(budget // len(lines), 3)
+    return pd.concat([part.iloc[lttb(_axis_positions(part[x]), part[y], per_line)] for part in lines])
+
+
+# Function to keep about budget rows, sampling every group in proportion to its size
+def sample_points(frame, budget, group=None, seed=0):
+    if len(frame) <= budget:
+        return frame
+    if group is None:
+        return frame.sample(n=budget, random_state=seed).sort_index()
+    fraction = budget / len(frame)
+    grouped = frame.groupby(group, observed=True, dropna=False, group_keys=False)
+    return grouped.sample(frac=fraction, random_state=seed).sort_index()
+
+
+# Centres of histogram cells, back in the column's own type for datetimes
+def _centres(edges, values):
+    centres = (edges[:-1] + edges[1:]) / 2
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return centres.astype(np.int64).astype('datetime64[ns]')
+    return centres
+
+
+# Function to count points into a grid of cells for a density heatmap
+# Returns the cell centres along x and y and the counts (rows are y, columns are x);
+# empty cells are NaN so they are left blank.
+def density_grid(x, y, bins=DENSITY_BINS):
+    x_positions = _axis_positions(x)
+    y_positions = _axis_positions(y)
+    valid = ~(np.isnan(x_positions) | np.isnan(y_positions))
+    counts, x_edges, y_edges = np.histogram2d(x_positions[valid], y_positions[valid], bins=bins)
+    counts = np.where(counts > 0, counts, np.nan)
+    return _centres(x_edges, x), _centres(y_edges, y), counts.T
+
+
+# Label of one histogram bin
+def _bin_label(interval):
+    if isinstance(interval.left, pd.Timestamp):
+        return f"{interval.left:%d/%m/%Y} - {interval.right:%d/%m/%Y}"
+    return f"{interval.left:.4g} - {interval.right:.4g}"
+
+
+# Function to cut a column to its top values by row count, the rest labelled Other
+# Returns the column unchanged when it has no more than top values, else a categorical, most frequent first.
+def top_values(values, top=DEFAULT_TOP_VALUES):
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    if len(uniques) <= top:
+        return values
+    codes, labels = top_codes(codes, uniques, np.bincount(codes, minlength=len(uniques)), top, by_rank=True)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=labels), index=values.index, name=values.name)
+
+
+# Function to count a column into bins (or per category), optionally per group
+# Categories and groups are cut to their top values (the rest counted as Other), and only the
+# combinations that occur are returned, so the rows stay within about nbins (or top) x top.
+# Returns one row per bin (and group) with the bin label and its count, in bin order.
+def histogram_frame(data, column, nbins, group=None, top=DEFAULT_TOP_VALUES):
+    keys = [column] if group in (None, column) else [column, group]
+    frame = data[keys].copy()
+    if is_continuous(frame[column]):
+        binned = pd.cut(frame[column], bins=nbins)
+        frame[column] = binned.cat.rename_categories([_bin_label(interval) for interval in binned.cat.categories])
+    else:
+        frame[column] = top_values(frame[column], top)
+    if len(keys) > 1:
+        frame[group] = top_values(frame[group], top)
+    return frame.groupby(keys, observed=True, dropna=False).size().reset_index(name='count')
+
+
+# Function to total sales for the top categories, the rest summed as Other
+def category_pie_frame(data, top=5):
+    sales_by_category = data.groupby('Product_Category', observed=True)['Purchase_Amount'].sum().reset_index()
+    top_categories = sales_by_category.nlargest(top, 'Purchase_Amount')
+    other_sales = sales_by_category['Purchase_Amount'].sum() - top_categories['Purchase_Amount'].sum()
+    if other_sales > 0:
+        other = pd.DataFrame({'Product_Category': ['Other'], 'Purchase_Amount': [other_sales]})
+        top_categories = pd.concat([top_categories, other], ignore_index=True)
+    return top_categories
+
+
+# Function to total sales per loyalty status and region (flags labelled Yes/No)
+def loyalty_region_frame(data):
+    sunburst_data = data.groupby(['Customer_Loyalty', 'Region'], observed=True)['Purchase_Amount'].sum().reset_index()
+    sunburst_data['Customer_Loyalty'] = flag_labels(sunburst_data['Customer_Loyalty'])
+    return sunburst_data
@@ -0,0 +1,133 @@
+# Period-over-period comparison of two analyses: two date ranges of one dataset, or two datasets
+# Each side is analysed on its own, in one pass over its rows (or one background job per
+# dataset), so comparing only lines up aggregates that are already small: the summary
+# metrics, the per-region, per-category and per-channel breakdowns and the sales per day.
+# Breakdowns are merged on their keys with an outer join, so a value missing from one side
+# shows as 0 there instead of dropping out, and the changes are computed a column at a time.
+import numpy as np
+import pandas as pd
+
+from sales_engine import build_summary_df
+from sales_rollups import period_start
+
+# Metric behind each row of build_summary_df, in its order (None for rows that name something rather than count it)
+SUMMARY_ATTRIBUTES = [
+    'total_sales', 'avg_spend', 'num_customers', 'sales_per_customer', 'total_quantity', None,
+    None, 'discount_percentage', 'avg_age', 'num_orders', 'avg_shipping', 'total_tax', 'num_products',
+    'avg_unit_price', 'return_rate', 'loyalty_percentage', 'avg_rating',
+    None, None, 'avg_items_per_purchase',
+    None,
+]
+# Ways to pick the period compared with
+PREVIOUS_PERIODS = ['PRECEDING PERIOD', 'SAME PERIOD LAST YEAR']
+SUMMARY_TITLE = 'PERIOD COMPARISON'
+SALES_OVER_TIME_TITLE = 'SALES OVER TIME COMPARISON'
+
+
+# Function to find the period compared with a date range (both days inclusive)
+# The preceding period is as long as the range; whole calendar months are compared with the months before them.
+def previous_period(start, end, kind='PRECEDING PERIOD'):
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if kind == 'SAME PERIOD LAST YEAR':
+        offset = pd.DateOffset(years=1)
+    elif start.is_month_start and end.is_month_end:
+        months = (end.year - start.year) * 12 + end.month - start.month + 1
+        return (start - pd.DateOffset(months=months)).date(), (start - pd.Timedelta(days=1)).date()
+    else:
+        offset = end - start + pd.Timedelta(days=1)
+    return (start - offset).date(), (end - offset).date()
+
+
+# Function to label a date range for the comparison tables
+def range_label(start, end):
+    return f"{start:%d/%m/%Y} - {end:%d/%m/%Y}"
+
+
+# Function to make the labels of the two sides distinct, as they become column names
+def side_labels(current, previous):
+    if current == previous:
+        return f"{current} (1)", f"{previous} (2)"
+    return current, previous
+
+
+# Function to add the change from previous to current, absolute and in % of previous (empty when previous is 0)
+def _add_changes(table, current, previous):
+    change = current - previous
+    table['CHANGE'] = change
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table['CHANGE (%)'] = np.where(previous != 0, change / np.abs(previous) * 100, np.nan)
+    return table
+
+
+# Function to set every summary metric of two analyses side by side, with the change in the numeric ones
+def compare_summaries(current, previous, labels):
+    current_summary, previous_summary = build_summary_df(current), build_summary_df(previous)
+    numbers = lambda metrics: np.array([np.nan if attribute is None else float(getattr(metrics, attribute))
+                                        for attribute in SUMMARY_ATTRIBUTES])
+    table = pd.DataFrame({
+        'METRIC': current_summary['METRIC'],
+        labels[0]: current_summary['VALUE'].astype(str),
+        labels[1]: previous_summary['VALUE'].astype(str),
+    })
+    return _add_changes(table, numbers(current), numbers(previous))
+
+
+# Function to line up one breakdown (a Series per side) on its values, largest in the current period first
+def align_breakdowns(current, previous, labels, key):
+    sides = [pd.Series(side.to_numpy(dtype=np.float64), index=side.index.astype(str)) for side in (current, previous)]
+    aligned = pd.concat(sides, axis=1, keys=list(labels), join='outer', sort=False).fillna(0)
+    # Counts stay whole numbers once the missing values are filled
+    if all(pd.api.types.is_integer_dtype(side) for side in (current, previous)):
+        aligned = aligned.astype(np.int64)
+    aligned = aligned.sort_values(list(labels), ascending=False, kind='stable')
+    table = aligned.rename_axis(key).reset_index()
+    return _add_changes(table, aligned[labels[0]].to_numpy(), aligned[labels[1]].to_numpy())
+
+
+# Function to total the sales of each product category (as in the report's category breakdown)
+def category_sales(data):
+    return data['Purchase_Amount'].astype('float64').round(2).groupby(data['Product_Category'], observed=True).sum()
+
+
+# Sales per day, week or month, numbered from 1 at the side's first period
+def _numbered_sales(sales, granularity):
+    sales = sales.dropna()
+    if sales.empty:
+        return pd.DataFrame({'DATE': pd.DatetimeIndex([]), 'SALES': np.zeros(0)})
+    totals = sales.groupby(period_start(sales.index, granularity)).sum()
+    dates = totals.index
+    if granularity == 'MONTH':
+        steps = (dates.year - dates[0].year) * 12 + dates.month - dates[0].month
+    else:
+        steps = (dates - dates[0]).days // (7 if granularity == 'WEEK' else 1)
+    return pd.DataFrame({'DATE': dates, 'SALES': totals.to_numpy()}, index=np.asarray(steps) + 1)
+
+
+# Function to overlay the sales over time of two periods: their first days (weeks, months) share a row,
+# their second days the next row, and so on. Periods without sales are 0; their date is empty past a side's end.
+def overlay_sales(current, previous, labels, granularity='DAY'):
+    aligned = pd.concat([_numbered_sales(current, granularity), _numbered_sales(previous, granularity)],
+                        axis=1, keys=list(labels), join='outer').sort_index()
+    table = pd.DataFrame({granularity: aligned.index})
+    for label in labels:
+        table[f"{label} DATE"] = aligned[(label, 'DATE')].to_numpy()
+        table[label] = aligned[(label, 'SALES')].fillna(0).to_numpy()
+    return _add_changes(table, table[labels[0]].to_numpy(), table[labels[1]].to_numpy())
+
+
+# Function to build every comparison table of two analyses (title -> DataFrame) for the page and the exports
+# The per-category table needs both sides' row-level data and is left out without it.
+def compare_periods(current, previous, labels, current_data=None, previous_data=None):
+    tables = {
+        SUMMARY_TITLE: compare_summaries(current, previous, labels),
+        'SALES BY REGION COMPARISON': align_breakdowns(current.sales_by_region, previous.sales_by_region, labels, 'REGION'),
+    }
+    if current_data is not None and previous_data is not None:
+        tables['SALES BY CATEGORY COMPARISON'] = align_breakdowns(
+            category_sales(current_data), category_sales(previous_data), labels, 'CATEGORY'
+        )
+    tables['PURCHASES BY CHANNEL COMPARISON'] = align_breakdowns(
+        current.channel_breakdown, previous.channel_breakdown, labels, 'ORDER CHANNEL'
+    )
+    tables[SALES_OVER_TIME_TITLE] = overlay_sales(current.sales_by_date, previous.sales_by_date, labels)
+    return tables
@@ -0,0 +1,166 @@
+# Aggregate cube behind BUILD YOUR OWN CHART and the pivot table
+# Each column is factorized into integer codes once per dataset. An aggregate over one or
+# two dimensions is then a bincount over the combined codes, instead of a groupby over the
+# raw values, and recent results are kept for reuse. High-cardinality dimensions are cut to
+# their top values, with the rest summed (or counted) as a single "Other".
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from sales_engine import _money
+from sales_schema import flag_labels
+
+AGGREGATIONS = ['SUM', 'MEAN', 'COUNT', 'DISTINCT COUNT']
+# Values shown per dimension before the rest are grouped as Other
+DEFAULT_TOP_VALUES = 20
+OTHER_LABEL = 'Other'
+# Query results kept per cube
+CUBE_CACHE_ENTRIES = 32
+
+
+# Column name of an aggregate's values
+def value_column(measure, aggregation):
+    if aggregation == 'COUNT':
+        return 'count'
+    if aggregation == 'DISTINCT COUNT':
+        return f"distinct {measure}"
+    return measure if aggregation == 'SUM' else f"mean {measure}"
+
+
+# Function to make labels distinct: a label seen before gets " (2)", " (3)", ...
+def unique_labels(labels):
+    taken, result = set(), []
+    for label in labels:
+        unique, number = label, 1
+        while unique in taken:
+            number += 1
+            unique = f"{label} ({number})"
+        taken.add(unique)
+        result.append(unique)
+    return result
+
+
+# Function to cut codes (positions into uniques) to the top values by ranking, the rest mapped to one extra code
+# Returns the new codes and the label of each: the kept values as text, in code order (or best first with
+# by_rank), then OTHER_LABEL. Labels stay distinct even when a kept value is itself "Other" or two values
+# print alike (1 and '1').
+def top_codes(codes, uniques, ranking, top, by_rank=False):
+    kept = np.argsort(-np.asarray(ranking), kind='stable')[:top]
+    if not by_rank:
+        kept = np.sort(kept)
+    remap = np.full(len(uniques), len(kept), dtype=np.int64)
+    remap[kept] = np.arange(len(kept))
+    labels = unique_labels([str(value) for value in pd.Index(uniques).take(kept)] + [OTHER_LABEL])
+    return remap[codes], pd.Index(labels)
+
+
+# Sums, means, counts and distinct counts of a dataset over any one or two of its columns
+class SalesCube:
+    def __init__(self, data):
+        self.data = data
+        self._codes = {}
+        self._results = OrderedDict()
+        # A cube is shared between sessions; queries are serialised so the result cache stays consistent
+        self._lock = threading.Lock()
+
+    # Function to return a column's codes and the value of each code (missing values get a code of their own)
+    def codes(self, column):
+        if column not in self._codes:
+            values = self.data[column]
+            codes, uniques = pd.factorize(values, sort=True, use_na_sentinel=False)
+            if pd.api.types.is_bool_dtype(values):
+                uniques = flag_labels(pd.Series(uniques, dtype=values.dtype))
+            self._codes[column] = (codes.astype(np.int64), pd.Index(uniques))
+        return self._codes[column]
+
+    # Function to return a measure's values as float64 (money snapped to cents, as in the engine), missing as NaN
+    def values(self, measure):
+        return _money(self.data[measure]).to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Totals per code of one column, used to rank its values
+    def _ranking(self, column, measure, aggregation):
+        codes, uniques = self.codes(column)
+        if aggregation == 'SUM':
+            values = self.values(measure)
+            return np.bincount(codes, weights=np.nan_to_num(values), minlength=len(uniques))
+        # Means of tiny groups are noise, so means (like counts) keep the most frequent values
+        return np.bincount(codes, minlength=len(uniques))
+
+    # Function to cut a column to its top values by the aggregate, the rest mapped to one extra code
+    # Returns the codes and the label of each code.
+    def _top_codes(self, column, measure, aggregation, top):
+        codes, uniques = self.codes(column)
+        if top is None or len(uniques) <= top:
+            return codes, uniques
+        # The kept values become text so they share an axis with Other (dates as YYYY-MM-DD)
+        return top_codes(codes, uniques, self._ranking(column, measure, aggregation), top)
+
+    # Function to aggregate measure over dimensions (one or two columns), cutting each to its top values
+    # Returns one row per non-empty combination: the dimension values and the aggregate.
+    def query(self, dimensions, measure=None, aggregation='SUM', top=DEFAULT_TOP_VALUES):
+        dimensions = tuple(dict.fromkeys(dimensions))
+        key = (dimensions, measure, aggregation, top)
+        with self._lock:
+            if key not in self._results:
+                self._results[key] = self._aggregate(dimensions, measure, aggregation, top)
+                if len(self._results) > CUBE_CACHE_ENTRIES:
+                    self._results.popitem(last=False)
+            self._results.move_to_end(key)
+            return self._results[key]
+
+    def _aggregate(self, dimensions, measure, aggregation, top):
+        group = np.zeros(len(self.data), dtype=np.int64)
+        sizes, labels = [], []
+        for column in dimensions:
+            codes, column_labels = self._top_codes(column, measure, aggregation, top)
+            group = group * len(column_labels) + codes
+            sizes.append(len(column_labels))
+            labels.append(column_labels)
+        cells = int(np.prod(sizes))
+        # Without a top-N cut, two high-cardinality columns can have far more combinations than rows
+        occupied = None
+        if cells > 4 * len(self.data):
+            group, occupied = pd.factorize(group)
+            cells = len(occupied)
+
+        if aggregation == 'COUNT':
+            result = np.bincount(group, minlength=cells)
+            filled = result > 0
+        elif aggregation == 'DISTINCT COUNT':
+            measure_codes, measure_values = self.codes(measure)
+            pairs = pd.unique(group * len(measure_values) + measure_codes)
+            result = np.bincount(pairs // len(measure_values), minlength=cells)
+            filled = result > 0
+        else:
+            values = self.values(measure)
+            valid = ~np.isnan(values)
+            counts = np.bincount(group[valid], minlength=cells)
+            result = np.bincount(group[valid], weights=values[valid], minlength=cells)
+            if aggregation == 'MEAN':
+                result = np.divide(result, counts, out=np.full(cells, np.nan), where=counts > 0)
+            elif self.data[measure].dtype == 'float32':
+                # Sums of cents are rounded back to cents
+                result = result.round(2)
+            filled = np.bincount(group, minlength=cells) > 0
+
+        cell_ids = np.flatnonzero(filled)
+        combinations = cell_ids if occupied is None else occupied[cell_ids]
+        frame = {}
+        for column, column_labels, position in zip(dimensions, labels, np.unravel_index(combinations, sizes)):
+            frame[column] = column_labels.take(position)
+        frame[value_column(measure, aggregation)] = result[cell_ids]
+        return pd.DataFrame(frame)
+
+    # Function to lay out an aggregate as a pivot table (rows by columns; a single value column without columns)
+    def pivot(self, rows, columns=None, measure=None, aggregation='SUM', top=DEFAULT_TOP_VALUES):
+        dimensions = [rows] if columns in (None, rows) else [rows, columns]
+        table = self.query(dimensions, measure, aggregation, top)
+        values = value_column(measure, aggregation)
+        if len(dimensions) == 1:
+            return table.set_index(rows)
+        # Rows and columns keep the cube's order (sorted values, Other last)
+        pivot = table.pivot(index=rows, columns=columns, values=values)
+        order = lambda axis, column: [label for label in self._top_codes(column, measure, aggregation, top)[1] if label in axis]
+        return pivot.reindex(index=order(pivot.index, rows), columns=order(pivot.columns, columns))
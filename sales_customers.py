@@ -0,0 +1,249 @@
+# Customer analytics: RFM scores, monthly acquisition cohorts and customer lifetime value
+# Customer_ID is turned into integer codes once, and every per-customer figure is then a
+# bincount or a grouped min/max over those codes, so millions of customers take seconds
+# rather than a Python loop over each one. Each table is built the first time it is asked
+# for and kept, so switching between the RFM, cohort and CLV views recomputes nothing.
+import threading
+
+import numpy as np
+import pandas as pd
+
+from sales_engine import _money, _yes_mask
+
+# RFM scores run from 1 (worst fifth of customers) to RFM_SCORES (best fifth)
+RFM_SCORES = 5
+# Segments by recency score and the average of the frequency and monetary scores, first match wins
+RFM_SEGMENTS = [
+    ('Champions', lambda r, fm: (r >= 4) & (fm >= 4)),
+    ('Loyal', lambda r, fm: (r >= 3) & (fm >= 3)),
+    ('Promising', lambda r, fm: r >= 4),
+    ('At Risk', lambda r, fm: (r <= 2) & (fm >= 3)),
+    ('Lost', lambda r, fm: r <= 2),
+]
+OTHER_SEGMENT = 'Needs Attention'
+SEGMENT_ORDER = [name for name, _ in RFM_SEGMENTS[:3]] + [OTHER_SEGMENT] + [name for name, _ in RFM_SEGMENTS[3:]]
+# Monthly discount rate applied to future customer value
+DEFAULT_MONTHLY_DISCOUNT = 0.01
+
+
+# Function to score values 1..RFM_SCORES by their rank (equal values share a score)
+def rfm_score(values, higher_is_better=True):
+    ranks = pd.Series(values).rank(method='average', pct=True).to_numpy()
+    scores = np.clip(np.ceil(ranks * RFM_SCORES), 1, RFM_SCORES).astype(np.int8)
+    return scores if higher_is_better else (RFM_SCORES + 1 - scores).astype(np.int8)
+
+
+# Function to name the segment of each customer from their R, F and M scores
+def rfm_segments(recency, frequency, monetary):
+    fm = (frequency.astype(np.float64) + monetary) / 2
+    codes = np.select([rule(recency, fm) for _, rule in RFM_SEGMENTS], [SEGMENT_ORDER.index(name) for name, _ in RFM_SEGMENTS],
+                      SEGMENT_ORDER.index(OTHER_SEGMENT))
+    return pd.Categorical.from_codes(codes, categories=SEGMENT_ORDER)
+
+
+# Customer-level tables of one dataset (its rows need the Full_Date column)
+class CustomerAnalytics:
+    def __init__(self, data, discount_rate=DEFAULT_MONTHLY_DISCOUNT):
+        self.data = data
+        self.discount_rate = discount_rate
+        self._tables = {}
+        # Analytics are shared between sessions; tables are built once, under the lock
+        self._lock = threading.RLock()
+
+    # Function to return a table, building it the first time
+    def _table(self, name, build):
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = build()
+            return self._tables[name]
+
+    # Per-row arrays of the rows with a customer and a date: customer position, day and month numbers,
+    # net amount (returned purchases count as nothing) and the return and loyalty flags
+    def _rows(self):
+        return self._table('rows', self._build_rows)
+
+    def _build_rows(self):
+        customers = self.data['Customer_ID']
+        if isinstance(customers.dtype, pd.CategoricalDtype):
+            codes, ids = customers.cat.codes.to_numpy(np.int64), customers.cat.categories
+        else:
+            codes, ids = pd.factorize(customers)
+            codes = codes.astype(np.int64)
+        dates = self.data['Full_Date'].to_numpy('datetime64[D]')
+        valid = (codes >= 0) & ~np.isnat(dates)
+        codes = codes[valid]
+        # Customers without a dated purchase (e.g. unused categories of a filtered subset) are dropped
+        present = np.bincount(codes, minlength=len(ids)) > 0
+        position = np.cumsum(present) - 1
+        amounts = np.nan_to_num(_money(self.data['Purchase_Amount']).to_numpy(dtype=np.float64, na_value=np.nan)[valid])
+        returned = _yes_mask(self.data['Return_Status']).to_numpy(dtype=bool)[valid]
+        days = dates[valid]
+        return {
+            'ids': pd.Index(ids[present]),
+            'customer': position[codes],
+            'day': days.astype(np.int64),
+            'month': days.astype('datetime64[M]').astype(np.int64),
+            'amount': amounts,
+            'net_amount': np.where(returned, 0.0, amounts),
+            'returned': returned,
+            'loyal': _yes_mask(self.data['Customer_Loyalty']).to_numpy(dtype=bool)[valid],
+        }
+
+    # Function to return one row per customer: first and last purchase, purchases, sales, net sales, returns
+    # and loyalty membership (a customer is a member when any of their purchases was flagged)
+    def customers(self):
+        return self._table('customers', self._build_customers)
+
+    def _build_customers(self):
+        rows = self._rows()
+        customer, count = rows['customer'], len(rows['ids'])
+        days = pd.Series(rows['day']).groupby(customer).agg(['min', 'max'])
+        return pd.DataFrame({
+            'Customer_ID': rows['ids'],
+            'First_Purchase': days['min'].to_numpy().astype('datetime64[D]'),
+            'Last_Purchase': days['max'].to_numpy().astype('datetime64[D]'),
+            'Purchases': np.bincount(customer, minlength=count),
+            'Sales': np.bincount(customer, weights=rows['amount'], minlength=count).round(2),
+            'Net_Sales': np.bincount(customer, weights=rows['net_amount'], minlength=count).round(2),
+            'Returns': np.bincount(customer, weights=rows['returned'], minlength=count).astype(np.int64),
+            'Loyalty_Member': np.bincount(customer, weights=rows['loyal'], minlength=count) > 0,
+        })
+
+    # Function to return each customer's recency (days before the day after the last sale), frequency
+    # (purchases) and monetary value (net sales), their 1-5 scores and their segment
+    def rfm(self):
+        return self._table('rfm', self._build_rfm)
+
+    def _build_rfm(self):
+        customers = self.customers()
+        as_of = customers['Last_Purchase'].max() + pd.Timedelta(days=1)
+        table = pd.DataFrame({
+            'Customer_ID': customers['Customer_ID'],
+            'Recency_Days': (as_of - customers['Last_Purchase']).dt.days,
+            'Frequency': customers['Purchases'],
+            'Monetary': customers['Net_Sales'],
+        })
+        table['R'] = rfm_score(table['Recency_Days'], higher_is_better=False)
+        table['F'] = rfm_score(table['Frequency'])
+        table['M'] = rfm_score(table['Monetary'])
+        table['RFM_Score'] = table['R'].astype(np.int16) * 100 + table['F'] * 10 + table['M']
+        table['Segment'] = rfm_segments(table['R'].to_numpy(), table['F'].to_numpy(), table['M'].to_numpy())
+        return table
+
+    # Function to summarise the customers of each RFM segment
+    def segment_summary(self):
+        return self._table('segments', self._build_segment_summary)
+
+    def _build_segment_summary(self):
+        rfm = self.rfm()
+        grouped = rfm.groupby('Segment', observed=True)
+        summary = pd.DataFrame({
+            'CUSTOMERS': grouped.size(),
+            'NET SALES': grouped['Monetary'].sum().round(2),
+            'AVG RECENCY (DAYS)': grouped['Recency_Days'].mean().round(1),
+            'AVG PURCHASES': grouped['Frequency'].mean().round(2),
+            'AVG NET SALES': grouped['Monetary'].mean().round(2),
+        })
+        summary.insert(1, '% OF CUSTOMERS', (summary['CUSTOMERS'] / len(rfm) * 100).round(1))
+        return summary.rename_axis('SEGMENT').reset_index()
+
+    # Distinct (customer, month) pairs as customer * months + month offset, and the number of months covered
+    def _active_months(self):
+        return self._table('active_months', self._build_active_months)
+
+    def _build_active_months(self):
+        rows = self._rows()
+        first_month = rows['month'].min()
+        months = int(rows['month'].max() - first_month) + 1
+        pairs = pd.unique(rows['customer'] * months + (rows['month'] - first_month))
+        return pairs, months, first_month
+
+    # Function to count each monthly acquisition cohort's active customers by months since their first purchase
+    # Rows are cohorts (the month of the first purchase), columns months since; months not yet observed are NaN.
+    def cohort_counts(self):
+        return self._table('cohort_counts', self._build_cohort_counts)
+
+    def _build_cohort_counts(self):
+        pairs, months, first_month = self._active_months()
+        customer, month = pairs // months, pairs % months
+        cohort = np.full(len(self._rows()['ids']), months, dtype=np.int64)
+        np.minimum.at(cohort, customer, month)
+        counts = np.bincount(cohort[customer] * months + (month - cohort[customer]), minlength=months * months)
+        counts = counts.reshape(months, months).astype(np.float64)
+        # Cohort c has only been observed for months - c months
+        counts[np.add.outer(np.arange(months), np.arange(months)) >= months] = np.nan
+        cohorts = pd.period_range(pd.Timestamp(np.datetime64(int(first_month), 'M')), periods=months, freq='M', name='COHORT')
+        table = pd.DataFrame(counts, index=cohorts, columns=pd.RangeIndex(months, name='MONTHS SINCE FIRST PURCHASE'))
+        return table[table[0] > 0]
+
+    # Function to return the share of each cohort still buying n months after its first purchase
+    def retention(self):
+        return self._table('retention', lambda: self.cohort_counts().div(self.cohort_counts()[0], axis=0))
+
+    # Function to return the share of loyalty members and of other customers active in one month
+    # who buy again the next month ({True: members, False: others}; 0 when no month follows another)
+    def monthly_retention(self):
+        return self._table('monthly_retention', self._build_monthly_retention)
+
+    def _build_monthly_retention(self):
+        pairs, months, _ = self._active_months()
+        # The last month has no next month to be retained into
+        open_pairs = pairs[pairs % months < months - 1]
+        kept = np.isin(open_pairs + 1, pairs)
+        loyal = self.customers()['Loyalty_Member'].to_numpy()[open_pairs // months]
+        rates = {}
+        for member in (True, False):
+            eligible = loyal == member
+            rates[member] = float(kept[eligible].mean()) if eligible.any() else 0.0
+        return rates
+
+    # Function to estimate each customer's lifetime value: net sales so far plus the discounted value
+    # of the months to come. A month's value is the customer's net sales per month with a purchase; the chance of
+    # each further month is their loyalty group's monthly retention, so CLV = net + value * r / (1 + d - r).
+    def clv(self):
+        return self._table('clv', self._build_clv)
+
+    def _build_clv(self):
+        customers = self.customers()
+        months = self._purchase_months()
+        monthly_value = customers['Net_Sales'] / months
+        rates = self.monthly_retention()
+        retention = np.where(customers['Loyalty_Member'], rates[True], rates[False])
+        future = monthly_value * retention / (1 + self.discount_rate - retention)
+        return pd.DataFrame({
+            'Customer_ID': customers['Customer_ID'],
+            'Loyalty_Member': customers['Loyalty_Member'],
+            'Net_Sales': customers['Net_Sales'],
+            'Returns': customers['Returns'],
+            'Active_Months': months,
+            'Monthly_Value': monthly_value.round(2),
+            'Monthly_Retention': retention,
+            'Expected_Future_Value': future.round(2),
+            'CLV': (customers['Net_Sales'] + future).round(2),
+        })
+
+    # Number of distinct months in which each customer bought, in customers() order; months between
+    # purchases without one do not count, so intermittent buyers are not averaged over their gaps
+    def _purchase_months(self):
+        pairs, months, _ = self._active_months()
+        return np.bincount(pairs // months, minlength=len(self._rows()['ids']))
+
+    # Function to summarise lifetime value for loyalty members and other customers
+    def clv_summary(self):
+        return self._table('clv_summary', self._build_clv_summary)
+
+    def _build_clv_summary(self):
+        clv = self.clv()
+        customers = self.customers()
+        grouped = clv.groupby('Loyalty_Member')
+        purchases = customers.groupby('Loyalty_Member')['Purchases'].sum()
+        summary = pd.DataFrame({
+            'CUSTOMERS': grouped.size(),
+            'MONTHLY RETENTION (%)': grouped['Monthly_Retention'].first() * 100,
+            'RETURN RATE (%)': grouped['Returns'].sum() / purchases * 100,
+            'AVG NET SALES': grouped['Net_Sales'].mean(),
+            'AVG CLV': grouped['CLV'].mean(),
+            'TOTAL CLV': grouped['CLV'].sum(),
+        }).round(2)
+        summary.index = summary.index.map({True: 'Yes', False: 'No'})
+        return summary.rename_axis('LOYALTY MEMBER').reset_index()
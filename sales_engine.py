@@ -0,0 +1,457 @@
+# Sales metrics engine
+# Computes every metric shown on the ANALYSE SALES page from a DataFrame without
+# touching Streamlit, so the page, the exports and scripts can all share it.
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from sales_profiling import profile_stage
+from sales_schema import SalesDataError, read_sales_csv
+from sales_sketches import HeavyHitters, HyperLogLog, KLLSketch
+
+
+# All the metrics produced by one analysis of a sales file
+@dataclass
+class SalesMetrics:
+    row_count: int
+    total_sales: float
+    avg_spend: float
+    num_customers: int
+    sales_per_customer: float
+    top_spender_id: str
+    top_spender_amount: float
+    top_spender_day: str
+    total_quantity: float
+    popular_category: object
+    payment_breakdown: pd.Series
+    sales_by_region: pd.Series
+    top_region: str
+    discount_breakdown: pd.Series
+    discount_percentage: float
+    avg_age: float
+    gender_breakdown: pd.Series
+    num_orders: int
+    time_breakdown: pd.Series
+    avg_shipping: float
+    total_tax: float
+    num_products: int
+    avg_unit_price: float
+    return_rate: float
+    loyalty_percentage: float
+    channel_breakdown: pd.Series
+    delivery_breakdown: pd.Series
+    avg_rating: float
+    source_breakdown: pd.Series
+    sales_by_date: pd.Series
+    busiest_day: pd.Timestamp
+    busiest_day_sales: float
+    avg_daily_sales: float
+    outlier_spend: float
+    most_frequent_customer: str
+    most_frequent_customer_purchases: int
+    avg_items_per_purchase: float
+    top_payment_method: str
+    # Set when distinct counts, the outlier threshold and the most frequent customer come from sketches
+    approximate: bool = False
+    distinct_error: float = 0.0
+    quantile_error: float = 0.0
+
+    # The busiest day counts as a spike when it beats the daily average by 20%
+    @property
+    def has_spike(self):
+        return pd.notnull(self.busiest_day) and self.busiest_day_sales > self.avg_daily_sales * 1.2
+
+    @property
+    def spike_percent(self):
+        return ((self.busiest_day_sales - self.avg_daily_sales) / self.avg_daily_sales) * 100
+
+    @property
+    def top_spender_is_outlier(self):
+        return self.top_spender_amount > self.outlier_spend
+
+    # Labels appended to estimated metrics (empty for exact analyses)
+    @property
+    def distinct_label(self):
+        return f" (ESTIMATE ±{self.distinct_error * 100:.1f}%)" if self.approximate else ""
+
+    @property
+    def quantile_label(self):
+        return f" (ESTIMATE ±{self.quantile_error * 100:.1f}% RANK)" if self.approximate else ""
+
+    @property
+    def frequency_label(self):
+        return " (ESTIMATE)" if self.approximate else ""
+
+
+# Text form of factorized key values (whole-number floats such as 2025.0 print as 2025)
+def _as_text(uniques):
+    values = pd.Series(uniques)
+    if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        values = values.astype('Int64')
+    return values.astype(str).to_numpy(dtype=object)
+
+
+# Parse one text per distinct key and spread the results to every row through integer codes
+# (code -1 marks a missing key and gives NaT)
+def _parse_by_code(codes, texts, format):
+    parsed = pd.to_datetime(pd.Series(texts, dtype=object), format=format, errors='coerce').to_numpy()
+    parsed = np.append(parsed, np.array(['NaT'], dtype=parsed.dtype))
+    return parsed.take(np.where(codes < 0, len(texts), codes))
+
+
+# Function to add the Full_Date column built from Day_Month and Year (invalid dates become NaT)
+# A file only has a few hundred distinct (Day_Month, Year) pairs, so each pair is parsed once
+# and mapped back through integer codes instead of building and parsing a string per row.
+# With include_time, Transaction_Time is parsed the same way into a Transaction_Timestamp column.
+def parse_full_date(data, include_time=False):
+    try:
+        day_month_codes, day_months = pd.factorize(data['Day_Month'])
+        year_codes, years = pd.factorize(data['Year'])
+        valid = (day_month_codes >= 0) & (year_codes >= 0)
+        pair_codes, pairs = pd.factorize(np.where(valid, day_month_codes.astype(np.int64) * len(years) + year_codes, -1))
+        pair_texts = _as_text(day_months).take(pairs // max(len(years), 1)) + '/' + _as_text(years).take(pairs % max(len(years), 1))
+        pair_codes = np.where(pairs.take(pair_codes) < 0, -1, pair_codes)
+        data['Full_Date'] = _parse_by_code(pair_codes, pair_texts, '%d/%m/%Y')
+        if include_time:
+            time_codes, times = pd.factorize(data['Transaction_Time'])
+            time_of_day = _parse_by_code(time_codes, _as_text(times), '%H:%M') - np.datetime64('1900-01-01')
+            data['Transaction_Timestamp'] = data['Full_Date'] + time_of_day
+    except KeyError as e:
+        raise SalesDataError(f"DATE COLUMN ISSUE: Missing 'Day_Month' or 'Year' column - {e}")
+    except Exception as e:
+        raise SalesDataError(f"DATE COLUMN ISSUE: {e}")
+    return data
+
+
+# Error raised when no row has a usable date
+def _no_valid_dates_error():
+    return SalesDataError("DATE COLUMN ISSUE: All 'Day_Month/Year' values are invalid—check your CSV format.")
+
+
+# Function to build the Full_Date column and reject files where every date is invalid
+def build_full_date(data):
+    parse_full_date(data)
+    if data['Full_Date'].isnull().all():
+        raise _no_valid_dates_error()
+    return data
+
+
+# Numeric columns summed or averaged by the metrics
+NUMERIC_COLUMNS = ['Purchase_Amount', 'Quantity', 'Customer_Age', 'Shipping_Cost',
+                   'Tax_Amount', 'Unit_Price', 'Customer_Rating']
+# Columns counted value by value
+TALLY_COLUMNS = ['Product_Category', 'Payment_Method', 'Discount_Applied', 'Customer_Gender',
+                 'Transaction_Time', 'Order_Channel', 'Delivery_Method', 'Purchase_Source']
+# Columns where only the number of distinct values is reported
+# (Customer_ID's distinct count comes from its tally, or from a sketch in approximate mode)
+DISTINCT_COLUMNS = ['Order_ID', 'Product_ID']
+# Yes/No columns reported as a percentage of all rows
+YES_COUNT_COLUMNS = ['Return_Status', 'Customer_Loyalty']
+
+# Rows per chunk when a CSV is streamed instead of loaded whole
+DEFAULT_CHUNK_ROWS = 250_000
+
+
+# Value of the most common entry, taking the smallest value on ties like Series.mode()
+# (numeric codes read as category text still compare as numbers)
+def _mode_from_counts(counts):
+    tied = counts.index[counts == counts.max()]
+    as_numbers = pd.to_numeric(pd.Series(tied), errors='coerce')
+    if as_numbers.notna().all():
+        return tied[as_numbers.to_numpy().argmin()]
+    return min(tied)
+
+
+# Money columns widened to float64 and snapped back to whole cents, so totals of
+# float32 columns do not drift over millions of rows
+def _money(values):
+    if values.dtype == 'float32':
+        return values.astype('float64').round(2)
+    return values
+
+
+# Rows whose Yes/No flag is Yes (works for boolean and text columns)
+def _yes_mask(values):
+    if pd.api.types.is_bool_dtype(values):
+        return values.fillna(False).astype(bool)
+    return values == 'Yes'
+
+
+# Tally of one column's values, leaving out categories with no rows
+# Boolean Yes/No flags are reported with their Yes/No labels.
+def _value_counts(values):
+    counts = values.value_counts(sort=False)
+    counts = counts[counts > 0]
+    if pd.api.types.is_bool_dtype(values):
+        counts.index = pd.Index(['Yes' if flag else 'No' for flag in counts.index], name=counts.index.name)
+    return counts
+
+
+# Combine two tallies, keeping keys in order of first appearance
+def _merge_counts(left, right):
+    if left is None:
+        return right
+    return pd.concat([left, right]).groupby(level=0, sort=False).sum()
+
+
+# Combine two per-key sums (region, date), keeping the keys sorted
+def _merge_sums(left, right):
+    if left is None:
+        return right
+    return left.add(right, fill_value=0)
+
+
+# Turn a tally into a value_counts-style breakdown (largest first)
+def _breakdown(counts, column):
+    return counts.sort_values(ascending=False, kind='stable').rename('count').rename_axis(column)
+
+
+# Combine two distinct-value sets (pandas Index or HyperLogLog)
+def _merge_distinct(left, right):
+    if left is None:
+        return right
+    if isinstance(left, HyperLogLog):
+        return left.merge(right)
+    return left.append(right).unique()
+
+
+# Linear-interpolated quantile (same as Series.quantile) from a value -> count tally
+def _quantile_from_counts(counts, q):
+    counts = counts.sort_index()
+    values = counts.index.to_numpy()
+    cumulative = np.cumsum(counts.to_numpy())
+    position = (cumulative[-1] - 1) * q
+    lower, upper = int(np.floor(position)), int(np.ceil(position))
+    low_value = values[np.searchsorted(cumulative, lower, side='right')]
+    high_value = values[np.searchsorted(cumulative, upper, side='right')]
+    return low_value + (high_value - low_value) * (position - lower)
+
+
+# Mergeable partial aggregates of a sales file
+# Fold in any number of chunks with add(), combine partials from other chunks or files
+# with merge(), then call finalize() for the metrics. Memory grows with the number of
+# distinct keys (customers, dates, amounts), not with the number of rows.
+# With sketch_settings (approximate mode) the customer, order and product counts, the
+# most frequent customer and the 95th percentile come from fixed-size sketches instead.
+class SalesAccumulator:
+    def __init__(self, sketch_settings=None):
+        self.sketch_settings = sketch_settings
+        self.row_count = 0
+        self.valid_dates = 0
+        self.sums = {column: 0 for column in NUMERIC_COLUMNS}
+        self.counts = {column: 0 for column in NUMERIC_COLUMNS}
+        self.tallies = {column: None for column in TALLY_COLUMNS}
+        self.distinct = {column: None for column in DISTINCT_COLUMNS}
+        self.yes_counts = {column: 0 for column in YES_COUNT_COLUMNS}
+        # Exact tallies, or HeavyHitters / HyperLogLog / KLLSketch in approximate mode
+        self.customer_counts = None
+        self.customer_distinct = None
+        self.amounts = None
+        self.sales_by_region = None
+        self.sales_by_date = None
+        # (amount, Customer_ID, Day_Month) of the largest single purchase
+        self.top_spender = None
+
+    # Build the partial aggregates of one DataFrame (adds Full_Date to it)
+    @classmethod
+    def from_frame(cls, data, sketch_settings=None):
+        parse_full_date(data)
+        acc = cls(sketch_settings)
+        acc.row_count = len(data)
+        acc.valid_dates = int(data['Full_Date'].notna().sum())
+        amounts = _money(data['Purchase_Amount'])
+        for column in NUMERIC_COLUMNS:
+            values = amounts if column == 'Purchase_Amount' else _money(data[column])
+            acc.sums[column] = values.sum()
+            acc.counts[column] = int(values.count())
+        for column in TALLY_COLUMNS:
+            acc.tallies[column] = _value_counts(data[column])
+        for column in YES_COUNT_COLUMNS:
+            acc.yes_counts[column] = int(_yes_mask(data[column]).sum())
+        customer_counts = _value_counts(data['Customer_ID'])
+        if sketch_settings is None:
+            for column in DISTINCT_COLUMNS:
+                acc.distinct[column] = pd.Index(data[column].dropna().unique())
+            acc.customer_counts = customer_counts
+            acc.amounts = _value_counts(amounts)
+        else:
+            for column in DISTINCT_COLUMNS:
+                acc.distinct[column] = HyperLogLog(sketch_settings.precision).update(data[column])
+            acc.customer_distinct = HyperLogLog(sketch_settings.precision).update(data['Customer_ID'])
+            acc.customer_counts = HeavyHitters(sketch_settings.heavy_hitters).merge_counts(customer_counts)
+            acc.amounts = KLLSketch(sketch_settings.quantile_k).update(amounts)
+        acc.sales_by_region = amounts.groupby(data['Region'], observed=True).sum()
+        acc.sales_by_date = amounts.groupby(data['Full_Date']).sum()
+        if amounts.notna().any():
+            top_index = amounts.idxmax()
+            acc.top_spender = (amounts.at[top_index], data.at[top_index, 'Customer_ID'], data.at[top_index, 'Day_Month'])
+        return acc
+
+    # Fold one more chunk of rows into the totals
+    def add(self, data):
+        return self.merge(SalesAccumulator.from_frame(data, self.sketch_settings))
+
+    # Combine with the partial aggregates of rows that come after these ones
+    # (both sides must use the same sketch settings)
+    def merge(self, other):
+        if self.sketch_settings != other.sketch_settings:
+            raise ValueError("Cannot merge exact and approximate (or differently sized) aggregates")
+        # A partial that never saw a chunk (e.g. of a file with a header only) adds nothing
+        if other.sales_by_region is None:
+            return self
+        self.row_count += other.row_count
+        self.valid_dates += other.valid_dates
+        for column in NUMERIC_COLUMNS:
+            self.sums[column] += other.sums[column]
+            self.counts[column] += other.counts[column]
+        for column in TALLY_COLUMNS:
+            self.tallies[column] = _merge_counts(self.tallies[column], other.tallies[column])
+        for column in DISTINCT_COLUMNS:
+            self.distinct[column] = _merge_distinct(self.distinct[column], other.distinct[column])
+        for column in YES_COUNT_COLUMNS:
+            self.yes_counts[column] += other.yes_counts[column]
+        if self.sketch_settings is None:
+            self.customer_counts = _merge_counts(self.customer_counts, other.customer_counts)
+            self.amounts = _merge_counts(self.amounts, other.amounts)
+        elif other.row_count:
+            if self.customer_counts is None:
+                self.customer_distinct, self.customer_counts, self.amounts = other.customer_distinct, other.customer_counts, other.amounts
+            else:
+                self.customer_distinct.merge(other.customer_distinct)
+                self.customer_counts.merge(other.customer_counts)
+                self.amounts.merge(other.amounts)
+        self.sales_by_region = _merge_sums(self.sales_by_region, other.sales_by_region)
+        self.sales_by_date = _merge_sums(self.sales_by_date, other.sales_by_date)
+        # Ties keep the earlier purchase, as idxmax does
+        if self.top_spender is None or (other.top_spender is not None and other.top_spender[0] > self.top_spender[0]):
+            self.top_spender = other.top_spender
+        return self
+
+    # Function to compute every metric from the accumulated totals
+    def finalize(self):
+        if self.valid_dates == 0:
+            raise _no_valid_dates_error()
+        sums = self.sums
+        means = {column: sums[column] / self.counts[column] for column in NUMERIC_COLUMNS}
+        tallies = self.tallies
+        settings = self.sketch_settings
+        if settings is None:
+            customer_frequency = self.customer_counts
+            num_customers = len(customer_frequency)
+            num_orders = len(self.distinct['Order_ID'])
+            num_products = len(self.distinct['Product_ID'])
+            outlier_spend = _quantile_from_counts(self.amounts, 0.95)
+        else:
+            customer_frequency = self.customer_counts.counts
+            num_customers = self.customer_distinct.count()
+            num_orders = self.distinct['Order_ID'].count()
+            num_products = self.distinct['Product_ID'].count()
+            outlier_spend = self.amounts.quantile(0.95)
+        payment_breakdown = _breakdown(tallies['Payment_Method'], 'Payment_Method')
+        discount_breakdown = _breakdown(tallies['Discount_Applied'], 'Discount_Applied')
+        discount_total = discount_breakdown.sum()
+        sales_by_date = self.sales_by_date
+        sales_by_region = self.sales_by_region
+        top_amount, top_customer, top_day = self.top_spender
+        total_sales = sums['Purchase_Amount']
+        return SalesMetrics(
+            row_count=self.row_count,
+            total_sales=total_sales,
+            avg_spend=means['Purchase_Amount'],
+            num_customers=num_customers,
+            sales_per_customer=total_sales / num_customers,
+            top_spender_id=top_customer,
+            top_spender_amount=top_amount,
+            top_spender_day=top_day,
+            total_quantity=sums['Quantity'],
+            popular_category=_mode_from_counts(tallies['Product_Category']),
+            payment_breakdown=payment_breakdown,
+            sales_by_region=sales_by_region,
+            top_region=sales_by_region.idxmax(),
+            discount_breakdown=discount_breakdown,
+            discount_percentage=discount_breakdown.get('Yes', 0) / discount_total * 100 if discount_total else 0.0,
+            avg_age=means['Customer_Age'],
+            gender_breakdown=_breakdown(tallies['Customer_Gender'], 'Customer_Gender'),
+            num_orders=num_orders,
+            time_breakdown=_breakdown(tallies['Transaction_Time'], 'Transaction_Time'),
+            avg_shipping=means['Shipping_Cost'],
+            total_tax=sums['Tax_Amount'],
+            num_products=num_products,
+            avg_unit_price=means['Unit_Price'],
+            return_rate=self.yes_counts['Return_Status'] / self.row_count * 100,
+            loyalty_percentage=self.yes_counts['Customer_Loyalty'] / self.row_count * 100,
+            channel_breakdown=_breakdown(tallies['Order_Channel'], 'Order_Channel'),
+            delivery_breakdown=_breakdown(tallies['Delivery_Method'], 'Delivery_Method'),
+            avg_rating=means['Customer_Rating'],
+            source_breakdown=_breakdown(tallies['Purchase_Source'], 'Purchase_Source'),
+            sales_by_date=sales_by_date,
+            busiest_day=sales_by_date.idxmax(),
+            busiest_day_sales=sales_by_date.max(),
+            avg_daily_sales=sales_by_date.mean(),
+            outlier_spend=outlier_spend,
+            most_frequent_customer=customer_frequency.idxmax(),
+            most_frequent_customer_purchases=customer_frequency.max(),
+            avg_items_per_purchase=means['Quantity'],
+            top_payment_method=payment_breakdown.idxmax(),
+            approximate=settings is not None,
+            distinct_error=settings.distinct_error if settings else 0.0,
+            quantile_error=settings.quantile_error if settings else 0.0,
+        )
+
+
+# Function to compute every metric from a sales DataFrame (adds Full_Date to it)
+# The whole frame is treated as a single chunk, so in-memory and streamed analyses
+# share one aggregation plan and give the same results.
+# Pass sketch_settings for approximate distinct counts and percentiles.
+def compute_metrics(data, sketch_settings=None):
+    with profile_stage('FULL DATE', len(data)):
+        build_full_date(data)
+    with profile_stage('AGGREGATE', len(data)):
+        accumulator = SalesAccumulator.from_frame(data, sketch_settings)
+    with profile_stage('FINALIZE METRICS'):
+        return accumulator.finalize()
+
+
+# Function to compute every metric from an iterable of DataFrame chunks
+# Peak memory is bounded by the chunk size rather than the file size.
+def compute_metrics_from_chunks(chunks, sketch_settings=None):
+    accumulator = SalesAccumulator(sketch_settings)
+    with profile_stage('READ AND AGGREGATE CHUNKS') as stage:
+        for chunk in chunks:
+            accumulator.add(chunk)
+        stage.rows = accumulator.row_count
+    with profile_stage('FINALIZE METRICS'):
+        return accumulator.finalize()
+
+
+# Function to compute every metric from a CSV read in chunks
+def compute_metrics_from_csv(source, chunksize=DEFAULT_CHUNK_ROWS, sketch_settings=None):
+    return compute_metrics_from_chunks(read_sales_csv(source, chunksize=chunksize), sketch_settings)
+
+
+# Function to build the summary table used by the CSV/PDF/Excel downloads
+def build_summary_df(metrics):
+    summary_data = {
+        'METRIC': [
+            'TOTAL SALES', 'AVERAGE SPEND PER PURCHASE', 'NUMBER OF UNIQUE CUSTOMERS' + metrics.distinct_label,
+            'AVERAGE SALES PER CUSTOMER' + metrics.distinct_label, 'TOTAL ITEMS SOLD', 'MOST POPULAR CATEGORY',
+            'REGION WITH HIGHEST SALES', 'DISCOUNT USAGE (%)', 'AVERAGE CUSTOMER AGE',
+            'NUMBER OF ORDERS' + metrics.distinct_label, 'AVERAGE SHIPPING COST', 'TOTAL TAX PAID',
+            'NUMBER OF UNIQUE PRODUCTS' + metrics.distinct_label,
+            'AVERAGE UNIT PRICE', 'RETURN RATE (%)', 'LOYALTY MEMBERS (%)', 'AVERAGE CUSTOMER RATING',
+            'BUSIEST DAY', 'MOST FREQUENT CUSTOMER' + metrics.frequency_label, 'AVERAGE ITEMS PER PURCHASE',
+            'MOST USED PAYMENT METHOD'
+        ],
+        'VALUE': [
+            f"${metrics.total_sales:.2f}", f"${metrics.avg_spend:.2f}", metrics.num_customers,
+            f"${metrics.sales_per_customer:.2f}", metrics.total_quantity, str(metrics.popular_category),
+            metrics.top_region, f"{metrics.discount_percentage:.1f}", f"{metrics.avg_age:.1f}",
+            metrics.num_orders, f"${metrics.avg_shipping:.2f}", f"${metrics.total_tax:.2f}", metrics.num_products,
+            f"${metrics.avg_unit_price:.2f}", f"{metrics.return_rate:.1f}", f"{metrics.loyalty_percentage:.1f}",
+            f"{metrics.avg_rating:.1f}", metrics.busiest_day.strftime('%d/%m') + f" (${metrics.busiest_day_sales:.2f})",
+            f"{metrics.most_frequent_customer} ({metrics.most_frequent_customer_purchases} purchases)",
+            f"{metrics.avg_items_per_purchase:.2f}", metrics.top_payment_method
+        ]
+    }
+    return pd.DataFrame(summary_data)
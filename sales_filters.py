@@ -0,0 +1,87 @@
+# Row indexes for filtering a dataset without scanning it
+# A FilterIndex is built once per dataset: for each filter column, the row positions of
+# every value (rows sorted by value code, with the boundaries between values), and the
+# rows sorted by Full_Date. A query starts from the most selective filter's rows and
+# checks the other filters on those candidates only, so the cost follows the size of the
+# result rather than the size of the file.
+import numpy as np
+import pandas as pd
+
+from sales_schema import flag_labels
+
+# Columns that can be filtered on (besides the Full_Date range)
+FILTER_COLUMNS = ['Region', 'Product_Category', 'Order_Channel', 'Payment_Method', 'Customer_Loyalty']
+
+_ONE_DAY = np.timedelta64(1, 'D')
+
+
+# Row positions of a dataset grouped by the values of its filter columns and sorted by date
+class FilterIndex:
+    def __init__(self, data, columns=FILTER_COLUMNS):
+        self.row_count = len(data)
+        self.columns = [column for column in columns if column in data]
+        self.labels = {}
+        self._label_codes = {}
+        self._codes = {}
+        self._rows = {}
+        self._bounds = {}
+        for column in self.columns:
+            codes, uniques = pd.factorize(data[column], sort=True)
+            if pd.api.types.is_bool_dtype(data[column]):
+                uniques = flag_labels(pd.Series(uniques))
+            self.labels[column] = [str(value) for value in uniques]
+            self._label_codes[column] = {label: code for code, label in enumerate(self.labels[column])}
+            # Missing values (code -1) sort first and belong to no value's block
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            self._codes[column] = codes
+            self._rows[column] = np.argsort(codes, kind='stable')
+            self._bounds[column] = np.cumsum(np.concatenate([[np.count_nonzero(codes < 0)], counts]))
+        self._dates = data['Full_Date'].to_numpy(dtype='datetime64[ns]')
+        self._date_rows = np.argsort(self._dates, kind='stable')
+        self._sorted_dates = self._dates[self._date_rows]
+
+    # First and last valid date (as datetime.date)
+    def date_bounds(self):
+        valid = self._sorted_dates[~np.isnat(self._sorted_dates)]
+        if len(valid) == 0:
+            return None, None
+        return pd.Timestamp(valid[0]).date(), pd.Timestamp(valid[-1]).date()
+
+    # Rows with a date in [start, end], both inclusive days (rows without a valid date never match)
+    def _date_filter(self, start, end):
+        low, high = np.datetime64(start, 'ns'), np.datetime64(end, 'ns') + _ONE_DAY
+        first, last = np.searchsorted(self._sorted_dates, [low, high])
+        positions = lambda: np.sort(self._date_rows[first:last])
+        check = lambda rows: (self._dates[rows] >= low) & (self._dates[rows] < high)
+        return last - first, positions, check
+
+    # Rows whose value of column is one of labels
+    def _value_filter(self, column, labels):
+        codes = [self._label_codes[column][label] for label in labels if label in self._label_codes[column]]
+        bounds, rows = self._bounds[column], self._rows[column]
+        size = sum(bounds[code + 1] - bounds[code] for code in codes)
+        # Each value's block is already in row order, so the merged blocks only need one sort
+        positions = lambda: np.sort(np.concatenate([rows[bounds[code]:bounds[code + 1]] for code in codes] or [rows[:0]]))
+        allowed = np.zeros(len(self.labels[column]) + 1, dtype=bool)
+        allowed[codes] = True
+        # Code -1 (missing) looks up the extra False at the end
+        check = lambda candidates: allowed[self._codes[column][candidates]]
+        return size, positions, check
+
+    # Function to find the rows matching every filter, in row order
+    # date_range is (start, end) or None; selections is ((column, labels), ...) with empty labels meaning any.
+    # Returns None when nothing is filtered.
+    def select(self, date_range=None, selections=()):
+        filters = []
+        if date_range is not None:
+            filters.append(self._date_filter(*date_range))
+        for column, labels in selections:
+            if labels:
+                filters.append(self._value_filter(column, labels))
+        if not filters:
+            return None
+        filters.sort(key=lambda selection: selection[0])
+        rows = filters[0][1]()
+        for _, _, check in filters[1:]:
+            rows = rows[check(rows)]
+        return rows
@@ -0,0 +1,233 @@
+# Background jobs shared by every session of the server
+# Parsing, aggregation and report building run in a pool of worker processes, so a
+# large upload never freezes the page and sessions don't contend for the server's GIL.
+# Jobs are keyed by what they compute (e.g. the dataset's content hash), so sessions
+# asking for the same analysis share one job. Workers report their progress per stage
+# and check for cancellation between stages and chunks. The pool's size caps how many
+# jobs run at once; further jobs wait in its queue.
+import itertools
+import os
+import sys
+import threading
+import types
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from sales_backends import DEFAULT_BACKEND, get_backend
+from sales_engine import DEFAULT_CHUNK_ROWS, compute_metrics, compute_metrics_from_chunks
+from sales_parallel import WORKER_CONTEXT, aggregate_source, process_pool
+from sales_reports import generate_excel, generate_pdf, render_chart_images
+from sales_validation import DataValidator, checked_chunks, drop_rows
+
+# Jobs run at once per server (override with the SALES_MAX_JOBS environment variable)
+DEFAULT_MAX_JOBS = int(os.environ.get('SALES_MAX_JOBS', min(os.cpu_count() or 1, 4)))
+# Finished jobs kept for other sessions to reuse (least recently used are dropped)
+DEFAULT_KEPT_JOBS = 10
+
+
+# Function (context manager) to start worker processes without the running script as their __main__
+# A spawned process first imports its parent's __main__; under Streamlit that is the app script,
+# which every worker would otherwise run in full before taking its first job.
+@contextmanager
+def _without_main_script():
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+
+# Raised by a job's worker (and by Job.result) once the job has been cancelled
+class JobCancelled(Exception):
+    pass
+
+
+# Progress of a job, as last reported by its worker
+@dataclass
+class JobProgress:
+    stage: str
+    done: int = 0
+    total: int | None = None
+
+    # Fraction of the stage completed (0 while its size is unknown)
+    @property
+    def fraction(self):
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+
+# Handle passed to a job's function in the worker: reports progress and checks for cancellation
+class JobContext:
+    def __init__(self, job_id, progress, cancelled):
+        self.job_id = job_id
+        self._progress = progress
+        self._cancelled = cancelled
+
+    # Function to report the stage the job is in (and how far through it), stopping the job if it was cancelled
+    def report(self, stage, done=0, total=None):
+        if self.job_id in self._cancelled:
+            raise JobCancelled("JOB CANCELLED")
+        self._progress[self.job_id] = (stage, done, total)
+
+
+# A submitted job, as seen by the sessions waiting for it
+class Job:
+    def __init__(self, key, job_id, future, progress):
+        self.key = key
+        self.job_id = job_id
+        self.future = future
+        self._progress = progress
+
+    def done(self):
+        return self.future.done()
+
+    # QUEUED, RUNNING, DONE, FAILED or CANCELLED
+    @property
+    def state(self):
+        if not self.future.done():
+            return 'RUNNING' if self.job_id in self._progress else 'QUEUED'
+        if self.future.cancelled() or isinstance(self.future.exception(), JobCancelled):
+            return 'CANCELLED'
+        return 'FAILED' if self.future.exception() is not None else 'DONE'
+
+    # Function to return the last progress reported by the worker (None while queued)
+    def progress(self):
+        reported = self._progress.get(self.job_id)
+        return None if reported is None else JobProgress(*reported)
+
+    # Function to wait for the job's result, re-raising the worker's error
+    def result(self, timeout=None):
+        try:
+            return self.future.result(timeout)
+        except CancelledError:
+            raise JobCancelled("JOB CANCELLED")
+
+
+# Pool of worker processes and the table of jobs submitted to it
+class JobManager:
+    def __init__(self, max_jobs=DEFAULT_MAX_JOBS, kept_jobs=DEFAULT_KEPT_JOBS):
+        self.max_jobs = max_jobs
+        self.kept_jobs = kept_jobs
+        self._pool = process_pool(max_jobs)
+        # Progress and cancellation flags live in a manager process every worker can reach
+        with _without_main_script():
+            self._manager = WORKER_CONTEXT.Manager()
+        self._progress = self._manager.dict()
+        self._cancelled = self._manager.dict()
+        self._jobs = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    # Function to return the job computing key, submitting function(context, *args) if there is none
+    # A cancelled job, or one lost with a crashed worker, is submitted again.
+    def submit(self, key, function, *args):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.state == 'CANCELLED' or (job.done() and isinstance(job.future.exception(), BrokenProcessPool)):
+                if job is not None:
+                    self._forget(job)
+                job_id = next(self._ids)
+                context = JobContext(job_id, self._progress, self._cancelled)
+                # Workers are started on demand when a job is submitted
+                with _without_main_script():
+                    try:
+                        future = self._pool.submit(function, context, *args)
+                    except BrokenProcessPool:
+                        # A worker died (e.g. out of memory); its jobs fail and the pool is replaced
+                        self._pool = process_pool(self.max_jobs)
+                        future = self._pool.submit(function, context, *args)
+                job = Job(key, job_id, future, self._progress)
+                self._jobs[key] = job
+                self._evict()
+            self._jobs.move_to_end(key)
+            return job
+
+    # Function to stop a job: a queued job never starts, a running one stops at its next progress report
+    def cancel(self, key):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.done():
+                self._cancelled[job.job_id] = True
+                job.future.cancel()
+
+    # Number of jobs queued or running
+    def active_jobs(self):
+        with self._lock:
+            return sum(not job.done() for job in self._jobs.values())
+
+    def _forget(self, job):
+        del self._jobs[job.key]
+        self._progress.pop(job.job_id, None)
+        self._cancelled.pop(job.job_id, None)
+
+    # Drop the least recently used finished jobs beyond kept_jobs
+    def _evict(self):
+        finished = [job for job in self._jobs.values() if job.done()]
+        for job in finished[:max(len(finished) - self.kept_jobs, 0)]:
+            self._forget(job)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._manager.shutdown()
+
+
+# Function to pass chunks through, reporting the rows read so far after each one
+def _reported_chunks(job, chunks, stage, total):
+    done = 0
+    job.report(stage, done, total)
+    for chunk in chunks:
+        yield chunk
+        done += len(chunk)
+        job.report(stage, done, total)
+
+
+# Job: ingest a CSV (source is a path or the raw bytes of an upload; None for a stored dataset), check its rows
+# and compute its metrics, leaving the invalid rows out first when drop_invalid is set
+# Returns the dataset key, the metrics and the ValidationReport (None for other engines, which read the file
+# themselves); the rows are left in the store for the session to load.
+def analyse_dataset(job, store, name, source, dataset_key=None, streaming=False, sketch_settings=None,
+                    backend=DEFAULT_BACKEND, drop_invalid=False):
+    if source is not None:
+        job.report('INGEST')
+        dataset_key = store.ingest(source, name)
+    if backend != DEFAULT_BACKEND:
+        job.report(f"{backend} METRICS")
+        return dataset_key, get_backend(backend).compute_metrics(store.path(dataset_key)), None
+    validator = DataValidator(keep_rows=drop_invalid)
+    if streaming:
+        chunks = store.iter_chunks(dataset_key, DEFAULT_CHUNK_ROWS)
+        chunks = _reported_chunks(job, chunks, 'READ, CHECK AND AGGREGATE CHUNKS', store.row_count(dataset_key))
+        metrics = compute_metrics_from_chunks(checked_chunks(chunks, validator, drop_invalid), sketch_settings)
+        return dataset_key, metrics, validator.report(drop_invalid)
+    job.report('LOAD DATASET')
+    data = store.load(dataset_key)
+    job.report('VALIDATE')
+    validator.check(data)
+    report = validator.report(drop_invalid)
+    if drop_invalid and report.invalid:
+        data = drop_rows(data, report.invalid_rows)
+    job.report('AGGREGATE')
+    return dataset_key, compute_metrics(data, sketch_settings), report
+
+
+# Job: ingest one of several files and aggregate it chunk by chunk
+# Returns the dataset key and the file's SalesAccumulator, to be merged with the other files'.
+def aggregate_file(job, store, name, source, sketch_settings=None, backend=DEFAULT_BACKEND):
+    return aggregate_source(store, name, source, sketch_settings, backend=backend, report=job.report)
+
+
+# Job: render the chart images and build the PDF report
+def build_pdf(job, summary_df, breakdowns, metrics):
+    job.report('CHART IMAGES')
+    chart_images = render_chart_images(metrics)
+    job.report('PDF')
+    return generate_pdf(summary_df, breakdowns, chart_images).getvalue()
+
+
+# Job: build the Excel workbook (with the cleaned rows when rows is given)
+def build_excel(job, summary_df, breakdowns, rows=None):
+    job.report('EXCEL')
+    return generate_excel(summary_df, breakdowns, rows).getvalue()
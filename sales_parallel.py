@@ -0,0 +1,98 @@
+# Parallel analysis of many sales files
+# Each file is ingested and folded into a SalesAccumulator in its own worker process;
+# the partial aggregates are then merged into one combined analysis. Wall-clock time
+# scales with the number of cores rather than the number of files.
+import copy
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from sales_backends import DEFAULT_BACKEND, get_backend
+from sales_engine import DEFAULT_CHUNK_ROWS, SalesAccumulator
+from sales_schema import SalesDataError
+
+# Workers are spawned rather than forked so they never inherit the web server's threads
+WORKER_CONTEXT = multiprocessing.get_context('spawn')
+
+
+# Function to start a pool of worker processes
+def process_pool(workers):
+    return ProcessPoolExecutor(workers, mp_context=WORKER_CONTEXT)
+
+# Function to ingest one file into the store and aggregate it chunk by chunk
+# source is a path or the raw bytes of an upload; runs inside a worker process.
+# Other backends than pandas aggregate the stored Parquet file in one query instead.
+# report(stage, done, total), when given, is called before each stage and after each chunk.
+def aggregate_source(store, name, source, sketch_settings=None, chunksize=DEFAULT_CHUNK_ROWS, backend=DEFAULT_BACKEND, report=None):
+    report = report or (lambda stage, done=0, total=None: None)
+    try:
+        report('INGEST')
+        key = store.ingest(source, name)
+        if backend != DEFAULT_BACKEND:
+            report(f"{backend} AGGREGATE")
+            return key, get_backend(backend).aggregate(store.path(key))
+        accumulator = SalesAccumulator(sketch_settings)
+        total = store.row_count(key)
+        report('READ AND AGGREGATE CHUNKS', 0, total)
+        for chunk in store.iter_chunks(key, chunksize):
+            accumulator.add(chunk)
+            report('READ AND AGGREGATE CHUNKS', accumulator.row_count, total)
+        return key, accumulator
+    except SalesDataError as e:
+        raise SalesDataError(f"{name}: {e}")
+
+
+# Function to aggregate many (name, source) pairs, in parallel when there is more than one
+# Returns (name, dataset key, accumulator) per file, in input order.
+def aggregate_sources(store, sources, sketch_settings=None, max_workers=None, backend=DEFAULT_BACKEND):
+    names = [name for name, _ in sources]
+    workers = min(max_workers or os.cpu_count() or 1, len(sources))
+    if workers <= 1:
+        results = [aggregate_source(store, name, source, sketch_settings, backend=backend) for name, source in sources]
+    else:
+        with process_pool(workers) as pool:
+            results = list(pool.map(
+                aggregate_source,
+                [store] * len(sources), names, [source for _, source in sources], [sketch_settings] * len(sources),
+                [DEFAULT_CHUNK_ROWS] * len(sources), [backend] * len(sources)
+            ))
+    return [(name, key, accumulator) for name, (key, accumulator) in zip(names, results)]
+
+
+# Function to build the per-file breakdown table
+def build_file_breakdown(named_metrics):
+    rows = []
+    for name, metrics in named_metrics:
+        rows.append({
+            'FILE': name,
+            'ROWS': metrics.row_count,
+            'FIRST DAY': metrics.sales_by_date.index.min().strftime('%d/%m/%Y'),
+            'LAST DAY': metrics.sales_by_date.index.max().strftime('%d/%m/%Y'),
+            'TOTAL SALES': f"${metrics.total_sales:.2f}",
+            'NUMBER OF ORDERS': metrics.num_orders,
+            'NUMBER OF UNIQUE CUSTOMERS': metrics.num_customers,
+            'BUSIEST DAY': metrics.busiest_day.strftime('%d/%m/%Y') + f" (${metrics.busiest_day_sales:.2f})",
+        })
+    return pd.DataFrame(rows)
+
+
+# Function to analyse many files as one combined dataset
+# Returns the combined metrics and the per-file breakdown table.
+# Backends without an approximate mode give exact partials, so the sketch settings are dropped for them.
+def analyse_sources(store, sources, sketch_settings=None, max_workers=None, backend=DEFAULT_BACKEND):
+    if not get_backend(backend).supports_estimates:
+        sketch_settings = None
+    return combine_partials(aggregate_sources(store, sources, sketch_settings, max_workers, backend), sketch_settings)
+
+
+# Function to merge the (name, dataset key, accumulator) of each file into combined metrics
+# Returns the combined metrics and the per-file breakdown table. The partials are left unchanged.
+def combine_partials(partials, sketch_settings=None):
+    breakdown = build_file_breakdown([(name, accumulator.finalize()) for name, _, accumulator in partials])
+    combined = SalesAccumulator(sketch_settings)
+    for _, _, accumulator in partials:
+        # Merging reuses the first partial's sketches in place, so partials kept for reuse are copied
+        combined.merge(copy.deepcopy(accumulator) if sketch_settings is not None else accumulator)
+    return combined.finalize(), breakdown
@@ -0,0 +1,167 @@
+# Opt-in profiling of the sales pipeline
+# A RunProfile records how long each stage of one run takes, how much memory it
+# allocates at its peak and how many rows it handled. Code marks its stages with
+# profile_stage, which does nothing unless a profile is active in the current thread,
+# so the hot paths can stay instrumented at no cost when profiling is off.
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+import pandas as pd
+
+# JSON Lines file profiled runs are appended to when logging is switched on
+DEFAULT_PROFILE_LOG = os.environ.get('SALES_PROFILE_LOG', 'profile_log.jsonl')
+
+_active_profile = contextvars.ContextVar('active_profile', default=None)
+_log_lock = threading.Lock()
+
+
+# One stage of a run; nested stages are named "OUTER / INNER"
+@dataclass
+class StageTiming:
+    stage: str
+    depth: int
+    seconds: float = 0.0
+    peak_bytes: int = 0
+    rows: int | None = None
+
+
+# The stages of one run, in the order they started
+@dataclass
+class RunProfile:
+    label: str
+    trace_memory: bool = True
+    started_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat(timespec='seconds'))
+    stages: list = field(default_factory=list)
+
+    def __post_init__(self):
+        self._open = []
+        self._start = time.perf_counter()
+        # tracemalloc is process-wide, so concurrent profiled runs see each other's allocations.
+        # It slows allocation-heavy code, so it only runs while a profile that needs it is open.
+        self._started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    # Function to time (and trace the memory of) the code inside the with block
+    @contextmanager
+    def stage(self, name, rows=None):
+        path = f"{self._open[-1].stage} / {name}" if self._open else name
+        record = StageTiming(path, len(self._open), rows=rows)
+        self.stages.append(record)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # The enclosing stage keeps the peak reached so far before the counter is reset
+            if self._open:
+                self._open[-1].peak_bytes = max(self._open[-1].peak_bytes, peak)
+            tracemalloc.reset_peak()
+            start_bytes = current
+            record.peak_bytes = current
+        self._open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            self._open.pop()
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], record.peak_bytes)
+                if self._open:
+                    self._open[-1].peak_bytes = max(self._open[-1].peak_bytes, peak)
+                record.peak_bytes = max(peak - start_bytes, 0)
+
+    # Function to end the run, stopping tracemalloc if this profile started it
+    def finish(self):
+        self._total_seconds = self.total_seconds
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracing = False
+        return self
+
+    # Seconds from the start of the run to its finish (or to now while it is running)
+    @property
+    def total_seconds(self):
+        return getattr(self, '_total_seconds', None) or time.perf_counter() - self._start
+
+    # Function to build the table shown in the profiling panel
+    def table(self):
+        return pd.DataFrame({
+            'STAGE': ['    ' * (record.depth - 1) + '└ ' * (record.depth > 0) + record.stage.split(' / ')[-1] for record in self.stages],
+            'SECONDS': [round(record.seconds, 4) for record in self.stages],
+            'PEAK MEMORY (MB)': [round(record.peak_bytes / 1024 ** 2, 2) for record in self.stages],
+            'ROWS': pd.array([record.rows for record in self.stages], dtype='Int64'),
+        })
+
+    # Function to write the run as one JSON line
+    def to_json(self, **details):
+        return json.dumps({
+            'label': self.label,
+            'started_at': self.started_at,
+            'total_seconds': round(self.total_seconds, 6),
+            **details,
+            'stages': [asdict(record) for record in self.stages],
+        }, default=str)
+
+
+# Function to make profile the active profile of the current thread (None switches profiling off)
+def activate(profile):
+    _active_profile.set(profile)
+    return profile
+
+
+# The profile active in the current thread, if any
+def active_profile():
+    return _active_profile.get()
+
+
+# Function to mark a stage of the active profile
+# Yields the stage's record (rows can be set on it once known), or a throwaway one when profiling is off.
+@contextmanager
+def profile_stage(name, rows=None):
+    profile = _active_profile.get()
+    if profile is None:
+        yield StageTiming(name, 0, rows=rows)
+        return
+    with profile.stage(name, rows) as record:
+        yield record
+
+
+# Decorator marking every call of a function as a stage of the active profile
+def profiled(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile_stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Function to run function under its own profile, for work done outside the script's thread
+# The finished profile is appended to profiles (and to the log when log_path is given).
+def run_profiled(label, function, profiles, log_path=None, trace_memory=True):
+    profile = activate(RunProfile(label, trace_memory))
+    try:
+        with profile.stage(label):
+            return function()
+    finally:
+        activate(None)
+        profiles.append(profile.finish())
+        if log_path:
+            append_to_log(profile, log_path)
+
+
+# Function to append a finished run to a JSON Lines log
+def append_to_log(profile, log_path=DEFAULT_PROFILE_LOG, **details):
+    line = profile.to_json(**details)
+    with _log_lock:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
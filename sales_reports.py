@@ -0,0 +1,325 @@
+# Report files (CSV, PDF, Excel) built from the summary table, and a headless batch generator
+# The PDF holds the summary table, chart images and breakdown tables. Tables are formatted
+# a column at a time and laid out in page-sized blocks, so appendices of thousands of
+# rows (per customer, per product) build in a fraction of a second.
+# The batch generator runs the same analysis as the ANALYSE SALES page without starting
+# Streamlit (nothing here imports streamlit or plotly), one worker process per file.
+#
+#   python sales_reports.py exports/*.csv --output reports/
+import argparse
+import hashlib
+import io
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from openpyxl import Workbook
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Flowable, Image, Paragraph, SimpleDocTemplate, Spacer
+
+from sales_anomalies import find_anomalies
+from sales_baskets import BasketPairs
+from sales_engine import SalesDataError, build_summary_df, compute_metrics
+from sales_schema import flag_labels, read_sales_csv
+from sales_sketches import SketchSettings
+
+# Report formats written by the batch generator
+REPORT_FORMATS = ['csv', 'pdf', 'xlsx']
+
+
+# Table rows per block in the PDF; long tables are laid out as one block per page
+PDF_ROWS_PER_BLOCK = 40
+# Width of the printable area of a letter page with the default margins
+_PDF_WIDTH = letter[0] - 2 * inch
+_PDF_FONT_SIZE = 9
+_PDF_ROW_HEIGHT = 14
+# Width of one Courier character, used to cut cell text to its column
+_PDF_CHAR_WIDTH = 0.6 * _PDF_FONT_SIZE
+
+
+# Function to build the breakdown tables of a report (title -> DataFrame)
+# The per-date, per-region and payment tables come from the metrics; the per-category,
+# per-product and per-customer tables need the row-level data and are left out without it.
+# The products bought together (a BasketPairs, counted here when not given) need the rows too.
+# The sales anomalies (from find_anomalies, found here when not given) come last.
+def build_breakdowns(metrics, data=None, anomalies=None, baskets=None):
+    breakdowns = {
+        'SALES BY DATE': pd.DataFrame({
+            'DATE': metrics.sales_by_date.index,
+            'SALES ($)': metrics.sales_by_date.to_numpy(),
+        }),
+        'SALES BY REGION': pd.DataFrame({
+            'REGION': metrics.sales_by_region.index.astype(str),
+            'SALES ($)': metrics.sales_by_region.to_numpy(),
+        }).sort_values('SALES ($)', ascending=False, kind='stable'),
+        'PURCHASES BY PAYMENT METHOD': pd.DataFrame({
+            'PAYMENT METHOD': metrics.payment_breakdown.index.astype(str),
+            'PURCHASES': metrics.payment_breakdown.to_numpy(),
+        }),
+    }
+    if data is not None:
+        amounts = data['Purchase_Amount'].astype('float64').round(2)
+        for title, column, label in [
+            ('SALES BY CATEGORY', 'Product_Category', 'CATEGORY'),
+            ('SALES BY PRODUCT', 'Product_ID', 'PRODUCT'),
+            ('SALES BY CUSTOMER', 'Customer_ID', 'CUSTOMER'),
+        ]:
+            grouped = amounts.groupby(data[column], observed=True)
+            table = pd.DataFrame({
+                'PURCHASES': grouped.count(),
+                'ITEMS': data['Quantity'].groupby(data[column], observed=True).sum(),
+                'SALES ($)': grouped.sum(),
+                'AVERAGE SPEND ($)': grouped.mean(),
+            }).sort_values('SALES ($)', ascending=False, kind='stable')
+            breakdowns[title] = table.rename_axis(label).reset_index()
+        breakdowns['BOUGHT TOGETHER'] = (baskets if baskets is not None else BasketPairs(data)).export_table()
+    anomalies = anomalies if anomalies is not None else find_anomalies(metrics, data)
+    breakdowns['SALES ANOMALIES'] = anomalies.days
+    if anomalies.orders is not None:
+        breakdowns['ORDER OUTLIERS'] = anomalies.orders
+    return breakdowns
+
+
+# Function to render the report charts once as PNG images (title -> bytes)
+def render_chart_images(metrics):
+    charts = {}
+    sales_by_date = metrics.sales_by_date
+    sales_by_region = metrics.sales_by_region.sort_values(ascending=False)
+    payment_breakdown = metrics.payment_breakdown
+    for title, draw in [
+        ('SALES OVER TIME', lambda ax: ax.plot(sales_by_date.index, sales_by_date.to_numpy(), color='#FF0000', linewidth=2)),
+        ('SALES BY REGION', lambda ax: ax.bar(sales_by_region.index.astype(str), sales_by_region.to_numpy(), color='#FF0000')),
+        ('PURCHASES BY PAYMENT METHOD', lambda ax: ax.bar(payment_breakdown.index.astype(str), payment_breakdown.to_numpy(), color='#FF0000')),
+    ]:
+        fig = Figure(figsize=(8, 4), dpi=100)
+        ax = fig.add_subplot()
+        draw(ax)
+        ax.set_title(title)
+        ax.grid(axis='y', alpha=0.3)
+        fig.autofmt_xdate()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', bbox_inches='tight')
+        charts[title] = buffer.getvalue()
+    return charts
+
+
+# Function to format every cell of a table as text, a whole column at a time
+# Returns one numpy string array per column.
+def format_columns(table):
+    columns = []
+    for column in table.columns:
+        values = table[column]
+        if pd.api.types.is_float_dtype(values):
+            columns.append(np.char.mod('%.2f', values.to_numpy(dtype=np.float64, na_value=np.nan)))
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            columns.append(values.dt.strftime('%d/%m/%Y').fillna('').to_numpy(dtype=str))
+        else:
+            columns.append(values.astype(str).to_numpy(dtype=str))
+    return columns
+
+
+# One page-sized block of a table
+# Each column is drawn as a single text object of all its lines, rather than one drawing
+# call per cell as a platypus Table does, which keeps large tables fast.
+class _TableBlock(Flowable):
+    def __init__(self, header, columns, column_widths):
+        super().__init__()
+        self.header = header
+        self.columns = columns
+        self.column_widths = column_widths
+        self.row_count = len(columns[0])
+
+    def wrap(self, available_width, available_height):
+        self.width = sum(self.column_widths)
+        self.height = (self.row_count + 1) * _PDF_ROW_HEIGHT
+        return self.width, self.height
+
+    def draw(self):
+        c = self.canv
+        top = self.height
+        c.setFillColor(colors.HexColor('#FF0000'))
+        c.rect(0, top - _PDF_ROW_HEIGHT, self.width, _PDF_ROW_HEIGHT, stroke=0, fill=1)
+        c.setFillColor(colors.HexColor('#F2F2F2'))
+        for row in range(2, self.row_count + 1, 2):
+            c.rect(0, top - (row + 1) * _PDF_ROW_HEIGHT, self.width, _PDF_ROW_HEIGHT, stroke=0, fill=1)
+        x_positions = np.concatenate([[0], np.cumsum(self.column_widths)]).tolist()
+        c.setStrokeColor(colors.grey)
+        c.setLineWidth(0.25)
+        c.grid(x_positions, [top - row * _PDF_ROW_HEIGHT for row in range(self.row_count + 2)])
+        for x, title, values in zip(x_positions, self.header, self.columns):
+            text = c.beginText(x + 3, top - _PDF_ROW_HEIGHT + 4)
+            text.setFont('Courier-Bold', _PDF_FONT_SIZE, _PDF_ROW_HEIGHT)
+            text.setFillColor(colors.white)
+            text.textLine(title)
+            text.setFont('Courier', _PDF_FONT_SIZE, _PDF_ROW_HEIGHT)
+            text.setFillColor(colors.black)
+            text.textLines(values)
+            c.drawText(text)
+
+
+# Function to lay out a table as page-sized blocks, each repeating the header
+def _table_blocks(table, column_widths=None):
+    header = [str(column) for column in table.columns]
+    column_widths = column_widths or [_PDF_WIDTH / len(header)] * len(header)
+    # Cut every cell to its column width (casting to a shorter string type truncates)
+    columns = [
+        values.astype(f"<U{max(int((width - 6) / _PDF_CHAR_WIDTH), 1)}").tolist()
+        for values, width in zip(format_columns(table), column_widths)
+    ]
+    blocks = []
+    for start in range(0, max(len(table), 1), PDF_ROWS_PER_BLOCK):
+        blocks.append(_TableBlock(header, [column[start:start + PDF_ROWS_PER_BLOCK] for column in columns], column_widths))
+    return blocks
+
+
+# Function to generate PDF
+# breakdowns (from build_breakdowns) and chart_images (from render_chart_images) are optional.
+def generate_pdf(summary_df, breakdowns=None, chart_images=None):
+    buffer = io.BytesIO()
+    styles = getSampleStyleSheet()
+    heading = ParagraphStyle('TableHeading', parent=styles['Heading2'], keepWithNext=1)
+    story = [Paragraph("DATA ANALYSIS REPORT", styles['Title'])]
+    story += _table_blocks(summary_df, [_PDF_WIDTH * 0.55, _PDF_WIDTH * 0.45])
+    for image in (chart_images or {}).values():
+        story += [Spacer(1, 12), Image(io.BytesIO(image), width=_PDF_WIDTH, height=_PDF_WIDTH / 2)]
+    for title, table in (breakdowns or {}).items():
+        story += [Spacer(1, 12), Paragraph(title, heading)]
+        story += _table_blocks(table)
+    SimpleDocTemplate(buffer, pagesize=letter, title="DATA ANALYSIS REPORT").build(story)
+    buffer.seek(0)
+    return buffer
+
+
+# Function to generate the CSV report text
+# tables (title -> DataFrame, e.g. from compare_periods) follow the summary, each after a blank line and its title.
+def generate_csv(summary_df, tables=None):
+    csv_buffer = io.StringIO()
+    summary_df.to_csv(csv_buffer, index=False)
+    for title, table in (tables or {}).items():
+        csv_buffer.write(f"\n{title}\n")
+        table.to_csv(csv_buffer, index=False)
+    return csv_buffer.getvalue()
+
+
+# Most data rows on one Excel sheet (the format's limit, less the header row)
+EXCEL_MAX_ROWS = 1_048_575
+# Rows converted to Python values at a time while writing a sheet
+_EXCEL_BLOCK_ROWS = 10_000
+
+
+# Function to stream a DataFrame into write-only sheets, a block of rows at a time
+# Tables longer than one sheet continue on further sheets ("ROWS", "ROWS 2", ...).
+def _write_sheets(workbook, title, table):
+    for part, sheet_start in enumerate(range(0, max(len(table), 1), EXCEL_MAX_ROWS)):
+        sheet = workbook.create_sheet(title if part == 0 else f"{title} {part + 1}")
+        sheet.append([str(column) for column in table.columns])
+        sheet_end = min(sheet_start + EXCEL_MAX_ROWS, len(table))
+        for start in range(sheet_start, sheet_end, _EXCEL_BLOCK_ROWS):
+            block = table.iloc[start:min(start + _EXCEL_BLOCK_ROWS, sheet_end)]
+            columns = [_excel_values(block[column]) for column in block.columns]
+            for row in zip(*columns):
+                sheet.append(row)
+
+
+# Cell values of one column: money widened to rounded float64, flags as Yes/No, missing values empty
+def _excel_values(values):
+    if values.dtype == 'float32':
+        values = values.astype('float64').round(2)
+    values = flag_labels(values)
+    return values.astype(object).where(values.notna(), None)
+
+
+# Function to generate Excel
+# The workbook is written in openpyxl's write-only mode, so rows are streamed out instead
+# of being held as cell objects. breakdowns (from build_breakdowns) add one detail sheet
+# each, and rows adds the cleaned row-level data.
+def generate_excel(summary_df, breakdowns=None, rows=None):
+    workbook = Workbook(write_only=True)
+    _write_sheets(workbook, 'SUMMARY', summary_df)
+    for title, table in (breakdowns or {}).items():
+        _write_sheets(workbook, title, table)
+    if rows is not None:
+        _write_sheets(workbook, 'ROWS', rows)
+    excel_buffer = io.BytesIO()
+    workbook.save(excel_buffer)
+    excel_buffer.seek(0)
+    return excel_buffer
+
+
+# Function to name each input's reports: the file name without its .csv, plus a short hash of the
+# file's full path when several inputs share a name (e.g. store.csv from two store directories)
+# Raises ValueError if two inputs would still write the same reports.
+def report_names(paths):
+    stems = [Path(path).name.removesuffix('.csv') for path in paths]
+    repeated = Counter(stems)
+    names = [
+        stem if repeated[stem] == 1 else f"{stem}_{hashlib.blake2b(str(Path(path).resolve()).encode(), digest_size=4).hexdigest()}"
+        for stem, path in zip(stems, paths)
+    ]
+    clashes = sorted(name for name, count in Counter(names).items() if count > 1)
+    if clashes:
+        raise ValueError(f"Several inputs would write the reports named {', '.join(clashes)}")
+    return names
+
+
+# Function to analyse one sales CSV and write its reports into output_dir as <name>_report.<format>
+# Returns the paths written; runs inside a worker process. name defaults to the file name without .csv.
+# With include_rows the workbook also gets the cleaned rows.
+def write_reports(path, output_dir, estimate_error=None, include_rows=False, name=None):
+    sketch_settings = SketchSettings.for_error(estimate_error) if estimate_error else None
+    data = read_sales_csv(path)
+    metrics = compute_metrics(data, sketch_settings)
+    summary_df = build_summary_df(metrics)
+    breakdowns = build_breakdowns(metrics, data)
+    name = name or report_names([path])[0]
+    reports = {
+        'csv': generate_csv(summary_df).encode(),
+        'pdf': generate_pdf(summary_df, breakdowns, render_chart_images(metrics)).getvalue(),
+        'xlsx': generate_excel(summary_df, breakdowns, data if include_rows else None).getvalue(),
+    }
+    written = []
+    for extension in REPORT_FORMATS:
+        report_path = Path(output_dir) / f"{name}_report.{extension}"
+        report_path.write_bytes(reports[extension])
+        written.append(str(report_path))
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write CSV, PDF and Excel sales reports for each input file.")
+    parser.add_argument('files', nargs='+', help="sales CSV files")
+    parser.add_argument('--output', default='reports', help="directory the reports are written to")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--estimate-error', type=float, default=None,
+                        help="use approximate mode with this error bound (e.g. 0.01)")
+    parser.add_argument('--include-rows', action='store_true', help="add the cleaned rows to the Excel report")
+    args = parser.parse_args(argv)
+
+    # A file listed twice is reported once
+    files = list({Path(path).resolve(): path for path in args.files}.values())
+    names = report_names(files)
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    workers = min(args.workers or os.cpu_count() or 1, len(files))
+    failed = 0
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(write_reports, path, args.output, args.estimate_error, args.include_rows, name)
+                   for path, name in zip(files, names)]
+        for path, future in zip(files, futures):
+            try:
+                print(f"{path} -> {', '.join(future.result())}")
+            except (SalesDataError, OSError, ValueError) as e:
+                failed += 1
+                print(f"SKIPPED {path}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
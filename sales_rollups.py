@@ -0,0 +1,292 @@
+# Persistent time-bucketed rollups of the sales history
+# Daily, weekly and monthly totals per Region, Product_Category, Payment_Method and
+# Order_Channel are kept as small Parquet tables. Appending a file aggregates only its
+# rows and merges them into the stored tables, so the history's totals and its sales over
+# time are read from tables that grow with the number of days, not the number of rows.
+# Each append writes every table out again in full: a cost that grows with the days and
+# dimension combinations of the history, not with the rows appended.
+# Each file's content hash is recorded, so appending the same file twice has no effect.
+# Sales anomalies over the daily table are kept alongside; an append rescores only the
+# days it added and the window after them.
+#
+#   python sales_rollups.py append exports/sales_2025_*.csv
+#   python sales_rollups.py show --granularity MONTH
+import argparse
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+import pandas as pd
+
+from sales_anomalies import update_day_anomalies
+from sales_engine import DEFAULT_CHUNK_ROWS, parse_full_date
+from sales_schema import SalesDataError, read_sales_csv
+from sales_store import content_hash, file_hash
+
+# Where the rollups are kept (override with the SALES_ROLLUP_DIR environment variable)
+DEFAULT_ROLLUP_DIR = os.environ.get('SALES_ROLLUP_DIR', 'rollups')
+ROLLUP_DIMENSIONS = ['Region', 'Product_Category', 'Payment_Method', 'Order_Channel']
+# Pandas period of each granularity (weeks run Monday to Sunday)
+GRANULARITIES = {'DAY': 'D', 'WEEK': 'W', 'MONTH': 'M'}
+# Totals kept per period and dimension combination
+ROLLUP_MEASURES = ['PURCHASES', 'SALES', 'ITEMS', 'TAX', 'SHIPPING']
+# Columns of the file read when appending
+_SOURCE_COLUMNS = ['Day_Month', 'Year', 'Purchase_Amount', 'Quantity', 'Tax_Amount', 'Shipping_Cost'] + ROLLUP_DIMENSIONS
+
+
+# Function to map dates (a Series or DatetimeIndex) to the start of their day, week or month
+def period_start(dates, granularity):
+    if granularity == 'DAY':
+        return dates
+    if isinstance(dates, pd.Series):
+        return dates.dt.to_period(GRANULARITIES[granularity]).dt.start_time
+    return dates.to_period(GRANULARITIES[granularity]).start_time
+
+
+# Function to total rows (with a Full_Date column) per day and dimension combination
+# Rows with an invalid date are left out.
+def rollup_frame(data):
+    valid = data['Full_Date'].notna()
+    frame = pd.DataFrame({
+        'Period': data['Full_Date'],
+        **{dimension: data[dimension] for dimension in ROLLUP_DIMENSIONS},
+        # Money is widened from float32 and snapped to cents, as in the engine
+        'SALES': data['Purchase_Amount'].astype('float64').round(2),
+        'ITEMS': data['Quantity'].astype('Int64'),
+        'TAX': data['Tax_Amount'].astype('float64').round(2),
+        'SHIPPING': data['Shipping_Cost'].astype('float64').round(2),
+    })[valid]
+    grouped = frame.groupby(['Period'] + ROLLUP_DIMENSIONS, observed=True, dropna=False)
+    table = grouped[ROLLUP_MEASURES[1:]].sum()
+    table.insert(0, 'PURCHASES', grouped.size())
+    table = table.reset_index()
+    for dimension in ROLLUP_DIMENSIONS:
+        table[dimension] = table[dimension].astype('str')
+    return table
+
+
+# Function to combine rollup tables of the same granularity, adding up shared keys
+# Only the periods right covers are regrouped, so appending a day to a long history
+# costs about as much as the day itself.
+def merge_rollups(left, right):
+    if left is None or left.empty:
+        return right
+    affected = left['Period'].isin(right['Period'].unique())
+    combined = pd.concat([left[affected], right], ignore_index=True)
+    merged = combined.groupby(['Period'] + ROLLUP_DIMENSIONS, dropna=False)[ROLLUP_MEASURES].sum().reset_index()
+    return pd.concat([left[~affected], merged], ignore_index=True).sort_values('Period', kind='stable', ignore_index=True)
+
+
+# Function to roll a daily table up to weeks or months
+def regroup(table, granularity):
+    if granularity == 'DAY':
+        return table
+    coarser = table.assign(Period=period_start(table['Period'], granularity))
+    return coarser.groupby(['Period'] + ROLLUP_DIMENSIONS, dropna=False)[ROLLUP_MEASURES].sum().reset_index()
+
+
+# Function to compute the headline totals of a rollup table
+def rollup_totals(table):
+    purchases = int(table['PURCHASES'].sum())
+    sales = table['SALES'].sum()
+    return {
+        'TOTAL SALES': sales,
+        'NUMBER OF PURCHASES': purchases,
+        'AVERAGE SPEND PER PURCHASE': sales / purchases if purchases else 0.0,
+        'TOTAL ITEMS SOLD': int(table['ITEMS'].sum()),
+        'TOTAL TAX PAID': table['TAX'].sum(),
+        'AVERAGE SHIPPING COST': table['SHIPPING'].sum() / purchases if purchases else 0.0,
+        'FIRST PERIOD': table['Period'].min(),
+        'LAST PERIOD': table['Period'].max(),
+    }
+
+
+# Function to total sales per period, optionally one line per value of a dimension
+def sales_over_time(table, split_by=None):
+    keys = ['Period'] if split_by is None else ['Period', split_by]
+    return table.groupby(keys, dropna=False)['SALES'].sum().reset_index()
+
+
+# Function (context manager) to hold an exclusive lock on a file, across processes
+@contextmanager
+def _locked(path):
+    with open(path, 'a+b') as handle:
+        if os.name == 'nt':
+            handle.seek(0)
+            # LK_LOCK gives up after 10 seconds; appends can take longer, so keep asking
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        else:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+# Directory of rollup tables (one Parquet file per granularity, plus the anomalies) and the list of appended files
+# manifest.json names the current file of every table and lists the appended files. An append writes new,
+# uniquely named tables and replaces the manifest last, in one rename, so readers see the whole append or
+# none of it, and an append that fails part way leaves the store as it was and can be retried.
+# Appends hold a lock file in the directory, so processes sharing it (server workers, the command
+# line) take turns: none removes another's new tables or replaces the manifest from an outdated one.
+class RollupStore:
+    def __init__(self, root=DEFAULT_ROLLUP_DIR):
+        self.root = Path(root)
+        # Appends are serialised, in this process and across processes; table files are never rewritten,
+        # so loaded tables are kept by file name
+        self._lock = threading.Lock()
+        self._tables = {}
+
+    def _manifest_path(self):
+        return self.root / 'manifest.json'
+
+    def _lock_path(self):
+        return self.root / '.append.lock'
+
+    # Function to read the manifest: {'tables': {table: file name}, 'sources': [...]}, empty before the first append
+    def _manifest(self):
+        try:
+            return json.loads(self._manifest_path().read_text())
+        except FileNotFoundError:
+            return {'tables': {}, 'sources': []}
+
+    # Function to list the appended files (key, name, rows, skipped rows, appended at), oldest first
+    def sources(self):
+        return self._manifest()['sources']
+
+    # Function to read one table of the manifest (None before the first append)
+    # An append may remove the file a reader has just looked up, so a missing file sends it back to the manifest.
+    def _read(self, table):
+        for attempt in range(2):
+            file_name = self._manifest()['tables'].get(table)
+            if file_name is None:
+                return None
+            cached = self._tables.get(table)
+            if cached is not None and cached[0] == file_name:
+                return cached[1]
+            try:
+                frame = pd.read_parquet(self.root / file_name)
+            except FileNotFoundError:
+                if attempt:
+                    raise
+                continue
+            self._tables[table] = (file_name, frame)
+            return frame
+
+    # Function to load the rollup table of one granularity (None before the first append)
+    def load(self, granularity):
+        return self._read(granularity)
+
+    # Function to load the sales anomalies of the daily history (None before the first append)
+    def anomalies(self):
+        return self._read('ANOMALIES')
+
+    # Function to write a table to a new file and return its name
+    def _write(self, table, name):
+        file_name = f"{name.lower()}.{uuid.uuid4().hex}.parquet"
+        table.to_parquet(self.root / file_name, index=False)
+        return file_name
+
+    # Function to remove the table files the manifest no longer names (earlier versions, failed appends)
+    def _remove_unused(self, manifest):
+        used = set(manifest['tables'].values())
+        for path in self.root.glob('*.parquet'):
+            if path.name not in used:
+                path.unlink(missing_ok=True)
+
+    # Function to aggregate a CSV (a path or the raw bytes of an upload) into every granularity
+    # Returns the file's entry in sources(), or None when the same content was appended before.
+    def append(self, source, name=None, chunksize=DEFAULT_CHUNK_ROWS):
+        if isinstance(source, (bytes, bytearray)):
+            key = content_hash(source)
+            stream = io.BytesIO(source)
+        else:
+            key = file_hash(source)
+            name = name or Path(source).name
+            stream = source
+        if any(entry['key'] == key for entry in self.sources()):
+            return None
+
+        # Only the new file's rows are read; they are reduced to daily totals chunk by chunk
+        daily = None
+        rows = skipped = 0
+        for chunk in read_sales_csv(stream, chunksize=chunksize, usecols=_SOURCE_COLUMNS):
+            parse_full_date(chunk)
+            rows += len(chunk)
+            skipped += int(chunk['Full_Date'].isna().sum())
+            daily = merge_rollups(daily, rollup_frame(chunk))
+        if rows == skipped:
+            raise SalesDataError("DATE COLUMN ISSUE: All 'Day_Month/Year' values are invalid—check your CSV format.")
+
+        entry = {'key': key, 'name': name or key, 'rows': rows, 'skipped_rows': skipped, 'appended_at': time.time()}
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock, _locked(self._lock_path()):
+            manifest = self._manifest()
+            # Another session or process may have appended the same file while this one was reading it
+            if any(appended['key'] == key for appended in manifest['sources']):
+                return None
+            frames = {granularity: merge_rollups(self.load(granularity), regroup(daily, granularity)) for granularity in GRANULARITIES}
+            frames['ANOMALIES'] = update_day_anomalies(self.anomalies(), frames['DAY'], daily['Period'].unique())
+            tables = {name: self._write(frame, name) for name, frame in frames.items()}
+            manifest = {'tables': tables, 'sources': manifest['sources'] + [entry]}
+            temp_path = self.root / f".manifest.{uuid.uuid4().hex}.tmp"
+            temp_path.write_text(json.dumps(manifest))
+            os.replace(temp_path, self._manifest_path())
+            self._remove_unused(manifest)
+        return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the day, week and month rollups of the sales history.")
+    parser.add_argument('--store', default=DEFAULT_ROLLUP_DIR, help="rollup directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    append_parser = commands.add_parser('append', help="add sales CSVs to the rollups")
+    append_parser.add_argument('files', nargs='+')
+    show_parser = commands.add_parser('show', help="print the totals and sales per period")
+    show_parser.add_argument('--granularity', choices=list(GRANULARITIES), default='MONTH')
+    args = parser.parse_args(argv)
+
+    store = RollupStore(args.store)
+    if args.command == 'append':
+        for path in args.files:
+            try:
+                entry = store.append(path)
+            except SalesDataError as e:
+                print(f"SKIPPED {path}: {e}")
+                continue
+            print(f"ALREADY APPENDED {path}" if entry is None else f"APPENDED {entry['rows']:,} ROWS FROM {path}")
+    else:
+        table = store.load(args.granularity)
+        if table is None:
+            print("NO SALES HISTORY YET")
+            return
+        for label, value in rollup_totals(table).items():
+            print(f"{label}: {value}")
+        print(sales_over_time(table).to_string(index=False))
+        anomalies = store.anomalies()
+        if anomalies is not None and not anomalies.empty:
+            print(f"SALES ANOMALIES ({len(anomalies)}):")
+            print(anomalies.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
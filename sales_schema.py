@@ -0,0 +1,175 @@
+# Declared schema for the sales_data.csv layout
+# Reading with explicit compact dtypes instead of letting pandas infer them keeps text
+# columns out of Python objects, which cuts memory several times over and makes every
+# value_counts/groupby in the analysis faster.
+import io
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    _ID_STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    pa = None
+    _ID_STRING_DTYPE = "string"
+
+
+# Raised when the uploaded data cannot be analysed; the message is shown to the user
+class SalesDataError(Exception):
+    pass
+
+
+# Yes/No columns, stored as nullable booleans (anything other than Yes/No becomes <NA>, so such values
+# count as missing: they leave the DISCOUNT USAGE denominator, where the raw text once counted; the return
+# and loyalty rates are shares of every row either way)
+FLAG_COLUMNS = ['Discount_Applied', 'Return_Status', 'Customer_Loyalty']
+
+# Every column of a sales file, in file order, with the dtype it is read as.
+# Money is float32: amounts keep exact cents up to about $65,000 per row, and the
+# engine widens them back to float64 before summing.
+# Ages and ratings are 16-bit so out-of-range values stay visible instead of wrapping.
+SALES_DTYPES = {
+    'Day_Month': 'category',
+    'Year': 'Int16',
+    'Customer_ID': 'category',
+    'Purchase_Amount': 'float32',
+    'Product_Category': 'category',
+    'Quantity': 'Int32',
+    'Payment_Method': 'category',
+    'Region': 'category',
+    'Discount_Applied': 'category',
+    'Customer_Age': 'Int16',
+    'Customer_Gender': 'category',
+    'Order_ID': _ID_STRING_DTYPE,
+    'Transaction_Time': 'category',
+    'Shipping_Cost': 'float32',
+    'Tax_Amount': 'float32',
+    'Product_ID': 'category',
+    'Unit_Price': 'float32',
+    'Return_Status': 'category',
+    'Customer_Loyalty': 'category',
+    'Order_Channel': 'category',
+    'Delivery_Method': 'category',
+    'Customer_Rating': 'Int16',
+    'Purchase_Source': 'category',
+}
+SALES_COLUMNS = list(SALES_DTYPES)
+MONEY_COLUMNS = [column for column, dtype in SALES_DTYPES.items() if dtype == 'float32']
+
+
+# Function to check that a file has every sales column before any data is parsed
+def validate_columns(columns):
+    missing = [column for column in SALES_COLUMNS if column not in set(columns)]
+    if missing:
+        raise SalesDataError(f"SCHEMA ISSUE: Missing column(s) {', '.join(missing)} - expected the sales_data.csv layout.")
+
+
+# Function to convert the Yes/No columns of a freshly read frame to booleans
+def apply_flag_types(data):
+    for column in FLAG_COLUMNS:
+        if column in data.columns and not pd.api.types.is_bool_dtype(data[column]):
+            data[column] = data[column].map({'Yes': True, 'No': False}).astype('boolean')
+    return data
+
+
+# Function to show boolean Yes/No values as the labels used in the CSV
+def flag_labels(values):
+    if pd.api.types.is_bool_dtype(values):
+        return values.map({True: 'Yes', False: 'No'})
+    return values
+
+
+# Cells read as missing, as pandas' CSV parser does: its default NA strings, blank cells included
+NULL_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+# Arrow type for each pandas dtype of the schema (category columns are dictionary-encoded strings,
+# matching pandas, which also reads categories as strings)
+def _arrow_type(dtype):
+    return {
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'Int16': pa.int16(),
+        'Int32': pa.int32(),
+        'float32': pa.float32(),
+    }.get(dtype, pa.string())
+
+
+# Function to give the sales columns of an Arrow schema their declared types (other columns keep theirs)
+def arrow_schema(schema):
+    return pa.schema([
+        (field.name, _arrow_type(SALES_DTYPES[field.name])) if field.name in SALES_DTYPES else field for field in schema
+    ])
+
+
+# pyarrow CSV options that read every schema column with its declared type
+# Integers are parsed as float64 and narrowed by cast_to_schema, so "4.0" (as pandas writes a
+# column with gaps) is accepted like pandas accepts it, while 4.5 or an out-of-range value still fails.
+def arrow_convert_options(usecols=None):
+    column_types = {column: _arrow_type(dtype) for column, dtype in SALES_DTYPES.items()}
+    for column, dtype in SALES_DTYPES.items():
+        if dtype.startswith('Int'):
+            column_types[column] = pa.float64()
+    return pa_csv.ConvertOptions(
+        column_types=column_types,
+        include_columns=list(usecols) if usecols is not None else None,
+        null_values=NULL_VALUES,
+        strings_can_be_null=True
+    )
+
+
+# Function to narrow a table or batch read with arrow_convert_options to the declared types
+# Raises pa.ArrowInvalid when an integer column holds a fraction or an out-of-range value.
+def cast_to_schema(table):
+    return table.cast(arrow_schema(table.schema))
+
+
+# Function to turn an Arrow table or batch of sales rows into a typed DataFrame
+def arrow_to_frame(table):
+    nullable_ints = {pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype()}
+    data = table.to_pandas(types_mapper=nullable_ints.get)
+    if 'Order_ID' in data.columns:
+        data['Order_ID'] = data['Order_ID'].astype(_ID_STRING_DTYPE)
+    return apply_flag_types(data)
+
+
+# Whole-file read with pyarrow's multi-threaded CSV parser, several times faster than
+# pandas' C parser for categorical columns; out-of-range integers raise instead of wrapping
+def _read_with_pyarrow(source, usecols):
+    return arrow_to_frame(cast_to_schema(pa_csv.read_csv(source, convert_options=arrow_convert_options(usecols))))
+
+
+# Rewind a file-like source so it can be read again
+def _rewind(source, position):
+    if position is not None:
+        source.seek(position)
+
+
+# Function to read a sales CSV with the declared schema
+# The header is checked first so a wrong file fails fast with a clear message.
+# With chunksize an iterator of typed chunks is returned instead of one frame.
+def read_sales_csv(source, chunksize=None, usecols=None):
+    position = source.tell() if hasattr(source, 'seek') else None
+    header = pd.read_csv(source, nrows=0).columns
+    _rewind(source, position)
+    validate_columns(header)
+    wanted = usecols if usecols is not None else header
+    dtypes = {column: SALES_DTYPES[column] for column in wanted if column in SALES_DTYPES}
+    try:
+        if chunksize is None and pa is not None and not isinstance(source, io.TextIOBase):
+            return _read_with_pyarrow(source, usecols)
+        reader = pd.read_csv(source, dtype=dtypes, usecols=usecols, chunksize=chunksize)
+        if chunksize is None:
+            return apply_flag_types(reader)
+    except ValueError as e:
+        raise SalesDataError(f"SCHEMA ISSUE: A column does not match its expected type - {e}")
+    return _typed_chunks(reader)
+
+
+def _typed_chunks(reader):
+    try:
+        for chunk in reader:
+            yield apply_flag_types(chunk)
+    except ValueError as e:
+        raise SalesDataError(f"SCHEMA ISSUE: A column does not match its expected type - {e}")
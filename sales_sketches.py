@@ -0,0 +1,178 @@
+# Mergeable sketches for approximate analysis of very large sales files
+# Every sketch takes whole arrays at a time (one chunk of rows), can be merged with
+# another sketch of the same settings, and uses memory that does not grow with the
+# number of rows.
+import math
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Error bounds hold with 99% confidence: a distinct count is within distinct_error of the true count, and a
+# quantile within quantile_error of its rank, 99 times in 100. HyperLogLog's relative standard error is
+# 1.04 / sqrt(registers), so its bound is 2.576 standard errors; the KLL rank error is already a 99% bound.
+CONFIDENCE_SIGMAS = 2.576
+# Largest HyperLogLog precision (2**19 one-byte registers, 512 KB per sketch)
+MAX_PRECISION = 19
+
+
+# Accuracy settings shared by the sketches of one analysis
+@dataclass(frozen=True)
+class SketchSettings:
+    # HyperLogLog uses 2**precision registers
+    precision: int = 14
+    # KLL keeps about 3 * quantile_k values
+    quantile_k: int = 200
+    # Misra-Gries keeps this many candidate customers for MOST FREQUENT CUSTOMER
+    heavy_hitters: int = 10000
+
+    # Settings whose distinct count and quantile error bounds are at most target_error (0.01 = 1%)
+    @classmethod
+    def for_error(cls, target_error):
+        precision = math.ceil(math.log2((CONFIDENCE_SIGMAS * 1.04 / target_error) ** 2))
+        quantile_k = math.ceil((2.296 / target_error) ** (1 / 0.9723))
+        return cls(precision=min(max(precision, 4), MAX_PRECISION), quantile_k=max(quantile_k, 8))
+
+    # Relative error bound of the distinct counts (99% confidence)
+    @property
+    def distinct_error(self):
+        return CONFIDENCE_SIGMAS * 1.04 / math.sqrt(2 ** self.precision)
+
+    # Normalised rank error bound of the quantiles (99% confidence)
+    @property
+    def quantile_error(self):
+        return 2.296 / self.quantile_k ** 0.9723
+
+
+# 64-bit hashes of the non-missing values, stable across chunks and processes
+def _hash_values(values):
+    series = pd.Series(values)
+    return pd.util.hash_pandas_object(series[series.notna()], index=False).to_numpy()
+
+
+# Number of bits needed to hold each value of a uint64 array
+def _bit_length(values):
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = values >= np.uint64(1 << shift)
+        lengths[mask] += shift
+        values[mask] >>= np.uint64(shift)
+    lengths += (values > 0).astype(np.uint8)
+    return lengths
+
+
+# HyperLogLog distinct counter
+class HyperLogLog:
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def update(self, values):
+        hashes = _hash_values(values)
+        if len(hashes) == 0:
+            return self
+        value_bits = 64 - self.precision
+        index = (hashes >> np.uint64(value_bits)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << value_bits) - 1)
+        rank = (value_bits - _bit_length(remainder) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+# KLL quantile sketch: level h holds sorted-and-halved samples that each stand for 2**h values
+class KLLSketch:
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays at this level
+                leftover, items = items[:len(items) % 2], items[len(items) % 2:]
+                survivors = items[self._rng.integers(2)::2]
+                self.levels[level] = leftover
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], survivors])
+                # Adding a level shrinks the capacities below it, so start again from the bottom
+                level = 0
+            else:
+                level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        values = np.concatenate(self.levels)
+        if len(values) == 0:
+            return np.nan
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.int64) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        position = min(int(np.searchsorted(cumulative, q * cumulative[-1], side='left')), len(values) - 1)
+        return values[order][position]
+
+
+# Misra-Gries summary of the most frequent values
+# Counts are lower bounds, short by at most (number of values) / (capacity + 1).
+class HeavyHitters:
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+
+    def _prune(self, counts):
+        if len(counts) > self.capacity:
+            cut = counts.nlargest(self.capacity + 1).iloc[-1]
+            counts = counts[counts > cut] - cut
+        return counts
+
+    def update(self, values):
+        return self.merge_counts(pd.Series(values).value_counts(sort=False))
+
+    def merge_counts(self, counts):
+        if len(self.counts):
+            counts = pd.concat([self.counts, counts]).groupby(level=0, sort=False).sum()
+        self.counts = self._prune(counts)
+        return self
+
+    def merge(self, other):
+        return self.merge_counts(other.counts)
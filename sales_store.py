@@ -0,0 +1,210 @@
+# Persistent columnar dataset store
+# A sales CSV is converted once into a Parquet file named after the hash of its content.
+# Analysing the same data again reads the Parquet file (memory-mapped, only the columns
+# asked for) instead of parsing the CSV. The least recently used datasets are evicted
+# once the store grows past its size or count limit.
+#
+#   python sales_store.py ingest exports/*.csv
+#   python sales_store.py list
+import argparse
+import hashlib
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from sales_schema import SalesDataError, arrow_convert_options, arrow_schema, arrow_to_frame, cast_to_schema, validate_columns
+
+# Where datasets are kept (override with the SALES_DATASET_DIR environment variable)
+DEFAULT_DATASET_DIR = os.environ.get('SALES_DATASET_DIR', 'datasets')
+# Eviction limits for the store
+DEFAULT_MAX_DATASETS = 20
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+_HASH_BLOCK_BYTES = 1024 * 1024
+# CSV bytes converted per record batch (and Parquet row group) while ingesting
+_INGEST_BLOCK_BYTES = 64 * 1024 ** 2
+
+
+# Function to hash file content; the hash is the dataset key
+def content_hash(file_bytes):
+    return hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+
+
+# Function to hash a file on disk without loading it whole
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Description of one stored dataset
+@dataclass
+class DatasetInfo:
+    key: str
+    name: str
+    rows: int
+    size_bytes: int
+    ingested_at: float
+    last_used: float
+
+    @property
+    def label(self):
+        return f"{self.name} ({self.rows:,} ROWS, INGESTED {time.strftime('%d/%m/%Y %H:%M', time.localtime(self.ingested_at))})"
+
+
+# Directory of Parquet datasets keyed by content hash
+class DatasetStore:
+    def __init__(self, root=DEFAULT_DATASET_DIR, max_datasets=DEFAULT_MAX_DATASETS, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_datasets = max_datasets
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return self.root / f"{key}.parquet"
+
+    def _info_path(self, key):
+        return self.root / f"{key}.json"
+
+    # A dataset is present once both its Parquet file and its info are
+    def __contains__(self, key):
+        return self.path(key).exists() and self._info_path(key).exists()
+
+    # Function to add a CSV (a path or the raw bytes of an upload) and return its key
+    # The CSV is only parsed when its content is not already stored. Conversion streams
+    # record batches straight into the Parquet file, so memory stays bounded. The info file is
+    # written before the Parquet file is moved into place, so a dataset never appears without it.
+    def ingest(self, source, name=None):
+        if isinstance(source, (bytes, bytearray)):
+            key = content_hash(source)
+            name = name or key
+            stream = pa.BufferReader(source)
+        else:
+            key = file_hash(source)
+            name = name or Path(source).name
+            stream = source
+        if key in self:
+            self._touch(key)
+            return key
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp_path = self.root / f".{key}.{uuid.uuid4().hex}.tmp"
+        rows = 0
+        try:
+            reader = pa_csv.open_csv(
+                stream,
+                read_options=pa_csv.ReadOptions(block_size=_INGEST_BLOCK_BYTES),
+                convert_options=arrow_convert_options()
+            )
+            validate_columns(reader.schema.names)
+            schema = arrow_schema(reader.schema)
+            with pq.ParquetWriter(temp_path, schema) as writer:
+                for batch in reader:
+                    writer.write_batch(cast_to_schema(batch))
+                    rows += batch.num_rows
+            info_path = temp_path.with_suffix('.json.tmp')
+            info_path.write_text(json.dumps({'name': name, 'rows': rows, 'ingested_at': time.time()}))
+            os.replace(info_path, self._info_path(key))
+            os.replace(temp_path, self.path(key))
+        except pa.ArrowInvalid as e:
+            raise SalesDataError(f"SCHEMA ISSUE: A column does not match its expected type - {e}")
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+        self.evict(keep=key)
+        return key
+
+    # Function to load a dataset as a typed DataFrame, reading only the given columns
+    def load(self, key, columns=None):
+        table = pq.read_table(self.path(key), columns=columns, memory_map=True)
+        self._touch(key)
+        return arrow_to_frame(table)
+
+    # Function to read a dataset in typed DataFrame chunks of about chunksize rows
+    def iter_chunks(self, key, chunksize, columns=None):
+        self._touch(key)
+        parquet_file = pq.ParquetFile(self.path(key), memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield arrow_to_frame(pa.Table.from_batches([batch]))
+
+    # Number of rows of a stored dataset (read from the Parquet footer)
+    def row_count(self, key):
+        return pq.ParquetFile(self.path(key)).metadata.num_rows
+
+    # Record a use of the dataset for least-recently-used eviction
+    def _touch(self, key):
+        try:
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    # Function to list stored datasets, most recently used first
+    def list(self):
+        datasets = []
+        for path in self.root.glob('*.parquet'):
+            key = path.stem
+            try:
+                info = json.loads(self._info_path(key).read_text())
+                stat = path.stat()
+            except (FileNotFoundError, ValueError):
+                continue
+            datasets.append(DatasetInfo(key, info['name'], info['rows'], stat.st_size, info['ingested_at'], stat.st_mtime))
+        return sorted(datasets, key=lambda dataset: dataset.last_used, reverse=True)
+
+    def remove(self, key):
+        for path in (self.path(key), self._info_path(key)):
+            if path.exists():
+                path.unlink()
+
+    # Function to drop the least recently used datasets until the store is within its limits
+    def evict(self, keep=None):
+        datasets = self.list()
+        total_bytes = sum(dataset.size_bytes for dataset in datasets)
+        evicted = []
+        for dataset in reversed(datasets):
+            if len(datasets) - len(evicted) <= self.max_datasets and total_bytes <= self.max_bytes:
+                break
+            if dataset.key == keep:
+                continue
+            self.remove(dataset.key)
+            total_bytes -= dataset.size_bytes
+            evicted.append(dataset.key)
+        return evicted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local store of ingested sales datasets.")
+    parser.add_argument('--store', default=DEFAULT_DATASET_DIR, help="dataset directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = commands.add_parser('ingest', help="convert sales CSVs into stored datasets")
+    ingest_parser.add_argument('files', nargs='+')
+    commands.add_parser('list', help="list stored datasets")
+    commands.add_parser('evict', help="apply the eviction policy now")
+    args = parser.parse_args(argv)
+
+    store = DatasetStore(args.store)
+    if args.command == 'ingest':
+        for path in args.files:
+            try:
+                print(f"{store.ingest(path)}  {path}")
+            except SalesDataError as e:
+                print(f"SKIPPED {path}: {e}")
+    elif args.command == 'list':
+        for dataset in store.list():
+            print(f"{dataset.key}  {dataset.size_bytes / 1024 ** 2:8.1f} MB  {dataset.label}")
+    else:
+        for key in store.evict():
+            print(f"EVICTED {key}")
+
+
+if __name__ == '__main__':
+    main()
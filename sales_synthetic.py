@@ -0,0 +1,187 @@
+# Synthetic sales data in the sales_data.csv layout
+# Files of any size (10^4 to 10^8 rows) are generated a block of rows at a time, so memory
+# stays flat. The number of customers, products, categories, regions and days is configurable;
+# the same spec and seed always give the same file. With lines_per_order above 1, orders
+# span several rows (same customer and day), and some of their products come in pairs
+# that are often bought together.
+#
+#   python sales_synthetic.py 1000000 big_sales.csv --customers 50000 --days 730
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from sales_schema import MONEY_COLUMNS, SALES_COLUMNS
+
+# Rows generated and written at a time
+DEFAULT_BLOCK_ROWS = 1_000_000
+
+REGION_NAMES = ['Dublin', 'Cork', 'Galway', 'Limerick', 'Waterford', 'Kilkenny', 'Sligo', 'Wexford',
+                'Kerry', 'Mayo', 'Donegal', 'Clare', 'Tipperary', 'Louth', 'Meath', 'Wicklow']
+PAYMENT_METHODS = (['Credit Card', 'Debit Card', 'PayPal', 'Cash'], [0.30, 0.25, 0.25, 0.20])
+SHIPPING_COSTS = [0.0, 2.0, 2.5, 3.0, 3.5, 4.0]
+UNIT_PRICES = [4.99, 7.50, 9.99, 11.49, 12.50, 12.75, 12.99, 14.99, 18.00, 19.99, 24.99, 29.99, 34.99]
+TAX_RATE = 0.08
+# Share of an order's further lines that are the companion of the line before
+COMPANION_SHARE = 0.3
+
+
+# Sizes and seed of a synthetic file
+@dataclass
+class SyntheticSpec:
+    rows: int
+    customers: int = 100_000
+    products: int = 5_000
+    categories: int = 60
+    regions: int = 4
+    days: int = 365
+    start_date: str = '2025-01-01'
+    seed: int = 0
+    # Average rows per order (orders never span blocks)
+    lines_per_order: float = 1.0
+
+
+# Labels like CUST0001 for 1..count, zero-padded to a common width
+def _labels(prefix, count, width=3):
+    width = max(width, len(str(count)))
+    return np.array([f"{prefix}{number:0{width}d}" for number in range(1, count + 1)], dtype=object)
+
+
+# Per-product attributes shared by every block: ISBN-style id, category and unit price
+def _product_table(spec):
+    rng = np.random.default_rng(spec.seed)
+    numbers = np.arange(spec.products)
+    product_ids = np.array([f"978-0-{number:07d}-{number % 10}" for number in numbers], dtype=object)
+    categories = rng.integers(1, spec.categories + 1, spec.products)
+    prices = rng.choice(UNIT_PRICES, spec.products)
+    return product_ids, categories, prices
+
+
+# Categorical column from codes into a label array (written to CSV as the labels)
+def _categorical(codes, labels):
+    return pd.Categorical.from_codes(codes, categories=pd.Index(labels, dtype=object))
+
+
+# Function to generate rows [start, start + count) of a synthetic file as a DataFrame
+def generate_block(spec, start, count, products=None):
+    rng = np.random.default_rng([spec.seed, start])
+    product_ids, product_categories, product_prices = products or _product_table(spec)
+
+    # Rows are in date order, as in an export, each block covering its share of the days.
+    # Day labels repeat across years, so they are taken from an array rather than a categorical.
+    days = pd.date_range(spec.start_date, periods=spec.days, freq='D')
+    day_labels = np.array([f"{day.day}/{day.month}" for day in days], dtype=object)
+    first_day = start * spec.days // spec.rows
+    last_day = max(first_day + 1, -(-(start + count) * spec.days // spec.rows))
+    day = np.sort(rng.integers(first_day, last_day, count))
+    product = rng.integers(0, spec.products, count)
+    quantity = rng.choice([1, 2, 3], count, p=[0.6, 0.3, 0.1])
+    unit_price = product_prices[product]
+    amount = np.round(unit_price * quantity, 2)
+    # Five-minute slots from 09:00 to 20:55
+    times = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(9 * 60, 21 * 60, 5)]
+    yes_no = ['No', 'Yes']
+    customer = rng.integers(0, spec.customers, count)
+    order = np.arange(count)
+    if spec.lines_per_order > 1:
+        # A row starts a new order with probability 1 / lines_per_order; the rest of the order
+        # shares its first row's customer and day, and may add the previous product's companion
+        starts = rng.random(count) < 1 / spec.lines_per_order
+        starts[0] = True
+        order = np.cumsum(starts) - 1
+        first_row = np.flatnonzero(starts)
+        customer = customer[first_row][order]
+        day = day[first_row][order]
+        rows = np.flatnonzero((rng.random(count) < COMPANION_SHARE) & ~starts)
+        product[rows] = (product[rows - 1] * 7 + 1) % spec.products
+        unit_price = product_prices[product]
+        amount = np.round(unit_price * quantity, 2)
+
+    columns = {
+        'Day_Month': day_labels[day],
+        'Year': days.year.to_numpy()[day],
+        'Customer_ID': _categorical(customer, _labels('CUST', spec.customers)),
+        'Purchase_Amount': amount,
+        'Product_Category': product_categories[product],
+        'Quantity': quantity,
+        'Payment_Method': rng.choice(PAYMENT_METHODS[0], count, p=PAYMENT_METHODS[1]),
+        'Region': _categorical(rng.integers(0, spec.regions, count), _region_names(spec.regions)),
+        'Discount_Applied': _categorical((rng.random(count) < 0.35).astype(np.int8), yes_no),
+        'Customer_Age': rng.integers(18, 71, count),
+        'Customer_Gender': _categorical(rng.integers(0, 2, count), ['Male', 'Female']),
+        'Order_ID': np.array([f"ORD{number:09d}" for number in range(start + 1, start + count + 1)], dtype=object)[order],
+        'Transaction_Time': _categorical(rng.integers(0, len(times), count), times),
+        'Shipping_Cost': rng.choice(SHIPPING_COSTS, count),
+        'Tax_Amount': np.round(amount * TAX_RATE, 2),
+        'Product_ID': _categorical(product, product_ids),
+        'Unit_Price': unit_price,
+        'Return_Status': _categorical((rng.random(count) < 0.15).astype(np.int8), yes_no),
+        'Customer_Loyalty': _categorical((rng.random(count) < 0.5).astype(np.int8), yes_no),
+        'Order_Channel': _categorical(rng.integers(0, 2, count), ['Online', 'In-Store']),
+        'Delivery_Method': _categorical((rng.random(count) < 0.35).astype(np.int8), ['Standard', 'Express']),
+        'Customer_Rating': rng.choice([1, 2, 3, 4, 5], count, p=[0.03, 0.07, 0.2, 0.4, 0.3]),
+        'Purchase_Source': _categorical(rng.integers(0, 3, count), ['Website', 'In-Store', 'App']),
+    }
+    return pd.DataFrame({column: columns[column] for column in SALES_COLUMNS})
+
+
+# Region names, numbered once the list of real names runs out
+def _region_names(count):
+    return REGION_NAMES[:count] + [f"Region {number}" for number in range(len(REGION_NAMES) + 1, count + 1)]
+
+
+# Money as text with exactly two decimals (12.50, not 12.5), as in an export
+def _money_text(values):
+    cents = pc.cast(pc.round(pc.multiply(values, 100)), pa.int64())
+    whole = pc.cast(pc.divide(cents, 100), pa.string())
+    fraction = pc.utf8_lpad(pc.cast(pc.subtract(cents, pc.multiply(pc.divide(cents, 100), 100)), pa.string()), 2, '0')
+    return pc.binary_join_element_wise(whole, fraction, '.')
+
+
+# Function to convert a block to an Arrow table of CSV-ready columns
+def _csv_table(block):
+    table = pa.Table.from_pandas(block, preserve_index=False)
+    for column in table.column_names:
+        values = table[column]
+        if column in MONEY_COLUMNS:
+            values = _money_text(values)
+        elif pa.types.is_dictionary(values.type):
+            values = values.cast(pa.string())
+        table = table.set_column(table.schema.get_field_index(column), column, values)
+    return table
+
+
+# Function to write a synthetic sales CSV, one block of rows at a time
+# pyarrow's CSV writer is used as it is several times faster than DataFrame.to_csv.
+def write_synthetic_csv(spec, path, block_rows=DEFAULT_BLOCK_ROWS):
+    products = _product_table(spec)
+    with pa.OSFile(str(path), 'wb') as f:
+        for start in range(0, spec.rows, block_rows):
+            block = generate_block(spec, start, min(block_rows, spec.rows - start), products)
+            options = pa_csv.WriteOptions(include_header=start == 0, quoting_style='none')
+            pa_csv.write_csv(_csv_table(block), f, options)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic sales CSV in the sales_data.csv layout.")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('path')
+    defaults = SyntheticSpec(rows=0)
+    for field in ['customers', 'products', 'categories', 'regions', 'days', 'seed']:
+        parser.add_argument(f"--{field}", type=int, default=getattr(defaults, field))
+    parser.add_argument('--start-date', default=defaults.start_date)
+    parser.add_argument('--lines-per-order', type=float, default=defaults.lines_per_order, help="average rows per order")
+    args = parser.parse_args(argv)
+    spec = SyntheticSpec(args.rows, args.customers, args.products, args.categories, args.regions, args.days, args.start_date, args.seed,
+                         args.lines_per_order)
+    write_synthetic_csv(spec, args.path)
+    print(f"WROTE {spec.rows:,} ROWS TO {args.path}")
+
+
+if __name__ == '__main__':
+    main()
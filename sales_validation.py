@@ -0,0 +1,267 @@
+# Data-quality checks of sales rows against the schema's own invariants
+# A purchase amount should be its unit price times its quantity, tax a plausible share of
+# the amount, each order line should appear once, ratings should run 1-5, Yes/No flags
+# should be Yes or No and dates should be valid. Every rule is a vectorized test over whole
+# columns, so a file (or each chunk of a streamed file) is checked in one pass. Only the
+# count per rule and a bounded sample of offending rows are kept (and, for the duplicate
+# check, an 8-byte hash per order line), so checking costs a small fraction of the analysis.
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from sales_engine import parse_full_date
+from sales_schema import FLAG_COLUMNS, SalesDataError, flag_labels
+
+# Rounding allowed between Purchase_Amount and Unit_Price x Quantity (money is read as float32)
+AMOUNT_TOLERANCE = 0.01
+# Highest plausible tax as a share of the purchase amount
+MAX_TAX_RATE = 0.3
+RATING_RANGE = (1, 5)
+# Offending rows kept per rule
+DEFAULT_SAMPLE_ROWS = 10
+# Rows hashed at a time, and the longest text hashed word by word (longer text goes through pandas' hashing)
+_HASH_BLOCK_ROWS = 1 << 20
+_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+_MAX_HASHED_WIDTH = 256
+# Columns shown with each sampled row
+SAMPLE_COLUMNS = ['Day_Month', 'Year', 'Order_ID', 'Product_ID', 'Quantity', 'Unit_Price', 'Purchase_Amount',
+                  'Tax_Amount', 'Customer_Rating'] + FLAG_COLUMNS
+# Rules in the order they are reported
+VALIDATION_RULES = [
+    'INVALID DATE',
+    'AMOUNT IS NOT UNIT PRICE x QUANTITY',
+    'IMPLAUSIBLE TAX',
+    'DUPLICATE ORDER LINE',
+    f"RATING OUTSIDE {RATING_RANGE[0]}-{RATING_RANGE[1]}",
+] + [f"{column.upper()} NOT YES/NO" for column in FLAG_COLUMNS]
+
+
+# Function to find the rows whose Yes/No flag is missing or anything else (works for boolean and text columns)
+def _not_yes_no(values):
+    if pd.api.types.is_bool_dtype(values):
+        return values.isna().to_numpy()
+    return ~values.isin(['Yes', 'No']).to_numpy()
+
+
+# splitmix64 finalizer: spreads every input bit over the whole 64-bit hash
+def _mix(values):
+    values = values ^ (values >> np.uint64(30))
+    values *= np.uint64(0xBF58476D1CE4E5B9)
+    values ^= values >> np.uint64(27)
+    values *= np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+# Function to hash text values to 64 bits (equal text, equal hash; missing values hash to 0)
+# The Arrow string buffer is laid out as one fixed-width row of bytes per value and hashed eight
+# bytes at a time, which is several times faster than hashing each value as a Python string.
+# Categorical columns hash their categories only.
+def text_hashes(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        hashes = np.append(text_hashes(pd.Series(values.cat.categories)), np.uint64(0))
+        return hashes[np.where(codes < 0, len(hashes) - 1, codes)]
+    array = pa.array(values, from_pandas=True)
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    array = array.cast(pa.large_string())
+    _, offset_buffer, data_buffer = array.buffers()
+    offsets = np.frombuffer(offset_buffer, dtype=np.int64)[array.offset:array.offset + len(array) + 1]
+    data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.zeros(1, dtype=np.uint8)
+    lengths = np.diff(offsets)
+    width = int(lengths.max(initial=0))
+    if width > _MAX_HASHED_WIDTH:
+        return np.where(values.isna().to_numpy(), np.uint64(0), pd.util.hash_pandas_object(values, index=False).to_numpy())
+    hashes = np.empty(len(array), dtype=np.uint64)
+    for start in range(0, len(array), _HASH_BLOCK_ROWS):
+        end = min(start + _HASH_BLOCK_ROWS, len(array))
+        block_lengths = lengths[start:end]
+        padded = np.zeros((end - start, max((width + 7) // 8, 1) * 8), dtype=np.uint8)
+        if (block_lengths == width).all():
+            padded[:, :width] = data[offsets[start]:offsets[end]].reshape(end - start, width)
+        else:
+            # One gather per byte position; text shorter than the position is padded with zeros
+            last = max(offsets[end] - 1, 0)
+            for position in range(width):
+                byte = data[np.minimum(offsets[start:end] + position, last)]
+                padded[:, position] = np.where(block_lengths > position, byte, 0)
+        # The length goes in first (plus one, so empty text does not hash like a missing value)
+        block = block_lengths.astype(np.uint64) + np.uint64(1)
+        for word in padded.view(np.uint64).T:
+            block = (block ^ word) * _HASH_MULTIPLIER
+        hashes[start:end] = _mix(block)
+    hashes[values.isna().to_numpy()] = 0
+    return hashes
+
+
+# Function to find which hashes are among members: a table indexed by the low bits of the members
+# picks the candidates in one gather, and only those are checked exactly
+def _among(hashes, members):
+    size = 1 << max((len(members) * 8).bit_length(), 10)
+    low_bits = np.uint64(size - 1)
+    table = np.zeros(size, dtype=bool)
+    table[members & low_bits] = True
+    found = table[hashes & low_bits]
+    candidates = np.flatnonzero(found)
+    found[candidates] = np.isin(hashes[candidates], members)
+    return found
+
+
+# Numbers of a column as float64, missing values as NaN (which fail no comparison)
+def _numbers(values):
+    return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+# Results of checking a dataset: rows checked, offending rows per rule (a row can break several rules),
+# rows breaking at least one, and up to sample_rows offending rows per rule (ROW is the 1-based data row)
+@dataclass
+class ValidationReport:
+    rows: int
+    counts: pd.Series
+    invalid: int
+    sample: pd.DataFrame
+    # Positions of every invalid row, when the validator kept them
+    invalid_rows: np.ndarray | None = None
+    # Whether the invalid rows were left out of the analysis
+    dropped: bool = False
+
+    @property
+    def clean(self):
+        return self.invalid == 0
+
+    # Function to tabulate the rules that found offending rows
+    def table(self):
+        counts = self.counts[self.counts > 0]
+        return pd.DataFrame({
+            'RULE': counts.index,
+            'ROWS': counts.to_numpy(),
+            '% OF ROWS': (counts.to_numpy() / max(self.rows, 1) * 100).round(2),
+        })
+
+
+# Running checks over a dataset's rows, one DataFrame (or chunk) at a time, in row order
+class DataValidator:
+    def __init__(self, sample_rows=DEFAULT_SAMPLE_ROWS, keep_rows=False):
+        self.sample_rows = sample_rows
+        self.rows = 0
+        self.invalid = 0
+        self.counts = np.zeros(len(VALIDATION_RULES), dtype=np.int64)
+        self._sampled = np.zeros(len(VALIDATION_RULES), dtype=np.int64)
+        self._samples = []
+        # Sorted hashes of the order lines seen in earlier chunks, and the last chunk's (merged in when
+        # another chunk comes, so a single pass never pays for it)
+        self._seen = np.zeros(0, dtype=np.uint64)
+        self._last_lines = None
+        self._invalid_rows = [] if keep_rows else None
+
+    # Function to check the next rows (adds Full_Date when missing) and return which of them are invalid
+    def check(self, data):
+        if 'Full_Date' not in data:
+            parse_full_date(data)
+        amount = _numbers(data['Purchase_Amount'])
+        tax = _numbers(data['Tax_Amount'])
+        rating = _numbers(data['Customer_Rating'])
+        expected = np.round(_numbers(data['Unit_Price']) * _numbers(data['Quantity']), 2)
+        failed = np.stack([
+            data['Full_Date'].isna().to_numpy(),
+            np.abs(amount - expected) > AMOUNT_TOLERANCE + 1e-9,
+            (tax < 0) | (tax > np.abs(amount) * MAX_TAX_RATE + AMOUNT_TOLERANCE),
+            self._duplicate_lines(data),
+            (rating < RATING_RANGE[0]) | (rating > RATING_RANGE[1]),
+        ] + [_not_yes_no(data[column]) for column in FLAG_COLUMNS])
+        invalid = failed.any(axis=0)
+        self.counts += failed.sum(axis=1)
+        self._sample(data, failed)
+        if self._invalid_rows is not None:
+            self._invalid_rows.append(np.flatnonzero(invalid) + self.rows)
+        self.rows += len(data)
+        self.invalid += int(invalid.sum())
+        return invalid
+
+    # Rows repeating an (Order_ID, Product_ID) line seen before, in these rows or earlier ones
+    # (an order with several products has several lines, so a repeated Order_ID alone is fine)
+    def _duplicate_lines(self, data):
+        has_order = data['Order_ID'].notna().to_numpy()
+        hashes = _mix(text_hashes(data['Order_ID']) * _HASH_MULTIPLIER + text_hashes(data['Product_ID']))
+        # Sorting (a radix sort for integers) finds the repeated lines; only their rows go through
+        # the slower first-occurrence test
+        ordered = np.sort(hashes[has_order])
+        repeated = ordered[1:][ordered[1:] == ordered[:-1]]
+        duplicate = np.zeros(len(data), dtype=bool)
+        if len(repeated):
+            candidates = np.flatnonzero(has_order & _among(hashes, repeated))
+            duplicate[candidates] = pd.Series(hashes[candidates]).duplicated().to_numpy()
+        if self._last_lines is not None:
+            self._seen = np.insert(self._seen, np.searchsorted(self._seen, self._last_lines), self._last_lines)
+        # The distinct lines, still sorted: looking them up in order keeps the search cache-friendly
+        lines = ordered[np.diff(ordered, prepend=ordered[:1] + np.uint64(1)) != 0] if len(ordered) else ordered
+        if len(self._seen):
+            positions = np.minimum(np.searchsorted(self._seen, lines), len(self._seen) - 1)
+            earlier = self._seen[positions] == lines
+            if earlier.any():
+                duplicate |= has_order & _among(hashes, lines[earlier])
+            lines = lines[~earlier]
+        self._last_lines = lines
+        return duplicate
+
+    # Keep the first offending rows of each rule until it has sample_rows of them
+    def _sample(self, data, failed):
+        wanted = self.sample_rows - self._sampled
+        picks = [np.flatnonzero(failed[rule])[:wanted[rule]] for rule in np.flatnonzero(wanted > 0)]
+        rows = np.unique(np.concatenate(picks)) if picks else np.zeros(0, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        self._sampled += failed[:, rows].sum(axis=1)
+        names = np.array(VALIDATION_RULES)
+        sample = data.iloc[rows][[column for column in SAMPLE_COLUMNS if column in data]].reset_index(drop=True)
+        for column in FLAG_COLUMNS:
+            if column in sample:
+                sample[column] = flag_labels(sample[column])
+        sample.insert(0, 'ISSUES', [', '.join(names[failed[:, row]]) for row in rows])
+        sample.insert(0, 'ROW', rows + self.rows + 1)
+        self._samples.append(sample)
+
+    # Function to return the results so far (dropped records whether the invalid rows were left out)
+    def report(self, dropped=False):
+        sample = pd.concat(self._samples, ignore_index=True) if self._samples else pd.DataFrame(columns=['ROW', 'ISSUES'] + SAMPLE_COLUMNS)
+        invalid_rows = None
+        if self._invalid_rows is not None:
+            invalid_rows = np.concatenate(self._invalid_rows) if self._invalid_rows else np.zeros(0, dtype=np.int64)
+        return ValidationReport(
+            self.rows, pd.Series(self.counts, index=VALIDATION_RULES), self.invalid, sample, invalid_rows, dropped
+        )
+
+
+# Error raised when dropping the invalid rows would leave nothing to analyse
+def _nothing_valid_error():
+    return SalesDataError("DATA QUALITY ISSUE: Every row failed at least one check - turn off 'drop invalid rows' to analyse them anyway.")
+
+
+# Function to check every row of a DataFrame in one pass
+def validate_rows(data, sample_rows=DEFAULT_SAMPLE_ROWS, keep_rows=False):
+    validator = DataValidator(sample_rows, keep_rows)
+    validator.check(data)
+    return validator.report()
+
+
+# Function to check chunks as they stream past, leaving out their invalid rows when drop_invalid is set
+def checked_chunks(chunks, validator, drop_invalid=False):
+    for chunk in chunks:
+        invalid = validator.check(chunk)
+        if drop_invalid and invalid.any():
+            chunk = chunk[~invalid].reset_index(drop=True)
+        if len(chunk):
+            yield chunk
+    if drop_invalid and validator.rows and validator.invalid == validator.rows:
+        raise _nothing_valid_error()
+
+
+# Function to leave the rows at the given positions out of a DataFrame
+def drop_rows(data, rows):
+    if len(rows) == len(data):
+        raise _nothing_valid_error()
+    keep = np.ones(len(data), dtype=bool)
+    keep[rows] = False
+    return data[keep].reset_index(drop=True)
@@ -0,0 +1,43 @@
+# Shared fixtures: the sample sales file, and a copy with the gaps and odd values real exports have
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+SAMPLE_CSV = ROOT / 'sales_data.csv'
+
+
+@pytest.fixture
+def sample_csv():
+    return SAMPLE_CSV
+
+
+# Blank IDs, region, rating and flag, a non-Yes/No flag, and ratings written as "4.0" (as pandas
+# writes an integer column with gaps)
+@pytest.fixture
+def messy_csv(tmp_path):
+    data = pd.read_csv(SAMPLE_CSV)
+    data.loc[[2, 5], 'Customer_ID'] = np.nan
+    data.loc[8, 'Order_ID'] = np.nan
+    data.loc[9, 'Product_ID'] = np.nan
+    data.loc[12, 'Region'] = np.nan
+    data.loc[14, 'Customer_Rating'] = np.nan
+    data.loc[15, 'Discount_Applied'] = 'Maybe'
+    data.loc[16, 'Return_Status'] = np.nan
+    path = tmp_path / 'messy.csv'
+    data.to_csv(path, index=False)
+    return path
+
+
+# A synthetic file of random sales with nothing unusual in it (no spikes, drops or repeated lines)
+@pytest.fixture(scope='session')
+def synthetic_csv(tmp_path_factory):
+    from sales_synthetic import SyntheticSpec, write_synthetic_csv
+    path = tmp_path_factory.mktemp('synthetic') / 'synthetic.csv'
+    write_synthetic_csv(SyntheticSpec(50_000), path)
+    return path
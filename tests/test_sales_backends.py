@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from sales_backends import DEFAULT_BACKEND, available_backends, get_backend
+from sales_engine import build_summary_df, compute_metrics_from_csv
+from sales_schema import SalesDataError
+from sales_store import DatasetStore
+
+BACKENDS = available_backends()
+
+
+@pytest.fixture
+def stored_messy(tmp_path, messy_csv):
+    store = DatasetStore(tmp_path / 'datasets')
+    return store.path(store.ingest(messy_csv))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backends_match_pandas_on_messy_csv(backend, messy_csv):
+    expected = build_summary_df(compute_metrics_from_csv(messy_csv, chunksize=50))
+    pd.testing.assert_frame_equal(build_summary_df(get_backend(backend).compute_metrics(messy_csv)), expected)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backends_match_pandas_on_stored_dataset(backend, messy_csv, stored_messy):
+    expected = build_summary_df(compute_metrics_from_csv(messy_csv, chunksize=50))
+    pd.testing.assert_frame_equal(build_summary_df(get_backend(backend).compute_metrics(stored_messy)), expected)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_blank_ids_are_not_counted(backend, messy_csv):
+    raw = pd.read_csv(messy_csv)
+    metrics = get_backend(backend).compute_metrics(messy_csv)
+    assert metrics.num_customers == raw['Customer_ID'].nunique()
+    assert metrics.num_orders == raw['Order_ID'].nunique()
+    assert metrics.num_products == raw['Product_ID'].nunique()
+    assert set(metrics.sales_by_region.index) == set(raw['Region'].dropna())
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_fractional_integers_are_rejected(backend, sample_csv, tmp_path):
+    data = pd.read_csv(sample_csv, dtype=str)
+    data.loc[0, 'Customer_Rating'] = '4.5'
+    path = tmp_path / 'fraction.csv'
+    data.to_csv(path, index=False)
+    with pytest.raises(SalesDataError):
+        get_backend(backend).compute_metrics(path)
+
+
+def test_pandas_is_always_available():
+    assert DEFAULT_BACKEND in BACKENDS
@@ -0,0 +1,77 @@
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_baskets import MAX_BASKET_PRODUCTS, BasketPairs, default_basket
+
+
+# Orders of a few products each from a small catalogue, some lines repeated and some IDs missing
+@pytest.fixture
+def orders():
+    rng = np.random.default_rng(3)
+    sizes = rng.integers(1, 6, 2_000)
+    data = pd.DataFrame({
+        'Order_ID': np.repeat([f"ORD{order}" for order in range(len(sizes))], sizes),
+        'Customer_ID': np.repeat([f"CUST{customer}" for customer in rng.integers(0, 300, len(sizes))], sizes),
+        'Product_ID': [f"P{product}" for product in rng.zipf(1.6, sizes.sum()) % 60],
+    })
+    data.loc[rng.choice(len(data), 30, replace=False), 'Product_ID'] = np.nan
+    data.loc[rng.choice(len(data), 30, replace=False), 'Order_ID'] = np.nan
+    return data
+
+
+# Pair counts by listing every pair of every basket (the fixture's baskets are all small)
+def brute_force(data, column):
+    baskets = data.dropna(subset=[column, 'Product_ID']).groupby(column)['Product_ID'].agg(lambda products: sorted(set(products)))
+    pairs = Counter(pair for products in baskets for pair in combinations(products, 2))
+    products = Counter(product for products in baskets for product in products)
+    return pairs, products, len(baskets)
+
+
+@pytest.mark.parametrize('basket', ['ORDER', 'CUSTOMER'])
+def test_pairs_match_brute_force(orders, basket):
+    pairs = BasketPairs(orders, basket, min_support=0.002)
+    expected, product_counts, basket_count = brute_force(orders, 'Order_ID' if basket == 'ORDER' else 'Customer_ID')
+    table = pairs.pairs()
+    found = {tuple(sorted((str(a), str(b)))): count for a, b, count in zip(table['PRODUCT A'], table['PRODUCT B'], table['BASKETS'])}
+    assert found == {pair: count for pair, count in expected.items() if count >= pairs.min_baskets}
+    assert pairs.basket_count == basket_count
+    for a, b, lift in zip(table['PRODUCT A'], table['PRODUCT B'], table['LIFT']):
+        count = expected[tuple(sorted((str(a), str(b))))]
+        assert lift == pytest.approx(count * basket_count / (product_counts[str(a)] * product_counts[str(b)]))
+
+
+def test_large_baskets_are_left_out():
+    # Two oversized orders, so each of their products is frequent enough to count
+    products = [f"P{product}" for product in range(MAX_BASKET_PRODUCTS + 1)]
+    data = pd.DataFrame({
+        'Order_ID': ['BIG1'] * len(products) + ['BIG2'] * len(products) + ['A', 'A', 'B', 'B'],
+        'Customer_ID': 'C',
+        'Product_ID': products * 2 + ['P0', 'P1', 'P0', 'P1'],
+    })
+    table = BasketPairs(data, 'ORDER').pairs()
+    assert table[['PRODUCT A', 'PRODUCT B', 'BASKETS']].astype(str).values.tolist() == [['P0', 'P1', '2']]
+
+
+def test_top_partners_agree_with_pairs(orders):
+    pairs = BasketPairs(orders, 'ORDER', min_support=0.002)
+    partners = pairs.top_partners(top=3)
+    assert partners.groupby('PRODUCT', observed=True).size().max() <= 3
+    table = pairs.pairs()
+    both_ways = pd.concat([
+        table.rename(columns={'PRODUCT A': 'PRODUCT', 'PRODUCT B': 'PARTNER'}),
+        table.rename(columns={'PRODUCT B': 'PRODUCT', 'PRODUCT A': 'PARTNER'}),
+    ]).astype({'PRODUCT': str, 'PARTNER': str})
+    merged = partners.astype({'PRODUCT': str, 'PARTNER': str}).merge(both_ways, on=['PRODUCT', 'PARTNER'], suffixes=('', ' PAIR'))
+    assert len(merged) == len(partners)
+    assert np.allclose(merged['LIFT'], merged['LIFT PAIR'])
+    one = pairs.top_partners(top=3, product=partners['PRODUCT'].iloc[0])
+    assert (one['PRODUCT'].astype(str) == str(partners['PRODUCT'].iloc[0])).all()
+
+
+def test_default_basket_is_the_order_when_orders_have_several_lines(orders):
+    assert default_basket(orders) == 'ORDER'
+    assert default_basket(orders.drop_duplicates('Order_ID')) == 'CUSTOMER'
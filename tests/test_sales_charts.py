@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from sales_charts import histogram_frame, lttb, top_values
+from sales_cube import OTHER_LABEL
+
+
+def many_categories(rows=5000, customers=2000, days=300):
+    generator = np.random.default_rng(0)
+    return pd.DataFrame({
+        'Customer_ID': pd.Categorical([f"C{i}" for i in generator.integers(0, customers, rows)]),
+        'Day_Month': pd.Categorical([f"{i}/1" for i in generator.integers(1, days, rows)]),
+        'Purchase_Amount': generator.gamma(2.0, 20.0, rows).astype(np.float32),
+    })
+
+
+def test_histogram_of_categories_keeps_only_top_occurring_combinations():
+    data = many_categories()
+    frame = histogram_frame(data, 'Customer_ID', 30, 'Day_Month', top=20)
+    assert len(frame) <= 21 * 21
+    assert (frame['count'] > 0).all()
+    assert frame['count'].sum() == len(data)
+    assert OTHER_LABEL in set(frame['Customer_ID'])
+
+
+def test_histogram_of_numbers_bins_every_row():
+    data = many_categories()
+    frame = histogram_frame(data, 'Purchase_Amount', 30, 'Customer_ID', top=10)
+    assert len(frame) <= 30 * 11
+    assert frame['count'].sum() == len(data)
+
+
+def test_top_values_leaves_small_columns_alone():
+    values = pd.Series(['a', 'b', 'a', None])
+    assert top_values(values, 5) is values
+    cut = top_values(pd.Series(list('aaabbc')), 2)
+    assert list(cut) == ['a', 'a', 'a', 'b', 'b', OTHER_LABEL]
+
+
+def test_lttb_keeps_the_ends_and_the_peak():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[500] = 10
+    kept = lttb(x, y, 50)
+    assert len(kept) == 50
+    assert kept[0] == 0 and kept[-1] == 999
+    assert 500 in kept
+
+
+def test_top_values_keep_a_real_other_apart_from_the_rest():
+    values = pd.Series(['Other'] * 5 + ['a'] * 4 + ['b'] * 3 + ['c', 'd'])
+    cut = top_values(values, 3)
+    assert list(cut.cat.categories) == [OTHER_LABEL, 'a', 'b', 'Other (2)']
+    assert cut.value_counts()['Other (2)'] == 2
@@ -0,0 +1,75 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_compare import (
+    SALES_OVER_TIME_TITLE, SUMMARY_TITLE, align_breakdowns, compare_periods, overlay_sales, previous_period, range_label,
+    side_labels,
+)
+from sales_engine import compute_metrics
+from sales_schema import read_sales_csv
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    # A range that is not whole months: the same number of days just before it
+    ('2025-03-10', '2025-03-16', ('2025-03-03', '2025-03-09')),
+    ('2025-03-01', '2025-03-01', ('2025-02-28', '2025-02-28')),
+    ('2025-01-15', '2025-02-14', ('2024-12-15', '2025-01-14')),
+    ('2025-03-02', '2025-03-31', ('2025-01-31', '2025-03-01')),
+    # Whole calendar months: the months before, however long they are
+    ('2025-03-01', '2025-03-31', ('2025-02-01', '2025-02-28')),
+    ('2024-03-01', '2024-03-31', ('2024-02-01', '2024-02-29')),
+    ('2025-02-01', '2025-02-28', ('2025-01-01', '2025-01-31')),
+    ('2025-04-01', '2025-06-30', ('2025-01-01', '2025-03-31')),
+    ('2025-01-01', '2025-12-31', ('2024-01-01', '2024-12-31')),
+])
+def test_preceding_period(start, end, expected):
+    assert previous_period(start, end) == tuple(date.fromisoformat(day) for day in expected)
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    ('2025-03-10', '2025-03-16', ('2024-03-10', '2024-03-16')),
+    ('2025-01-01', '2025-01-31', ('2024-01-01', '2024-01-31')),
+    # 29 February has no counterpart in the year before
+    ('2024-02-01', '2024-02-29', ('2023-02-01', '2023-02-28')),
+])
+def test_same_period_last_year(start, end, expected):
+    assert previous_period(start, end, 'SAME PERIOD LAST YEAR') == tuple(date.fromisoformat(day) for day in expected)
+
+
+def test_labels():
+    assert range_label(date(2025, 3, 1), date(2025, 3, 31)) == '01/03/2025 - 31/03/2025'
+    assert side_labels('A', 'B') == ('A', 'B')
+    assert side_labels('sales.csv', 'sales.csv') == ('sales.csv (1)', 'sales.csv (2)')
+
+
+def test_breakdowns_keep_values_missing_from_one_side():
+    current = pd.Series({'North': 10, 'South': 5})
+    previous = pd.Series({'South': 10, 'West': 4})
+    table = align_breakdowns(current, previous, ('NOW', 'BEFORE'), 'REGION')
+    assert table['REGION'].tolist() == ['North', 'South', 'West']
+    assert table['NOW'].tolist() == [10, 5, 0]
+    assert table['CHANGE'].tolist() == [10, -5, -4]
+    assert np.isnan(table['CHANGE (%)'].iloc[0])
+    assert table['CHANGE (%)'].iloc[1] == pytest.approx(-50)
+
+
+def test_overlay_lines_up_the_first_days():
+    current = pd.Series([1.0, 2.0], index=pd.to_datetime(['2025-03-01', '2025-03-03']))
+    previous = pd.Series([4.0], index=pd.to_datetime(['2025-02-01']))
+    table = overlay_sales(current, previous, ('NOW', 'BEFORE'))
+    assert table['DAY'].tolist() == [1, 3]
+    assert table['NOW'].tolist() == [1.0, 2.0]
+    assert table['BEFORE'].tolist() == [4.0, 0.0]
+
+
+def test_comparing_a_dataset_with_itself_changes_nothing(sample_csv):
+    data = read_sales_csv(sample_csv)
+    metrics = compute_metrics(data)
+    tables = compare_periods(metrics, metrics, side_labels('sales', 'sales'), data, data)
+    for title, table in tables.items():
+        assert (table['CHANGE'].fillna(0) == 0).all(), title
+    assert tables[SUMMARY_TITLE]['sales (1)'].equals(tables[SUMMARY_TITLE]['sales (2)'])
+    assert tables[SALES_OVER_TIME_TITLE]['sales (1)'].sum() == pytest.approx(metrics.total_sales)
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_cube import OTHER_LABEL, SalesCube, value_column
+from sales_schema import read_sales_csv
+
+
+@pytest.fixture
+def sample(sample_csv):
+    return read_sales_csv(sample_csv)
+
+
+@pytest.mark.parametrize('aggregation', ['SUM', 'MEAN', 'COUNT'])
+def test_query_matches_groupby(sample, aggregation):
+    table = SalesCube(sample).query(['Region', 'Payment_Method'], 'Purchase_Amount', aggregation, top=None)
+    grouped = sample['Purchase_Amount'].astype('float64').round(2).groupby([sample['Region'], sample['Payment_Method']], observed=True)
+    expected = {'SUM': grouped.sum, 'MEAN': grouped.mean, 'COUNT': grouped.size}[aggregation]()
+    found = table.set_index(['Region', 'Payment_Method'])[value_column('Purchase_Amount', aggregation)]
+    assert found.to_dict() == pytest.approx(expected.to_dict())
+
+
+def test_distinct_count_matches_nunique(sample):
+    table = SalesCube(sample).query(['Region'], 'Customer_ID', 'DISTINCT COUNT')
+    expected = sample.groupby('Region', observed=True)['Customer_ID'].nunique()
+    assert table.set_index('Region')['distinct Customer_ID'].to_dict() == expected.to_dict()
+
+
+def test_top_values_keep_the_total(sample):
+    cube = SalesCube(sample)
+    table = cube.query(['Customer_ID'], 'Purchase_Amount', 'SUM', top=5)
+    assert len(table) == 6
+    assert table['Customer_ID'].iloc[-1] == OTHER_LABEL
+    assert table['Purchase_Amount'].sum() == pytest.approx(sample['Purchase_Amount'].astype('float64').round(2).sum())
+    largest = sample['Purchase_Amount'].astype('float64').groupby(sample['Customer_ID'], observed=True).sum().nlargest(5)
+    assert set(table['Customer_ID'][:-1]) == set(largest.index.astype(str))
+
+
+def test_missing_values_are_a_group_of_their_own():
+    data = pd.DataFrame({'Region': ['North', None, 'North'], 'Purchase_Amount': np.array([1.0, 2.0, 3.0], dtype=np.float32)})
+    table = SalesCube(data).query(['Region'], 'Purchase_Amount')
+    assert table['Purchase_Amount'].tolist() == [4.0, 2.0]
+    assert table['Region'].isna().tolist() == [False, True]
+
+
+def test_pivot_keeps_the_cube_order(sample):
+    cube = SalesCube(sample)
+    pivot = cube.pivot('Region', 'Order_Channel', 'Purchase_Amount')
+    assert list(pivot.index) == list(cube.codes('Region')[1])
+    assert pivot.sum().sum() == pytest.approx(sample['Purchase_Amount'].astype('float64').round(2).sum())
+    # Results are reused
+    assert cube.query(['Region', 'Order_Channel'], 'Purchase_Amount') is cube.query(['Region', 'Order_Channel'], 'Purchase_Amount')
+
+
+def test_top_value_labels_stay_distinct():
+    # "Other" is itself a frequent value, and 1 and '1' print alike
+    data = pd.DataFrame({
+        'Product_Category': pd.Series(['Other'] * 5 + [1] * 4 + ['1'] * 3 + ['Books'] * 2 + ['Toys'], dtype=object),
+        'Purchase_Amount': np.ones(15, dtype=np.float32),
+    })
+    cube = SalesCube(data)
+    table = cube.query(['Product_Category'], None, 'COUNT', top=3)
+    assert table['Product_Category'].is_unique
+    assert dict(zip(table['Product_Category'], table['count'])) == {'1': 4, '1 (2)': 3, OTHER_LABEL: 5, 'Other (2)': 3}
+    pivot = cube.pivot('Product_Category', None, None, 'COUNT', top=3)
+    assert pivot['count'].sum() == 15
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_customers import CustomerAnalytics
+from sales_engine import parse_full_date
+
+
+def _sales(rows):
+    data = pd.DataFrame(rows, columns=['Customer_ID', 'Full_Date', 'Purchase_Amount', 'Return_Status', 'Customer_Loyalty'])
+    data['Full_Date'] = pd.to_datetime(data['Full_Date'])
+    return data
+
+
+def test_clv_counts_only_months_with_purchases():
+    # A buys in January and June only; B buys in three consecutive months
+    data = _sales([
+        ('A', '2025-01-10', 100.0, 'No', 'No'),
+        ('A', '2025-06-10', 100.0, 'No', 'No'),
+        ('B', '2025-01-05', 50.0, 'No', 'No'),
+        ('B', '2025-02-05', 50.0, 'No', 'No'),
+        ('B', '2025-03-05', 50.0, 'Yes', 'No'),
+    ])
+    clv = CustomerAnalytics(data).clv().set_index('Customer_ID')
+    assert clv.loc['A', 'Active_Months'] == 2
+    assert clv.loc['B', 'Active_Months'] == 3
+    assert clv.loc['A', 'Monthly_Value'] == pytest.approx(100.0)
+    # The returned purchase counts as nothing, but its month still had a purchase
+    assert clv.loc['B', 'Monthly_Value'] == pytest.approx(100.0 / 3, abs=0.01)
+
+
+def test_clv_months_follow_customer_order_on_categoricals(sample_csv):
+    data = pd.read_csv(sample_csv)
+    parse_full_date(data)
+    data['Customer_ID'] = data['Customer_ID'].astype('category')
+    clv = CustomerAnalytics(data).clv().set_index('Customer_ID')
+    dated = data.dropna(subset=['Full_Date'])
+    expected = dated.groupby('Customer_ID', observed=True)['Full_Date'].agg(lambda d: d.dt.to_period('M').nunique())
+    assert (clv['Active_Months'] == expected.reindex(clv.index)).all()
+    assert np.isfinite(clv['CLV']).all()
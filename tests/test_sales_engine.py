@@ -0,0 +1,85 @@
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_engine import SalesAccumulator, build_summary_df, compute_metrics, compute_metrics_from_csv
+from sales_schema import SalesDataError, read_sales_csv
+from sales_sketches import SketchSettings
+
+
+def assert_same_metrics(left, right):
+    for field in dataclasses.fields(left):
+        expected, actual = getattr(right, field.name), getattr(left, field.name)
+        if isinstance(expected, pd.Series):
+            assert actual.to_dict() == pytest.approx(expected.to_dict()), field.name
+        elif isinstance(expected, float):
+            assert actual == pytest.approx(expected, nan_ok=True), field.name
+        else:
+            assert actual == expected, field.name
+
+
+def test_metrics_match_the_file(sample_csv):
+    data = pd.read_csv(sample_csv)
+    metrics = compute_metrics(read_sales_csv(sample_csv))
+    assert metrics.row_count == len(data)
+    assert metrics.total_sales == pytest.approx(data['Purchase_Amount'].sum())
+    assert metrics.num_customers == data['Customer_ID'].nunique()
+    assert metrics.top_region == data.groupby('Region')['Purchase_Amount'].sum().idxmax()
+
+
+@pytest.mark.parametrize('chunksize', [3, 50, 10_000])
+def test_chunks_equal_a_single_pass(messy_csv, chunksize):
+    expected = compute_metrics(read_sales_csv(messy_csv))
+    assert_same_metrics(compute_metrics_from_csv(messy_csv, chunksize=chunksize), expected)
+
+
+def test_merge_order_does_not_matter(messy_csv):
+    expected = compute_metrics(read_sales_csv(messy_csv))
+    chunks = [SalesAccumulator.from_frame(chunk) for chunk in read_sales_csv(messy_csv, chunksize=30)]
+    # Neighbouring partials merged pairwise rather than one after another
+    while len(chunks) > 1:
+        chunks = [left.merge(right) for left, right in zip(chunks[::2], chunks[1::2])] + chunks[len(chunks) - len(chunks) % 2:]
+    assert_same_metrics(chunks[0].finalize(), expected)
+    pd.testing.assert_frame_equal(build_summary_df(chunks[0].finalize()), build_summary_df(expected))
+
+
+def test_empty_partials_merge_as_nothing(messy_csv):
+    expected = compute_metrics(read_sales_csv(messy_csv))
+    accumulator = SalesAccumulator().merge(SalesAccumulator.from_frame(read_sales_csv(messy_csv))).merge(SalesAccumulator())
+    assert_same_metrics(accumulator.finalize(), expected)
+
+
+def test_sketched_chunks_equal_a_single_pass_on_exact_parts(synthetic_csv):
+    settings = SketchSettings.for_error(0.02)
+    whole = compute_metrics(read_sales_csv(synthetic_csv), settings)
+    chunked = compute_metrics_from_csv(synthetic_csv, chunksize=7_000, sketch_settings=settings)
+    # Sums, tallies and merged HyperLogLog registers do not depend on the chunking
+    for attribute in ['row_count', 'total_sales', 'num_customers', 'num_orders', 'num_products', 'avg_rating']:
+        assert getattr(chunked, attribute) == pytest.approx(getattr(whole, attribute)), attribute
+    assert chunked.approximate and chunked.distinct_error == settings.distinct_error
+
+
+def test_sketched_metrics_are_within_their_error(synthetic_csv):
+    settings = SketchSettings.for_error(0.02)
+    exact = compute_metrics_from_csv(synthetic_csv, chunksize=7_000)
+    estimated = compute_metrics_from_csv(synthetic_csv, chunksize=7_000, sketch_settings=settings)
+    for attribute in ['num_customers', 'num_orders', 'num_products']:
+        assert getattr(estimated, attribute) == pytest.approx(getattr(exact, attribute), rel=settings.distinct_error), attribute
+    amounts = read_sales_csv(synthetic_csv, usecols=['Purchase_Amount'])['Purchase_Amount'].astype('float64').round(2)
+    rank = (amounts <= estimated.outlier_spend).mean()
+    assert rank == pytest.approx(0.95, abs=2 * settings.quantile_error)
+
+
+def test_exact_and_sketched_partials_do_not_merge(sample_csv):
+    exact = SalesAccumulator.from_frame(read_sales_csv(sample_csv))
+    with pytest.raises(ValueError):
+        exact.merge(SalesAccumulator.from_frame(read_sales_csv(sample_csv), SketchSettings()))
+
+
+def test_a_file_without_valid_dates_is_an_error(sample_csv):
+    data = read_sales_csv(sample_csv)
+    data['Day_Month'] = np.nan
+    with pytest.raises(SalesDataError):
+        compute_metrics(data)
@@ -0,0 +1,49 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from sales_engine import parse_full_date
+from sales_filters import FilterIndex
+from sales_schema import flag_labels, read_sales_csv
+
+
+@pytest.fixture
+def sample(messy_csv):
+    data = read_sales_csv(messy_csv)
+    parse_full_date(data)
+    return data
+
+
+# Rows matching the filters, by scanning every row
+def scan(data, date_range=None, selections=()):
+    keep = np.ones(len(data), dtype=bool)
+    if date_range is not None:
+        days = data['Full_Date'].dt.date
+        keep &= (days >= date_range[0]).to_numpy() & (days <= date_range[1]).to_numpy() & data['Full_Date'].notna().to_numpy()
+    for column, labels in selections:
+        if labels:
+            values = flag_labels(data[column]).astype(str)
+            keep &= values.isin(labels).to_numpy() & data[column].notna().to_numpy()
+    return np.flatnonzero(keep)
+
+
+@pytest.mark.parametrize('date_range, selections', [
+    ((date(2025, 1, 1), date(2025, 1, 31)), ()),
+    (None, (('Region', ['Dublin', 'Cork']),)),
+    ((date(2025, 1, 1), date(2025, 6, 30)), (('Region', ['Dublin']), ('Order_Channel', ['Online']))),
+    (None, (('Customer_Loyalty', ['Yes']), ('Payment_Method', []))),
+    (None, (('Region', ['Nowhere']),)),
+])
+def test_select_matches_a_scan(sample, date_range, selections):
+    rows = FilterIndex(sample).select(date_range, selections)
+    assert rows.tolist() == scan(sample, date_range, selections).tolist()
+
+
+def test_no_filter_selects_nothing_in_particular(sample):
+    index = FilterIndex(sample)
+    assert index.select() is None
+    assert index.select(None, (('Region', []),)) is None
+    first, last = index.date_bounds()
+    assert (first, last) == (sample['Full_Date'].min().date(), sample['Full_Date'].max().date())
+    assert 'Yes' in index.labels['Customer_Loyalty']
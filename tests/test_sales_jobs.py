@@ -0,0 +1,43 @@
+import pytest
+
+from sales_engine import compute_metrics_from_csv
+from sales_jobs import JobCancelled, JobContext, JobManager, analyse_dataset
+from sales_store import DatasetStore
+
+
+# A job's context outside a worker: progress and cancellation flags in plain dicts
+def context(cancelled=False):
+    return JobContext(0, {}, {0: True} if cancelled else {})
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_analyse_dataset_matches_a_direct_analysis(tmp_path, messy_csv, streaming):
+    store = DatasetStore(tmp_path / 'datasets')
+    job = context()
+    key, metrics, report = analyse_dataset(job, store, 'messy.csv', str(messy_csv), streaming=streaming)
+    assert key in store
+    expected = compute_metrics_from_csv(messy_csv)
+    assert metrics.total_sales == pytest.approx(expected.total_sales)
+    assert metrics.num_customers == expected.num_customers
+    assert report.rows == expected.row_count
+    assert job._progress[0][0]
+
+
+def test_a_cancelled_job_stops_at_its_next_report(tmp_path, messy_csv):
+    with pytest.raises(JobCancelled):
+        analyse_dataset(context(cancelled=True), DatasetStore(tmp_path / 'datasets'), 'messy.csv', str(messy_csv))
+
+
+def test_sessions_asking_for_the_same_job_share_it(tmp_path, sample_csv):
+    store = DatasetStore(tmp_path / 'datasets')
+    jobs = JobManager(max_jobs=1)
+    try:
+        first = jobs.submit(('ANALYSE', 'sample'), analyse_dataset, store, 'sales_data.csv', str(sample_csv))
+        second = jobs.submit(('ANALYSE', 'sample'), analyse_dataset, store, 'sales_data.csv', str(sample_csv))
+        assert first is second
+        key, metrics, _ = first.result(timeout=120)
+        assert first.state == 'DONE' and key in store
+        assert metrics.row_count == 246
+        assert jobs.active_jobs() == 0
+    finally:
+        jobs.shutdown()
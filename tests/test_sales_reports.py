@@ -0,0 +1,25 @@
+import shutil
+
+import pytest
+
+from sales_reports import REPORT_FORMATS, main, report_names
+
+
+def test_report_names_keep_dotted_names_and_separate_same_named_files():
+    names = report_names(['sales.2024.csv', 'sales.2025.csv', 'x/store.csv', 'y/store.csv'])
+    assert names[:2] == ['sales.2024', 'sales.2025']
+    assert names[2].startswith('store_') and names[3].startswith('store_') and names[2] != names[3]
+    with pytest.raises(ValueError):
+        report_names(['x/store.csv', 'x/store.csv'])
+
+
+def test_colliding_inputs_each_get_their_reports(tmp_path, sample_csv):
+    inputs = [tmp_path / 'x' / 'store.csv', tmp_path / 'y' / 'store.csv', tmp_path / 'sales.2024.csv', tmp_path / 'sales.2025.csv']
+    for path in inputs:
+        path.parent.mkdir(exist_ok=True)
+        shutil.copy(sample_csv, path)
+    output = tmp_path / 'reports'
+    assert main([str(path) for path in inputs] + [str(inputs[0]), '--output', str(output), '--workers', '1']) == 0
+    written = sorted(path.name for path in output.iterdir())
+    assert len(written) == len(inputs) * len(REPORT_FORMATS)
+    assert 'sales.2024_report.pdf' in written and 'sales.2025_report.xlsx' in written
@@ -0,0 +1,100 @@
+import multiprocessing
+import time
+
+import pandas as pd
+import pytest
+
+import sales_rollups
+from sales_rollups import RollupStore, rollup_totals
+
+
+def assert_same_totals(left, right):
+    left, right = rollup_totals(left), rollup_totals(right)
+    for label, value in right.items():
+        assert left[label] == (value if isinstance(value, pd.Timestamp) else pytest.approx(value)), label
+
+
+# The sample split into two files, so the second append merges into existing periods
+@pytest.fixture
+def halves(tmp_path, sample_csv):
+    data = pd.read_csv(sample_csv, dtype=str)
+    paths = []
+    for index, part in enumerate((data.iloc[::2], data.iloc[1::2])):
+        path = tmp_path / f"half_{index}.csv"
+        part.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def test_two_appends_equal_one(tmp_path, sample_csv, halves):
+    whole = RollupStore(tmp_path / 'whole')
+    whole.append(sample_csv)
+    split = RollupStore(tmp_path / 'split')
+    for path in halves:
+        split.append(path)
+    for granularity in sales_rollups.GRANULARITIES:
+        assert_same_totals(split.load(granularity), whole.load(granularity))
+    assert len(split.sources()) == 2
+
+
+def test_appending_the_same_file_twice_has_no_effect(tmp_path, sample_csv):
+    store = RollupStore(tmp_path / 'rollups')
+    assert store.append(sample_csv) is not None
+    totals = rollup_totals(store.load('DAY'))
+    assert store.append(sample_csv) is None
+    assert rollup_totals(store.load('DAY')) == totals
+    assert len(store.sources()) == 1
+
+
+def test_a_failed_append_leaves_the_store_unchanged_and_can_be_retried(tmp_path, halves, monkeypatch):
+    store = RollupStore(tmp_path / 'rollups')
+    store.append(halves[0])
+    before = {granularity: store.load(granularity) for granularity in sales_rollups.GRANULARITIES}
+    anomalies = store.anomalies()
+
+    # Every table of the second file is written, then the manifest cannot be replaced
+    def crash(*args):
+        raise OSError("disk full")
+    with monkeypatch.context() as patch:
+        patch.setattr(sales_rollups.os, 'replace', crash)
+        with pytest.raises(OSError):
+            store.append(halves[1])
+
+    reopened = RollupStore(store.root)
+    assert [entry['name'] for entry in reopened.sources()] == ['half_0.csv']
+    for granularity, table in before.items():
+        pd.testing.assert_frame_equal(reopened.load(granularity), table)
+    pd.testing.assert_frame_equal(reopened.anomalies(), anomalies)
+
+    # The retry counts the second file once and clears the files the failed append left behind
+    assert reopened.append(halves[1]) is not None
+    expected = RollupStore(tmp_path / 'expected')
+    for path in halves:
+        expected.append(path)
+    assert_same_totals(reopened.load('DAY'), expected.load('DAY'))
+    assert len(list(store.root.glob('*.parquet'))) == len(sales_rollups.GRANULARITIES) + 1
+
+
+# Append from another process, leaving a marker just before
+def _append_elsewhere(root, path, marker):
+    marker.write_text('started')
+    RollupStore(root).append(path)
+
+
+def test_appends_from_other_processes_wait_their_turn(tmp_path, halves):
+    store = RollupStore(tmp_path / 'rollups')
+    store.append(halves[0])
+    marker = tmp_path / 'started'
+    process = multiprocessing.get_context('spawn').Process(target=_append_elsewhere, args=(store.root, halves[1], marker))
+    with sales_rollups._locked(store._lock_path()):
+        process.start()
+        deadline = time.monotonic() + 60
+        while not marker.exists() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        time.sleep(1)
+        # The other process is waiting for the lock, so nothing has changed yet
+        assert len(store.sources()) == 1
+    process.join(60)
+    assert process.exitcode == 0
+    assert [entry['name'] for entry in store.sources()] == ['half_0.csv', 'half_1.csv']
+    assert len(list(store.root.glob('*.parquet'))) == len(sales_rollups.GRANULARITIES) + 1
@@ -0,0 +1,44 @@
+import io
+
+import pandas as pd
+import pytest
+
+from sales_engine import compute_metrics, compute_metrics_from_csv
+from sales_schema import SalesDataError, read_sales_csv
+
+
+def test_blank_cells_are_missing(messy_csv):
+    data = read_sales_csv(messy_csv)
+    assert data['Customer_ID'].isna().sum() == 2
+    assert data['Order_ID'].isna().sum() == 1
+    assert data['Product_ID'].isna().sum() == 1
+    assert '' not in data['Region'].cat.categories
+
+
+def test_whole_file_and_chunked_reads_agree(messy_csv):
+    whole = read_sales_csv(messy_csv)
+    chunked = pd.concat(read_sales_csv(messy_csv, chunksize=50), ignore_index=True)
+    for column in whole.columns:
+        assert whole[column].astype(object).equals(chunked[column].astype(object)), column
+
+
+def test_whole_file_and_streamed_metrics_agree(messy_csv):
+    whole = compute_metrics(read_sales_csv(messy_csv))
+    streamed = compute_metrics_from_csv(messy_csv, chunksize=50)
+    for attribute in ['num_customers', 'num_orders', 'num_products', 'sales_per_customer',
+                      'discount_percentage', 'avg_rating', 'return_rate']:
+        assert getattr(whole, attribute) == pytest.approx(getattr(streamed, attribute)), attribute
+    assert whole.sales_by_region.to_dict() == pytest.approx(streamed.sales_by_region.to_dict())
+
+
+def test_integer_columns_accept_whole_floats_only(sample_csv):
+    text = sample_csv.read_text()
+    header, first, rest = text.split('\n', 2)
+    rating = header.split(',').index('Customer_Rating')
+    fields = first.split(',')
+    fields[rating] = '4.0'
+    data = read_sales_csv(io.BytesIO('\n'.join([header, ','.join(fields), rest]).encode()))
+    assert data['Customer_Rating'].iloc[0] == 4
+    fields[rating] = '4.5'
+    with pytest.raises(SalesDataError):
+        read_sales_csv(io.BytesIO('\n'.join([header, ','.join(fields), rest]).encode()))
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_sketches import HeavyHitters, HyperLogLog, KLLSketch, SketchSettings
+
+
+def test_settings_for_an_error_meet_it():
+    for target in (0.05, 0.02, 0.01):
+        settings = SketchSettings.for_error(target)
+        assert settings.distinct_error <= target
+        assert settings.quantile_error <= target
+
+
+def test_distinct_error_is_a_99_percent_bound():
+    settings = SketchSettings(precision=10)
+    outside = 0
+    for start in range(0, 300 * 5_000, 5_000):
+        values = pd.Series(np.arange(start, start + 5_000)).astype(str)
+        estimate = HyperLogLog(settings.precision).update(values).count()
+        outside += abs(estimate / 5_000 - 1) > settings.distinct_error
+    # About 3 of 300 counts are expected outside the bound (a one-sigma error would leave about 100 out)
+    assert outside <= 10
+
+
+def test_hyperloglog_merge_equals_a_single_pass():
+    values = pd.Series(np.arange(100_000)).astype(str)
+    whole = HyperLogLog(12).update(values)
+    merged = HyperLogLog(12).update(values[:30_000]).merge(HyperLogLog(12).update(values[30_000:]))
+    assert np.array_equal(whole.registers, merged.registers)
+    assert whole.count() == pytest.approx(100_000, rel=4 * 1.04 / np.sqrt(2 ** 12))
+
+
+def test_hyperloglog_counts_small_sets_and_ignores_missing():
+    values = pd.Series(['a', 'b', 'c', None, 'a', np.nan])
+    assert HyperLogLog(14).update(values).count() == 3
+    assert HyperLogLog(14).update(values[:0]).count() == 0
+
+
+def test_kll_quantiles_are_within_rank_error():
+    values = np.random.default_rng(1).exponential(size=200_000)
+    sketch = KLLSketch(200)
+    for chunk in np.array_split(values, 13):
+        sketch.update(chunk)
+    other = KLLSketch(200, seed=1).update(values[:50_000])
+    sketch.merge(other)
+    everything = np.concatenate([values, values[:50_000]])
+    error = 2.296 / 200 ** 0.9723
+    for q in (0.05, 0.5, 0.95):
+        rank = (everything <= sketch.quantile(q)).mean()
+        assert rank == pytest.approx(q, abs=2 * error)
+    assert sketch.n == len(everything)
+    assert np.isnan(KLLSketch().quantile(0.5))
+
+
+def test_heavy_hitters_keep_the_most_frequent_value():
+    rng = np.random.default_rng(2)
+    values = np.concatenate([rng.integers(0, 50_000, 100_000), np.full(2_000, -1)])
+    rng.shuffle(values)
+    left = HeavyHitters(100).update(values[:60_000])
+    right = HeavyHitters(100).update(values[60_000:])
+    counts = left.merge(right).counts
+    assert len(counts) <= 100
+    assert counts.idxmax() == -1
+    # Counts are lower bounds, short by at most n / (capacity + 1)
+    assert 2_000 - len(values) / 101 <= counts.max() <= 2_000
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from sales_engine import compute_metrics, compute_metrics_from_chunks, compute_metrics_from_csv
+from sales_schema import read_sales_csv
+import sales_store
+from sales_store import DatasetStore
+
+COMPARED = ['row_count', 'total_sales', 'num_customers', 'num_orders', 'num_products', 'sales_per_customer',
+            'discount_percentage', 'avg_rating', 'return_rate', 'loyalty_percentage']
+
+
+def assert_same_metrics(left, right):
+    for attribute in COMPARED:
+        assert getattr(left, attribute) == pytest.approx(getattr(right, attribute)), attribute
+    assert left.sales_by_region.to_dict() == pytest.approx(right.sales_by_region.to_dict())
+
+
+def test_ingest_then_load_matches_the_csv(tmp_path, messy_csv):
+    store = DatasetStore(tmp_path / 'datasets')
+    key = store.ingest(messy_csv)
+    expected = compute_metrics_from_csv(messy_csv, chunksize=50)
+    assert_same_metrics(compute_metrics(store.load(key)), expected)
+    assert_same_metrics(compute_metrics_from_chunks(store.iter_chunks(key, 50)), expected)
+
+
+def test_loaded_rows_equal_a_direct_read(tmp_path, messy_csv):
+    store = DatasetStore(tmp_path / 'datasets')
+    loaded = store.load(store.ingest(messy_csv))
+    direct = read_sales_csv(messy_csv)
+    assert list(loaded.columns) == list(direct.columns)
+    for column in direct.columns:
+        assert loaded[column].astype(object).equals(direct[column].astype(object)), column
+
+
+def test_same_content_is_stored_once(tmp_path, sample_csv):
+    store = DatasetStore(tmp_path / 'datasets')
+    key = store.ingest(sample_csv)
+    assert store.ingest(sample_csv.read_bytes(), 'upload.csv') == key
+    assert len(store.list()) == 1
+    assert store.row_count(key) == len(pd.read_csv(sample_csv))
+
+
+def test_an_interrupted_ingest_leaves_no_half_stored_dataset(tmp_path, sample_csv, monkeypatch):
+    store = DatasetStore(tmp_path / 'datasets')
+    replace = sales_store.os.replace
+
+    # The info file is moved into place, then the process dies before the Parquet file is
+    def crash_on_parquet(source, target):
+        if str(target).endswith('.parquet'):
+            raise OSError("killed")
+        replace(source, target)
+    with monkeypatch.context() as patch:
+        patch.setattr(sales_store.os, 'replace', crash_on_parquet)
+        with pytest.raises(OSError):
+            store.ingest(sample_csv)
+    key = sales_store.file_hash(sample_csv)
+    assert key not in store and store.list() == []
+
+    # A Parquet file left without its info (as earlier versions could) counts as absent too
+    assert store.ingest(sample_csv) == key
+    store._info_path(key).unlink()
+    assert key not in store
+    assert store.ingest(sample_csv) == key
+    assert [dataset.key for dataset in store.list()] == [key]
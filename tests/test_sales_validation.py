@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_schema import SalesDataError, read_sales_csv
+from sales_validation import DataValidator, VALIDATION_RULES, checked_chunks, drop_rows, text_hashes, validate_rows
+
+# Offending rows of the corrupted sample per rule
+EXPECTED_COUNTS = {
+    'INVALID DATE': 1,
+    'AMOUNT IS NOT UNIT PRICE x QUANTITY': 1,
+    'IMPLAUSIBLE TAX': 2,
+    'DUPLICATE ORDER LINE': 2,
+    'RATING OUTSIDE 1-5': 3,
+    'DISCOUNT_APPLIED NOT YES/NO': 1,
+    'RETURN_STATUS NOT YES/NO': 1,
+    'CUSTOMER_LOYALTY NOT YES/NO': 0,
+}
+INVALID_ROWS = [3, 4, 5, 8, 9, 10, 11, 12, 246, 247]
+
+
+# The sample (which passes every check) with one or two rows breaking each rule
+@pytest.fixture
+def corrupted_csv(tmp_path, sample_csv):
+    data = pd.read_csv(sample_csv, dtype=str, keep_default_na=False)
+    data.loc[3, 'Day_Month'] = '31/2'
+    data.loc[4, 'Purchase_Amount'] = f"{float(data.loc[4, 'Purchase_Amount']) + 1:.2f}"
+    data.loc[5, 'Tax_Amount'] = '999'
+    data.loc[[8, 9], 'Customer_Rating'] = ['7', '0']
+    data.loc[10, 'Discount_Applied'] = 'Maybe'
+    data.loc[11, 'Return_Status'] = ''
+    # One row breaking two rules
+    data.loc[12, ['Tax_Amount', 'Customer_Rating']] = ['-1', '9']
+    # The first order line twice more, at the end of the file
+    data = pd.concat([data, data.iloc[[0, 0]]], ignore_index=True)
+    path = tmp_path / 'corrupted.csv'
+    data.to_csv(path, index=False)
+    return path
+
+
+def test_sample_is_clean(sample_csv):
+    assert validate_rows(read_sales_csv(sample_csv)).clean
+
+
+def test_rule_counts(corrupted_csv):
+    report = validate_rows(read_sales_csv(corrupted_csv), keep_rows=True)
+    assert report.counts.to_dict() == EXPECTED_COUNTS
+    assert report.rows == 248
+    assert report.invalid == len(INVALID_ROWS)
+    assert report.invalid_rows.tolist() == INVALID_ROWS
+    # ROW is the 1-based data row; the row breaking two rules is listed once with both
+    assert report.sample['ROW'].tolist() == [row + 1 for row in INVALID_ROWS]
+    issues = report.sample.set_index('ROW')['ISSUES']
+    assert issues[13] == 'IMPLAUSIBLE TAX, RATING OUTSIDE 1-5'
+    assert report.table()['RULE'].tolist() == [rule for rule in VALIDATION_RULES if EXPECTED_COUNTS[rule]]
+
+
+@pytest.mark.parametrize('chunksize', [5, 40, 247])
+def test_chunks_give_the_same_report(corrupted_csv, chunksize):
+    whole = validate_rows(read_sales_csv(corrupted_csv), keep_rows=True)
+    validator = DataValidator(keep_rows=True)
+    for chunk in read_sales_csv(corrupted_csv, chunksize=chunksize):
+        validator.check(chunk)
+    report = validator.report()
+    pd.testing.assert_series_equal(report.counts, whole.counts)
+    assert report.invalid_rows.tolist() == whole.invalid_rows.tolist()
+    assert report.sample['ROW'].tolist() == whole.sample['ROW'].tolist()
+
+
+def test_samples_are_bounded(corrupted_csv):
+    report = validate_rows(read_sales_csv(corrupted_csv), sample_rows=1)
+    assert len(report.sample) <= len(VALIDATION_RULES)
+    assert report.invalid == len(INVALID_ROWS)
+
+
+def test_dropping_invalid_rows(corrupted_csv):
+    validator = DataValidator()
+    kept = pd.concat(checked_chunks(read_sales_csv(corrupted_csv, chunksize=40), validator, drop_invalid=True))
+    assert len(kept) == 248 - len(INVALID_ROWS)
+    assert validate_rows(kept.drop(columns='Full_Date').reset_index(drop=True)).clean
+    data = read_sales_csv(corrupted_csv)
+    assert len(drop_rows(data, np.array(INVALID_ROWS))) == len(kept)
+    with pytest.raises(SalesDataError):
+        drop_rows(data, np.arange(len(data)))
+
+
+def test_nothing_valid_is_an_error(sample_csv):
+    data = read_sales_csv(sample_csv)
+    data['Customer_Rating'] = 9
+    with pytest.raises(SalesDataError):
+        list(checked_chunks([data], DataValidator(), drop_invalid=True))
+
+
+def test_text_hashes_match_on_equal_text():
+    values = pd.Series(['a', 'bb', '', None, 'a', 'x' * 300], dtype='string')
+    hashes = text_hashes(values)
+    assert hashes[0] == hashes[4]
+    assert len(set(hashes[[0, 1, 2, 5]].tolist())) == 4
+    assert hashes[3] == 0 and hashes[2] != 0
+    # Categorical columns hash their categories, to the same values
+    assert np.array_equal(text_hashes(values.astype('category')), hashes)
+    short = values[:5]
+    assert np.array_equal(text_hashes(short.astype('category')), text_hashes(short))